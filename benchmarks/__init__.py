@@ -0,0 +1,5 @@
+"""
+Throughput and latency benchmarks of the clients against each locally available store.
+
+Run `python -m benchmarks --help` from the repository root.
+"""
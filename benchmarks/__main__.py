@@ -0,0 +1,137 @@
+import argparse
+import asyncio
+import sys
+from contextlib import AsyncExitStack, ExitStack
+from dataclasses import asdict
+
+from .backends import AsyncFactory, BACKENDS
+from .baseline import compare, format_changes, load, report, save
+from .datasets import Dataset, synthetic_dataset
+from .measure import Benchmark
+from .suite import Options, run_async, run_sync, run_types
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Benchmarks the clients against each available store.",
+    )
+    parser.add_argument(
+        "--backends",
+        default=",".join(BACKENDS),
+        help="Comma-separated stores to benchmark, unavailable ones are skipped",
+    )
+    parser.add_argument("--size", type=int, default=10_000, help="Shots per namespace")
+    parser.add_argument("--dimensions", type=int, default=384, help="Vector dimensions")
+    parser.add_argument(
+        "--payload-size", type=int, default=256, help="Characters in each shot's inputs/outputs"
+    )
+    parser.add_argument("--queries", type=int, default=1000, help="Number of get/list calls")
+    parser.add_argument("--batch-size", type=int, default=100, help="Shots/queries per batch")
+    parser.add_argument("--limit", type=int, default=10, help="Results per query")
+    parser.add_argument("--concurrency", type=int, default=8, help="Async calls in flight")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic dataset")
+    parser.add_argument("--no-async", action="store_true", help="Skip the async client")
+    parser.add_argument("--save", metavar="PATH", help="Save the results as a JSON baseline")
+    parser.add_argument("--compare", metavar="PATH", help="Compare against a JSON baseline")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Relative change of a metric that counts as a regression",
+    )
+    return parser.parse_args(argv)
+
+
+def run(args: argparse.Namespace, dataset: Dataset, options: Options) -> dict[str, dict]:
+    results: dict[str, dict] = {}
+
+    def record(prefix: str, benchmarks: list[Benchmark]):
+        for benchmark in benchmarks:
+            key = f"{prefix}/{benchmark.name}"
+            results[key] = summary = benchmark.summary()
+            print(
+                f"{key:<28} {summary['throughput']:>12.1f}/s  "
+                f"p50 {summary['p50_ms']:.3f}ms  p95 {summary['p95_ms']:.3f}ms  "
+                f"p99 {summary['p99_ms']:.3f}ms",
+                file=sys.stderr,
+            )
+
+    record("types", run_types(dataset, options))
+
+    for name in args.backends.split(","):
+        sync_factory, async_factory = BACKENDS[name]
+        with ExitStack() as stack:
+            try:
+                store = stack.enter_context(sync_factory(dataset.dimensions))
+            except Exception as e:
+                print(f"Skipping {name}: {e!r}", file=sys.stderr)
+                continue
+            record(f"{name}/sync", run_sync(store, dataset, options))
+
+        if async_factory is not None and not args.no_async:
+            benchmarks = asyncio.run(run_async_backend(name, async_factory, dataset, options))
+            if benchmarks is not None:
+                record(f"{name}/async", benchmarks)
+
+    return results
+
+
+async def run_async_backend(
+    name: str,
+    factory: AsyncFactory,
+    dataset: Dataset,
+    options: Options,
+) -> list[Benchmark] | None:
+    async with AsyncExitStack() as stack:
+        try:
+            store = await stack.enter_async_context(factory(dataset.dimensions))
+        except Exception as e:
+            print(f"Skipping async {name}: {e!r}", file=sys.stderr)
+            return None
+        return await run_async(store, dataset, options)
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+    if unknown := set(args.backends.split(",")) - set(BACKENDS):
+        raise SystemExit(f"Unknown backends: {', '.join(sorted(unknown))}")
+
+    options = Options(args.batch_size, args.limit, args.concurrency)
+    config = {
+        "size": args.size,
+        "dimensions": args.dimensions,
+        "payload_size": args.payload_size,
+        "queries": args.queries,
+        "seed": args.seed,
+        **asdict(options),
+    }
+    # Loaded first, so a missing or mismatched baseline fails before the run
+    baseline = load(args.compare) if args.compare else None
+    if baseline is not None and baseline["config"] != config:
+        raise SystemExit(
+            f"The baseline was run with {baseline['config']}, not {config}, "
+            "so its results are not comparable"
+        )
+
+    dataset = synthetic_dataset(
+        args.size, args.dimensions, args.payload_size, args.queries, args.seed
+    )
+    current = report(config, run(args, dataset, options))
+
+    if args.save:
+        save(args.save, current)
+    if baseline is None:
+        return 0
+
+    changes = compare(baseline, current, args.tolerance)
+    print(format_changes(changes))
+    regressions = [change for change in changes if change.regressed]
+    if regressions:
+        print(f"{len(regressions)} regressions beyond {args.tolerance:.0%}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
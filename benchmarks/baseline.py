@@ -0,0 +1,78 @@
+import json
+import platform
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+
+# Metrics checked for regressions, and whether higher values are better. p99 is reported but
+# too noisy on shared machines to fail a comparison.
+CHECKED_METRICS = {"throughput": True, "p50_ms": False, "p95_ms": False}
+
+
+def report(config: dict, results: dict[str, dict]) -> dict:
+    """
+    A run's results, with the dataset and options they were measured with and the machine,
+    as only runs of the same config on the same machine are comparable.
+    """
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "config": config,
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "processor": platform.processor() or platform.machine(),
+        },
+        "results": results,
+    }
+
+
+def save(path: str | Path, run: dict):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(run, indent=2, sort_keys=True) + "\n")
+
+
+def load(path: str | Path) -> dict:
+    return json.loads(Path(path).read_text())
+
+
+@dataclass(frozen=True)
+class Change:
+    benchmark: str
+    metric: str
+    baseline: float
+    current: float
+    regressed: bool
+
+    @property
+    def ratio(self) -> float:
+        return self.current / self.baseline if self.baseline else float("inf")
+
+
+def compare(baseline: dict, run: dict, tolerance: float) -> list[Change]:
+    """
+    Changes of the checked metrics of the benchmarks in both runs, which must have the same
+    config. A metric regressed if it got worse by more than `tolerance`, e.g. 0.2 for 20%.
+    """
+    changes = []
+    for name, current in run["results"].items():
+        if (previous := baseline["results"].get(name)) is None:
+            continue
+        for metric, higher_is_better in CHECKED_METRICS.items():
+            before, after = previous[metric], current[metric]
+            if higher_is_better:
+                regressed = after < before * (1 - tolerance)
+            else:
+                regressed = after > before * (1 + tolerance)
+            changes.append(Change(name, metric, before, after, regressed))
+    return changes
+
+
+def format_changes(changes: list[Change]) -> str:
+    width = max((len(change.benchmark) for change in changes), default=0)
+    return "\n".join(
+        f"{change.benchmark:<{width}}  {change.metric:<10}  {change.baseline:>12.3f}  "
+        f"{change.current:>12.3f}  {change.ratio - 1:>+8.1%}"
+        f"{'  REGRESSED' if change.regressed else ''}"
+        for change in changes
+    )
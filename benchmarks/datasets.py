@@ -0,0 +1,92 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+from few_shots.types import Datum, dump_io_value
+
+
+@dataclass
+class Dataset:
+    """
+    Synthetic shots with random unit vectors, and queries whose vectors are noisy copies of
+    stored ones, so every query has close neighbours.
+
+    Args:
+        data: (inputs, outputs) tuples to add
+        queries: Inputs to search for
+        vectors: Embedding of each text the clients will embed, by `dump_io_value` of the inputs
+    """
+
+    data: list[Datum]
+    queries: list[dict]
+    vectors: dict[str, np.ndarray]
+
+    @property
+    def dimensions(self) -> int:
+        return len(next(iter(self.vectors.values())))
+
+
+def synthetic_dataset(
+    size: int,
+    dimensions: int,
+    payload_size: int,
+    queries: int,
+    seed: int = 0,
+) -> Dataset:
+    """
+    Args:
+        size: Number of shots
+        dimensions: Dimensions of the vectors
+        payload_size: Characters of random text in each shot's inputs and outputs
+        queries: Number of queries
+        seed: Seed of the random generator, equal seeds give equal datasets
+    """
+    rng = np.random.default_rng(seed)
+    data = [
+        ({"id": i, "question": question}, {"answer": answer})
+        for i, (question, answer) in enumerate(
+            zip(random_texts(rng, size, payload_size), random_texts(rng, size, payload_size))
+        )
+    ]
+    stored = unit_vectors(rng.standard_normal((size, dimensions), dtype=np.float32))
+
+    nearest = rng.integers(0, size, queries)
+    noise = rng.standard_normal((queries, dimensions), dtype=np.float32) * 0.1
+    query_vectors = unit_vectors(stored[nearest] + noise)
+    query_inputs = [{"query": i, "question": data[n][0]["question"]} for i, n in enumerate(nearest)]
+
+    vectors = {dump_io_value(inputs): vector for (inputs, _), vector in zip(data, stored)}
+    vectors.update(
+        (dump_io_value(inputs), vector) for inputs, vector in zip(query_inputs, query_vectors)
+    )
+    return Dataset(data, query_inputs, vectors)
+
+
+def random_texts(rng: np.random.Generator, count: int, length: int) -> list[str]:
+    letters = rng.integers(ord("a"), ord("z") + 1, (count, length), dtype=np.uint8)
+    letters[rng.random((count, length)) < 0.15] = ord(" ")
+    return [row.tobytes().decode() for row in letters]
+
+
+def unit_vectors(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+class LookupEmbed:
+    """
+    Embeds the dataset's texts by looking their vectors up, so the benchmarks measure the
+    clients and stores rather than an embedding model.
+    """
+
+    model_id = "lookup"
+
+    def __init__(self, dataset: Dataset):
+        self.vectors = dataset.vectors
+
+    def __call__(self, inputs: list[str]) -> np.ndarray:
+        return np.array([self.vectors[text] for text in inputs], dtype=np.float32)
+
+
+class AsyncLookupEmbed(LookupEmbed):
+    async def __call__(self, inputs: list[str]) -> np.ndarray:
+        return super().__call__(inputs)
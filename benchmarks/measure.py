@@ -0,0 +1,58 @@
+from contextlib import asynccontextmanager, contextmanager
+from time import perf_counter
+from typing import AsyncIterator, Iterator
+
+import numpy as np
+
+
+class Benchmark:
+    """
+    Latencies of the calls of one operation, and the wall time and number of items (shots
+    or queries) they processed, from which the throughput is derived.
+    """
+
+    name: str
+    latencies: list[float]
+    items: int
+    seconds: float
+
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies = []
+        self.items = 0
+        self.seconds = 0.0
+
+    @contextmanager
+    def running(self) -> Iterator["Benchmark"]:
+        """Times the whole run, whose calls may overlap."""
+        start = perf_counter()
+        try:
+            yield self
+        finally:
+            self.seconds += perf_counter() - start
+
+    @contextmanager
+    def call(self, items: int = 1) -> Iterator[None]:
+        start = perf_counter()
+        yield
+        self.latencies.append(perf_counter() - start)
+        self.items += items
+
+    @asynccontextmanager
+    async def acall(self, items: int = 1) -> AsyncIterator[None]:
+        start = perf_counter()
+        yield
+        self.latencies.append(perf_counter() - start)
+        self.items += items
+
+    def summary(self) -> dict:
+        """Items per second and latency percentiles in milliseconds."""
+        p50, p95, p99 = np.percentile(self.latencies, [50, 95, 99]) * 1000
+        return {
+            "calls": len(self.latencies),
+            "items": self.items,
+            "throughput": self.items / self.seconds if self.seconds else 0.0,
+            "p50_ms": float(p50),
+            "p95_ms": float(p95),
+            "p99_ms": float(p99),
+        }
@@ -0,0 +1,165 @@
+from asyncio import Semaphore, gather
+from dataclasses import dataclass
+from functools import partial
+from typing import Awaitable, Callable
+
+from few_shots.async_client import AsyncFewShots
+from few_shots.client import FewShots
+from few_shots.store.base import AsyncStore, Store
+from few_shots.types import (
+    content_hash,
+    dump_io_value,
+    encode_io_value,
+    LazyShot,
+    parse_io_value,
+    Shot,
+)
+from few_shots.utils.iter import batched
+
+from .datasets import AsyncLookupEmbed, Dataset, LookupEmbed
+from .measure import Benchmark
+
+NAMESPACE = "benchmark"
+
+
+@dataclass(frozen=True)
+class Options:
+    """
+    Args:
+        batch_size: Shots per `add` and queries per `list_many` call
+        limit: Results per query
+        concurrency: Calls in flight at once in the async benchmarks
+    """
+
+    batch_size: int = 100
+    limit: int = 10
+    concurrency: int = 8
+
+
+def run_sync(store: Store, dataset: Dataset, options: Options) -> list[Benchmark]:
+    """
+    Adds the dataset to an empty store through `FewShots`, adds it again with
+    `skip_unchanged`, then gets shots by inputs and searches with the queries, one and
+    `batch_size` at a time.
+    """
+    client = FewShots(embed=LookupEmbed(dataset), store=store)
+    results = []
+
+    for name, skip_unchanged in (("add", False), ("add_unchanged", True)):
+        benchmark = Benchmark(name)
+        with benchmark.running():
+            for batch in batched(dataset.data, options.batch_size):
+                with benchmark.call(len(batch)):
+                    client.add(batch, namespace=NAMESPACE, skip_unchanged=skip_unchanged)
+        results.append(benchmark)
+
+    get = Benchmark("get")
+    with get.running():
+        for inputs in lookups(dataset):
+            with get.call():
+                client.get(inputs, namespace=NAMESPACE)
+    results.append(get)
+
+    search = Benchmark("list")
+    with search.running():
+        for query in dataset.queries:
+            with search.call():
+                client.list(query, namespace=NAMESPACE, limit=options.limit)
+    results.append(search)
+
+    search_many = Benchmark("list_many")
+    with search_many.running():
+        for batch in batched(dataset.queries, options.batch_size):
+            with search_many.call(len(batch)):
+                client.list_many(batch, namespace=NAMESPACE, limit=options.limit)
+    results.append(search_many)
+
+    return results
+
+
+async def run_async(store: AsyncStore, dataset: Dataset, options: Options) -> list[Benchmark]:
+    """
+    Like `run_sync` through `AsyncFewShots`, but with `concurrency` reads in flight at once.
+    Writes are sent one batch at a time, as not every store takes concurrent writes.
+    """
+    client = AsyncFewShots(embed=AsyncLookupEmbed(dataset), store=store)
+    results = []
+
+    for name, skip_unchanged in (("add", False), ("add_unchanged", True)):
+        benchmark = Benchmark(name)
+        with benchmark.running():
+            for batch in batched(dataset.data, options.batch_size):
+                async with benchmark.acall(len(batch)):
+                    await client.add(batch, namespace=NAMESPACE, skip_unchanged=skip_unchanged)
+        results.append(benchmark)
+
+    get = partial(client.get, namespace=NAMESPACE)
+    search = partial(client.list, namespace=NAMESPACE, limit=options.limit)
+    search_many = partial(client.list_many, namespace=NAMESPACE, limit=options.limit)
+    for name, calls in (
+        ("get", [(partial(get, inputs), 1) for inputs in lookups(dataset)]),
+        ("list", [(partial(search, query), 1) for query in dataset.queries]),
+        (
+            "list_many",
+            [
+                (partial(search_many, batch), len(batch))
+                for batch in batched(dataset.queries, options.batch_size)
+            ],
+        ),
+    ):
+        benchmark = Benchmark(name)
+        await concurrently(benchmark, calls, options.concurrency)
+        results.append(benchmark)
+
+    return results
+
+
+def run_types(dataset: Dataset, options: Options) -> list[Benchmark]:
+    """
+    Serialization and hashing done for every shot written or read, timed per `batch_size`
+    values as single calls take too little time to measure.
+    """
+    inputs = [inputs for inputs, _ in dataset.data]
+    encoded = [(encode_io_value(i), encode_io_value(o)) for i, o in dataset.data]
+    shots = [Shot(i, o) for i, o in dataset.data]
+    ids = [shot.id for shot in shots]
+    operations: dict[str, Callable[[int], object]] = {
+        "dump_io_value": lambda n: dump_io_value(inputs[n]),
+        "parse_io_value": lambda n: parse_io_value(encoded[n][0]),
+        "shot": lambda n: Shot(*dataset.data[n]),
+        "lazy_shot": lambda n: LazyShot(encoded[n][0], encoded[n][1], ids[n]).outputs,
+        "content_hash": lambda n: content_hash(shots[n], "model"),
+    }
+
+    results = []
+    for name, operation in operations.items():
+        benchmark = Benchmark(name)
+        with benchmark.running():
+            for batch in batched(range(len(inputs)), options.batch_size):
+                with benchmark.call(len(batch)):
+                    for n in batch:
+                        operation(n)
+        results.append(benchmark)
+    return results
+
+
+def lookups(dataset: Dataset) -> list[dict]:
+    """Inputs of stored shots spread over the dataset, one per query."""
+    size, count = len(dataset.data), len(dataset.queries)
+    return [dataset.data[i * size // count][0] for i in range(count)]
+
+
+async def concurrently(
+    benchmark: Benchmark,
+    calls: list[tuple[Callable[[], Awaitable], int]],
+    concurrency: int,
+):
+    """Awaits each call with its number of items, at most `concurrency` at a time."""
+    semaphore = Semaphore(concurrency)
+
+    async def run(call: Callable[[], Awaitable], items: int):
+        async with semaphore, benchmark.acall(items):
+            await call()
+
+    with benchmark.running():
+        await gather(*(run(call, items) for call, items in calls))
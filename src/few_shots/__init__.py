@@ -1,6 +1,6 @@
 from .async_client import AsyncFewShots
 from .client import FewShots
-from .types import Shot, Vector, ScoredShot, IO, Datum
+from .types import AddProgress, LazyShot, Shot, Vector, ScoredShot, SearchParams, IO, Datum
 from .utils.format import shots_to_messages
 
 __all__ = [
@@ -10,6 +10,9 @@ __all__ = [
     "Vector",
     "IO",
     "Shot",
+    "LazyShot",
     "shots_to_messages",
     "ScoredShot",
+    "AddProgress",
+    "SearchParams",
 ]
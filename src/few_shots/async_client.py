@@ -1,18 +1,30 @@
+from __future__ import annotations
+
+from asyncio import Semaphore, Task, create_task
+from collections import deque
 from dataclasses import dataclass
-from typing import overload
+from typing import AsyncIterable, AsyncIterator, Iterable, overload
 
 from few_shots.types import (
+    AddProgress,
+    content_hash,
     Datum,
     dump_io_value,
     IO,
     id_io_value,
     is_io_value,
     ScoredShot,
+    SearchParams,
     Shot,
+    Vector,
 )
 
+from .embed.cache import resolve_model_id
 from .embed.base import AsyncEmbed
 from .store.base import AsyncStore
+from .utils.cache import ResultCache
+from .utils.concurrency import amap_concurrently
+from .utils.iter import abatched, chunked
 
 
 @dataclass
@@ -23,10 +35,19 @@ class AsyncFewShots:
     Combines an embedding model with a vector store to enable semantic search over examples.
 
     `add` is used to store examples, `remove` to delete them, `clear` to remove all examples in a namespace, and `list` to find similar examples to an input.
+
+    Calls larger than the store's `capabilities` allow are split into chunks, of which up to
+    `max_concurrency` are sent at once. Writes are only sent concurrently to stores that
+    declare `concurrent_writes`.
+
+    With a `cache`, repeated `list` and `list_many` queries are answered from it until the
+    namespace is written to through this client.
     """
 
     embed: AsyncEmbed
     store: AsyncStore
+    max_concurrency: int = 4
+    cache: ResultCache | None = None
 
     @overload
     async def add(
@@ -36,6 +57,7 @@ class AsyncFewShots:
         *,
         id: str = "",
         namespace: str = "default",
+        skip_unchanged: bool = False,
     ) -> str:
         """Add an example to the store.
 
@@ -44,6 +66,7 @@ class AsyncFewShots:
             outputs: Output to store
             id: ID for the example
             namespace: Namespace to store the example in
+            skip_unchanged: Don't embed or write the example if it is stored unchanged
         """
 
     @overload
@@ -52,12 +75,15 @@ class AsyncFewShots:
         data: list[Datum],
         *,
         namespace: str = "default",
+        skip_unchanged: bool = False,
     ) -> list[str]:
         """Add multiple examples to the store.
 
         Args:
             data: List of (input, output) or (input, output, id) tuples
             namespace: Namespace to store the examples in
+            skip_unchanged: Only embed and write the examples that are not stored with the
+                same inputs, outputs and embedding model
         """
 
     async def add(
@@ -67,16 +93,81 @@ class AsyncFewShots:
         *,
         id: str = "",
         namespace: str = "default",
+        skip_unchanged: bool = False,
     ) -> str | list[str]:
         is_io_args = is_io_value(maybe_inputs) and is_io_value(maybe_outputs)
         data: list[Datum] = [(maybe_inputs, maybe_outputs, id)] if is_io_args else maybe_inputs
         shots = [Shot(*datum) for datum in data]
-        vectors = await self.embed([shot.key for shot in shots])
-        await self.store.add(shots, vectors, namespace)
+        await self._embed_and_add(shots, namespace, skip_unchanged)
 
         ids = [shot.id for shot in shots]
         return ids[0] if is_io_args else ids
 
+    async def add_stream(
+        self,
+        data: Iterable[Datum] | AsyncIterable[Datum],
+        *,
+        namespace: str = "default",
+        batch_size: int = 100,
+        max_in_flight: int = 1,
+        skip_unchanged: bool = False,
+    ) -> AsyncIterator[AddProgress]:
+        """Add examples from a (possibly unbounded) iterable, one batch at a time.
+
+        The next batch is embedded while previous ones are written to the store, and at most
+        `max_in_flight` batches are written at once, so memory use does not grow with `data`.
+        Unless the store declares `concurrent_writes`, batches are written one at a time, and
+        `skip_unchanged` lookups wait for the previous write.
+
+        Args:
+            data: Iterable or async iterable of (input, output) or (input, output, id) tuples,
+                consumed lazily
+            namespace: Namespace to store the examples in
+            batch_size: Number of examples embedded and written together
+            max_in_flight: Maximum number of batches being written while the next one is embedded
+            skip_unchanged: Only embed and write the examples that are not stored unchanged
+
+        Yields:
+            The ids of each written batch and the number of examples added so far
+        """
+        added = 0
+        writes: deque[tuple[list[str], Task]] = deque()
+        max_in_flight = min(max_in_flight, self._write_concurrency)
+        exclusive = skip_unchanged and not self.store.capabilities.concurrent_writes
+        # Waiters acquire in order, so batches are written in order too
+        semaphore = Semaphore(max_in_flight)
+
+        async def write(*args):
+            async with semaphore:
+                await self._add(*args)
+
+        async def finish(pending: int) -> AsyncIterator[AddProgress]:
+            nonlocal added
+            while len(writes) > pending:
+                ids, task = writes.popleft()
+                await task
+                added += len(ids)
+                yield AddProgress(ids, added)
+
+        try:
+            async for batch in abatched(data, batch_size):
+                shots = [Shot(*datum) for datum in batch]
+                if exclusive:
+                    async for progress in finish(0):
+                        yield progress
+                changed, hashes = await self._changed(shots, namespace, skip_unchanged)
+                vectors = await self.embed([shot.key for shot in changed]) if changed else []
+                task = create_task(write(changed, vectors, namespace, hashes))
+                writes.append(([shot.id for shot in shots], task))
+                async for progress in finish(max_in_flight):
+                    yield progress
+
+            async for progress in finish(0):
+                yield progress
+        finally:
+            for _, task in writes:
+                task.cancel()
+
     @overload
     async def get(self, inputs: IO, *, namespace: str = "default") -> Shot | None:
         """Get a single shot from the store, useful for retrieving known good outputs.
@@ -112,7 +203,12 @@ class AsyncFewShots:
             inputs = [inputs]
 
         ids = [id_io_value(i) for i in inputs]
-        shots = await self.store.get(ids, namespace)
+        chunks = await amap_concurrently(
+            lambda chunk: self.store.get(chunk, namespace),
+            chunked(ids, self.store.capabilities.max_ids),
+            self.max_concurrency,
+        )
+        shots = [shot for chunk in chunks for shot in chunk]
 
         if is_single:
             return shots[0] if shots else None
@@ -170,7 +266,12 @@ class AsyncFewShots:
         is_io_args = is_io_value(maybe_inputs) and is_io_value(maybe_outputs)
         data: list[Datum] = [(maybe_inputs, maybe_outputs, id)] if is_io_args else maybe_inputs
         ids = data if isinstance(data[0], str) else [Shot(*datum).id for datum in data]
-        await self.store.remove(ids, namespace)
+        await amap_concurrently(
+            lambda chunk: self.store.remove(chunk, namespace),
+            chunked(ids, self.store.capabilities.max_ids),
+            self._write_concurrency,
+        )
+        self._invalidate(namespace)
 
     async def clear(self, namespace: str = "default"):
         """Remove all examples from a namespace.
@@ -179,6 +280,7 @@ class AsyncFewShots:
             namespace: Namespace to clear
         """
         await self.store.clear(namespace)
+        self._invalidate(namespace)
 
     async def list(
         self,
@@ -186,6 +288,7 @@ class AsyncFewShots:
         *,
         namespace: str = "default",
         limit: int = 5,
+        search_params: SearchParams | None = None,
     ) -> list[ScoredShot]:
         """Find similar examples to an input.
 
@@ -193,9 +296,151 @@ class AsyncFewShots:
             inputs: Input to find similar examples for
             namespace: Namespace to search in
             limit: Maximum number of examples to return
+            search_params: Recall/latency settings for this query, the store's defaults if None
 
         Returns:
             List of (example, score) tuples, sorted by distance ascending
         """
-        [vector] = await self.embed([dump_io_value(inputs)])
-        return await self.store.list(vector, namespace, limit)
+        text = dump_io_value(inputs)
+        if self.cache is None:
+            [vector] = await self.embed([text])
+            return await self.store.list(vector, namespace, limit, search_params)
+
+        key = self.cache.key(namespace, text, limit, search_params)
+        if (results := self.cache.get(key)) is None:
+            [vector] = await self.embed([text])
+            results = await self.store.list(vector, namespace, limit, search_params)
+            self.cache.set(key, results)
+        return results
+
+    async def list_many(
+        self,
+        inputs: list[IO],
+        *,
+        namespace: str = "default",
+        limit: int = 5,
+        search_params: SearchParams | None = None,
+    ) -> list[list[ScoredShot]]:
+        """Find similar examples to each of several inputs.
+
+        Embeds all inputs in one call and queries the store once.
+
+        Args:
+            inputs: Inputs to find similar examples for
+            namespace: Namespace to search in
+            limit: Maximum number of examples to return per input
+            search_params: Recall/latency settings for this query, the store's defaults if None
+
+        Returns:
+            One list of (example, score) tuples per input, in the same order as `inputs`
+        """
+        texts = [dump_io_value(i) for i in inputs]
+        if self.cache is None:
+            return await self._list_many(texts, namespace, limit, search_params)
+
+        keys = [self.cache.key(namespace, text, limit, search_params) for text in texts]
+        results = [self.cache.get(key) for key in keys]
+        if misses := [i for i, cached in enumerate(results) if cached is None]:
+            found = await self._list_many(
+                [texts[i] for i in misses], namespace, limit, search_params
+            )
+            for i, scored_shots in zip(misses, found):
+                self.cache.set(keys[i], scored_shots)
+                results[i] = scored_shots
+        return results
+
+    async def _list_many(
+        self,
+        texts: list[str],
+        namespace: str,
+        limit: int,
+        search_params: SearchParams | None,
+    ) -> list[list[ScoredShot]]:
+        if not texts:
+            return []
+        vectors = await self.embed(texts)
+
+        capabilities = self.store.capabilities
+        if not capabilities.batch_queries:
+            return await amap_concurrently(
+                lambda vector: self.store.list(vector, namespace, limit, search_params),
+                vectors,
+                self.max_concurrency,
+            )
+
+        chunks = await amap_concurrently(
+            lambda chunk: self.store.list_many(chunk, namespace, limit, search_params),
+            chunked(vectors, capabilities.max_batch_size),
+            self.max_concurrency,
+        )
+        return [results for chunk in chunks for results in chunk]
+
+    async def _embed_and_add(self, shots: list[Shot], namespace: str, skip_unchanged: bool):
+        shots, hashes = await self._changed(shots, namespace, skip_unchanged)
+        if shots:
+            vectors = await self.embed([shot.key for shot in shots])
+            await self._add(shots, vectors, namespace, hashes)
+
+    async def _changed(
+        self,
+        shots: list[Shot],
+        namespace: str,
+        skip_unchanged: bool,
+    ) -> tuple[list[Shot], list[str] | None]:
+        """
+        The shots to embed and write, all of them unless `skip_unchanged`, with their content
+        hashes if the store keeps them.
+        """
+        capabilities = self.store.capabilities
+        if not capabilities.content_hashes:
+            if skip_unchanged:
+                raise ValueError(f"{type(self.store).__name__} doesn't store content hashes")
+            return shots, None
+        if not skip_unchanged and not getattr(self.embed, "model_id", None):
+            # Hashes without the model's id could match another model's, so none are written
+            return shots, None
+
+        model_id = resolve_model_id(self.embed)
+        hashes = [content_hash(shot, model_id) for shot in shots]
+        if not skip_unchanged or not shots:
+            return shots, hashes
+
+        chunks = await amap_concurrently(
+            lambda chunk: self.store.hashes(chunk, namespace),
+            chunked([shot.id for shot in shots], capabilities.max_ids),
+            self.max_concurrency,
+        )
+        stored = {id: hash for chunk in chunks for id, hash in chunk.items()}
+        changed = [i for i, shot in enumerate(shots) if stored.get(shot.id) != hashes[i]]
+        return [shots[i] for i in changed], [hashes[i] for i in changed]
+
+    async def _add(
+        self,
+        shots: list[Shot],
+        vectors: list[Vector],
+        namespace: str,
+        hashes: list[str] | None = None,
+    ):
+        if not shots:
+            return
+
+        size = self.store.capabilities.max_batch_size
+        chunks = [chunked(shots, size), chunked(vectors, size)]
+        if hashes is not None:
+            chunks.append(chunked(hashes, size))
+        await amap_concurrently(
+            lambda chunk: self.store.add(chunk[0], chunk[1], namespace, *chunk[2:]),
+            list(zip(*chunks)),
+            self._write_concurrency,
+        )
+        self._invalidate(namespace)
+
+    @property
+    def _write_concurrency(self) -> int:
+        # Stores wrapped with `asyncify_class` write from worker threads, and stores aren't
+        # thread-safe unless they say so
+        return self.max_concurrency if self.store.capabilities.concurrent_writes else 1
+
+    def _invalidate(self, namespace: str):
+        if self.cache is not None:
+            self.cache.invalidate(namespace)
@@ -4,8 +4,13 @@ from few_shots.types import Vector
 
 
 class Embed:
+    # Identifies the embedding model, e.g. in cache keys and content hashes. There's no default,
+    # as two models sharing an id would be served each other's vectors.
+    model_id: str | None = None
+
     @abstractmethod
-    def __call__(self, inputs: list[str]) -> list[Vector]: ...
+    def __call__(self, inputs: list[str]) -> list[Vector]:
+        """Embeds `inputs`, as a list of vectors or a 2-D float32 array with one row per input."""
 
 
 class AsyncEmbed(Embed):
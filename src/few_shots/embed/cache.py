@@ -0,0 +1,200 @@
+import sqlite3
+from hashlib import sha256
+from threading import Lock
+from typing import Callable
+
+import numpy as np
+
+from few_shots.types import Vector
+from few_shots.utils.cache import CacheStats, LRUCache
+
+from .base import AsyncEmbed, Embed
+
+__all__ = ["CachedEmbed", "AsyncCachedEmbed", "EmbeddingCache"]
+
+
+class EmbeddingCache:
+    """
+    Vectors keyed by a hash of the model id and input, kept in a bounded in-memory LRU
+    and optionally written through to a SQLite file so they survive restarts.
+    """
+
+    model_id: str
+    memory: LRUCache[str, Vector]
+
+    def __init__(self, model_id: str, maxsize: int = 10_000, path: str | None = None):
+        self.model_id = model_id
+        self.memory = LRUCache(maxsize)
+        self._disk = SQLiteVectors(path) if path else None
+
+    @property
+    def stats(self) -> CacheStats:
+        return self.memory.stats
+
+    def key(self, text: str) -> str:
+        return sha256(f"{self.model_id}\0{text}".encode()).hexdigest()
+
+    def get_many(self, texts: list[str]) -> dict[str, Vector]:
+        """Looks `texts` up in memory, then on disk. Misses are left out."""
+        keys = {text: self.key(text) for text in texts}
+        found = {text: v for text, key in keys.items() if (v := self.memory.get(key)) is not None}
+
+        if self._disk and len(found) < len(keys):
+            missing = {keys[text]: text for text in keys if text not in found}
+            for key, vector in self._disk.get_many(list(missing)).items():
+                self.memory.set(key, vector)
+                found[missing[key]] = vector
+
+        return found
+
+    def set_many(self, texts: list[str], vectors: list[Vector]):
+        # Own float32 copies, so cached rows don't keep their whole batch alive
+        items = {
+            self.key(text): np.array(vector, dtype=np.float32)
+            for text, vector in zip(texts, vectors)
+        }
+        for key, vector in items.items():
+            self.memory.set(key, vector)
+        if self._disk:
+            self._disk.set_many(items)
+
+
+class SQLiteVectors:
+    """
+    Key/vector table in a SQLite file, safe to share across threads. Vectors are stored as
+    raw float32 bytes.
+    """
+
+    def __init__(self, path: str):
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = Lock()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS vectors (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+
+    def get_many(self, keys: list[str]) -> dict[str, Vector]:
+        found: dict[str, Vector] = {}
+        with self._lock:
+            # SQLite limits the number of bound parameters per statement
+            for i in range(0, len(keys), 500):
+                chunk = keys[i : i + 500]
+                rows = self._connection.execute(
+                    f"SELECT key, vector FROM vectors WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                )
+                found.update((key, decode_vector(vector)) for key, vector in rows)
+        return found
+
+    def set_many(self, items: dict[str, Vector]):
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO vectors (key, vector) VALUES (?, ?)",
+                [
+                    (key, np.asarray(vector, dtype=np.float32).tobytes())
+                    for key, vector in items.items()
+                ],
+            )
+
+
+def decode_vector(value: bytes) -> np.ndarray:
+    return np.frombuffer(value, dtype=np.float32)
+
+
+def resolve_model_id(embed: Embed | Callable) -> str:
+    """
+    The `model_id` of an embedder or of a function with that attribute. Raises a ValueError
+    if it has none, rather than keying vectors by something other models could share.
+    """
+    if model_id := getattr(embed, "model_id", None):
+        return model_id
+    name = getattr(embed, "__qualname__", type(embed).__qualname__)
+    raise ValueError(f"Can't tell which model {name} embeds with, set its `model_id`")
+
+
+class CachedEmbed(Embed):
+    """
+    Wraps an `Embed` so repeated inputs are served from an `EmbeddingCache`.
+
+    Identical inputs within a batch are embedded once, and only cache misses are sent
+    to the underlying embedder.
+    """
+
+    embed: Embed
+    cache: EmbeddingCache
+
+    def __init__(
+        self,
+        embed: Embed,
+        maxsize: int = 10_000,
+        path: str | None = None,
+        model_id: str = "",
+    ):
+        """
+        Args:
+            embed: The embedder to cache
+            maxsize: Maximum number of vectors kept in memory
+            path: Optional SQLite file to persist vectors to
+            model_id: Identifies the model in cache keys, defaults to `embed.model_id`
+        """
+        self.embed = embed
+        self.cache = EmbeddingCache(model_id or resolve_model_id(embed), maxsize, path)
+
+    @property
+    def model_id(self) -> str:
+        return self.cache.model_id
+
+    def __call__(self, inputs: list[str]) -> np.ndarray:
+        unique = list(dict.fromkeys(inputs))
+        vectors = self.cache.get_many(unique)
+
+        if misses := [text for text in unique if text not in vectors]:
+            embedded = self.embed(misses)
+            self.cache.set_many(misses, embedded)
+            vectors.update(zip(misses, embedded))
+
+        return np.array([vectors[text] for text in inputs], dtype=np.float32)
+
+
+class AsyncCachedEmbed(AsyncEmbed):
+    """
+    Wraps an `AsyncEmbed` so repeated inputs are served from an `EmbeddingCache`.
+
+    Identical inputs within a batch are embedded once, and only cache misses are sent
+    to the underlying embedder.
+    """
+
+    embed: AsyncEmbed
+    cache: EmbeddingCache
+
+    def __init__(
+        self,
+        embed: AsyncEmbed,
+        maxsize: int = 10_000,
+        path: str | None = None,
+        model_id: str = "",
+    ):
+        """
+        Args:
+            embed: The embedder to cache
+            maxsize: Maximum number of vectors kept in memory
+            path: Optional SQLite file to persist vectors to
+            model_id: Identifies the model in cache keys, defaults to `embed.model_id`
+        """
+        self.embed = embed
+        self.cache = EmbeddingCache(model_id or resolve_model_id(embed), maxsize, path)
+
+    @property
+    def model_id(self) -> str:
+        return self.cache.model_id
+
+    async def __call__(self, inputs: list[str]) -> np.ndarray:
+        unique = list(dict.fromkeys(inputs))
+        vectors = self.cache.get_many(unique)
+
+        if misses := [text for text in unique if text not in vectors]:
+            embedded = await self.embed(misses)
+            self.cache.set_many(misses, embedded)
+            vectors.update(zip(misses, embedded))
+
+        return np.array([vectors[text] for text in inputs], dtype=np.float32)
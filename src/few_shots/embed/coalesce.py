@@ -0,0 +1,90 @@
+from asyncio import CancelledError, Future, Task, TimerHandle, gather, get_running_loop, shield
+
+from few_shots.types import Vector
+
+from .base import AsyncEmbed
+
+__all__ = ["CoalescingEmbed"]
+
+
+class CoalescingEmbed(AsyncEmbed):
+    """
+    Micro-batches concurrent calls to an `AsyncEmbed`.
+
+    Inputs arriving within `window` seconds of each other (or until `max_batch_size`
+    distinct inputs are queued) are sent as one batch, and the vectors are fanned back
+    out to the callers. Identical inputs that are queued or in flight are only embedded once.
+    """
+
+    embed: AsyncEmbed
+    window: float
+    max_batch_size: int
+
+    def __init__(self, embed: AsyncEmbed, window: float = 0.002, max_batch_size: int = 256):
+        """
+        Args:
+            embed: The embedder to batch calls to
+            window: Seconds to wait for more inputs after the first one is queued
+            max_batch_size: Number of distinct queued inputs that triggers an immediate flush
+        """
+        self.embed = embed
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._queued: dict[str, Future] = {}
+        self._in_flight: dict[str, Future] = {}
+        self._timer: TimerHandle | None = None
+        self._tasks: set[Task] = set()
+
+    @property
+    def model_id(self) -> str | None:
+        return getattr(self.embed, "model_id", None)
+
+    async def __call__(self, inputs: list[str]) -> list[Vector]:
+        futures = [self._future(text) for text in inputs]
+        # Futures are shared between callers, so one caller's cancellation must not cancel them
+        return list(await gather(*(shield(f) for f in futures)))
+
+    def _future(self, text: str) -> Future:
+        if (future := self._queued.get(text) or self._in_flight.get(text)) is not None:
+            return future
+
+        loop = get_running_loop()
+        future = self._queued[text] = loop.create_future()
+        if len(self._queued) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._queued = self._queued, {}
+        if batch:
+            self._in_flight.update(batch)
+            task = get_running_loop().create_task(self._send(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: dict[str, Future]):
+        texts = list(batch)
+        try:
+            vectors = await self.embed(texts)
+        except CancelledError:
+            for future in batch.values():
+                future.cancel()
+            raise
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for text, vector in zip(texts, vectors):
+                if not batch[text].done():
+                    batch[text].set_result(vector)
+        finally:
+            for text in texts:
+                if self._in_flight.get(text) is batch[text]:
+                    del self._in_flight[text]
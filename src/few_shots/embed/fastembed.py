@@ -1,7 +1,7 @@
 from dataclasses import dataclass
-from fastembed import TextEmbedding, SparseTextEmbedding
 
-from few_shots.types import Vector
+import numpy as np
+from fastembed import TextEmbedding, SparseTextEmbedding
 
 from .base import Embed
 
@@ -11,7 +11,22 @@ Model = TextEmbedding | SparseTextEmbedding
 
 @dataclass
 class FastEmbed(Embed):
+    """
+    Args:
+        model: The FastEmbed model
+        batch_size: Inputs per ONNX run
+        parallel: Worker processes that each load the model to embed batches in parallel,
+            all cores if 0, the calling thread only if None
+    """
+
     model: Model
+    batch_size: int = 256
+    parallel: int | None = None
+
+    def __call__(self, inputs: list[str]) -> np.ndarray:
+        vectors = self.model.embed(inputs, batch_size=self.batch_size, parallel=self.parallel)
+        return np.array(list(vectors), dtype=np.float32)
 
-    def __call__(self, inputs: list[str]) -> list[Vector]:
-        return [v.tolist() for v in self.model.embed(inputs)]
+    @property
+    def model_id(self) -> str:
+        return self.model.model_name
@@ -1,23 +1,166 @@
+import random
+import time
+from asyncio import Semaphore, gather, sleep
 from functools import partial
 from typing import Any, Awaitable, Callable
 
 from few_shots.types import Vector
+from few_shots.utils.ratelimit import RateLimiter
+
 from .base import AsyncEmbed, Embed
 
+# OpenAI's limits on inputs and total tokens per embeddings request
+MAX_BATCH_SIZE = 2048
+MAX_BATCH_TOKENS = 300_000
+
+
+def approximate_tokens(text: str) -> int:
+    """About four characters per token for English text. Pass a real tokenizer to be exact."""
+    return len(text) // 4 + 1
+
+
+def token_batches(
+    inputs: list[str],
+    count_tokens: Callable[[str], int],
+    max_batch_size: int,
+    max_batch_tokens: int,
+) -> list[tuple[list[str], int]]:
+    """
+    Splits `inputs` into consecutive sub-batches within both limits, with their token counts.
+    An input over the token budget gets a batch of its own.
+    """
+    batches = []
+    start, tokens = 0, 0
+    for i, text in enumerate(inputs):
+        n = count_tokens(text)
+        if i > start and (i - start >= max_batch_size or tokens + n > max_batch_tokens):
+            batches.append((inputs[start:i], tokens))
+            start, tokens = i, 0
+        tokens += n
+    if start < len(inputs):
+        batches.append((inputs[start:], tokens))
+    return batches
+
+
+def is_rate_limited(error: Exception) -> bool:
+    return getattr(error, "status_code", None) == 429
+
+
+def retry_delay(error: Exception, attempt: int) -> float:
+    """The server's `retry-after` if given, else exponential backoff with jitter."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers["retry-after"])
+    except (KeyError, TypeError, ValueError):
+        return min(60.0, 0.5 * 2**attempt) * random.uniform(0.5, 1.0)
+
 
 class OpenAIEmbed(Embed):
-    def __init__(self, embedder: Callable[[str], Any], model: str, **kwargs):
+    def __init__(
+        self,
+        embedder: Callable[[str], Any],
+        model: str,
+        *,
+        count_tokens: Callable[[str], int] = approximate_tokens,
+        max_batch_size: int = MAX_BATCH_SIZE,
+        max_batch_tokens: int = MAX_BATCH_TOKENS,
+        max_retries: int = 6,
+        **kwargs,
+    ):
+        """
+        Args:
+            embedder: The embeddings endpoint, e.g. `OpenAI().embeddings.create`
+            model: The embedding model
+            count_tokens: Counts the tokens of an input, e.g. with tiktoken
+            max_batch_size: Most inputs per request
+            max_batch_tokens: Most tokens per request
+            max_retries: Retries of a request rejected with a 429
+            **kwargs: Passed to `embedder`
+        """
         self.embedder = partial(embedder, model=model, **kwargs)
+        self.model = model
+        self.count_tokens = count_tokens
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.max_retries = max_retries
 
     def __call__(self, inputs: list[str]) -> list[Vector]:
-        response = self.embedder(inputs)
-        return [r["embedding"] for r in response["data"]]
+        batches = token_batches(
+            inputs, self.count_tokens, self.max_batch_size, self.max_batch_tokens
+        )
+        return [vector for batch, _ in batches for vector in self._embed(batch)]
+
+    def _embed(self, inputs: list[str]) -> list[Vector]:
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.embedder(inputs)
+                return [r["embedding"] for r in response["data"]]
+            except Exception as e:
+                if not is_rate_limited(e) or attempt == self.max_retries:
+                    raise
+                time.sleep(retry_delay(e, attempt))
+
+    @property
+    def model_id(self) -> str:
+        return self.model
 
 
 class AsyncOpenAIEmbed(AsyncEmbed):
-    def __init__(self, embedder: Callable[[str], Awaitable[Any]], model: str, **kwargs):
+    def __init__(
+        self,
+        embedder: Callable[[str], Awaitable[Any]],
+        model: str,
+        *,
+        count_tokens: Callable[[str], int] = approximate_tokens,
+        max_batch_size: int = MAX_BATCH_SIZE,
+        max_batch_tokens: int = MAX_BATCH_TOKENS,
+        max_concurrency: int = 8,
+        requests_per_minute: float | None = None,
+        tokens_per_minute: float | None = None,
+        max_retries: int = 6,
+        **kwargs,
+    ):
+        """
+        Args:
+            embedder: The embeddings endpoint, e.g. `AsyncOpenAI().embeddings.create`
+            model: The embedding model
+            count_tokens: Counts the tokens of an input, e.g. with tiktoken
+            max_batch_size: Most inputs per request
+            max_batch_tokens: Most tokens per request
+            max_concurrency: Most requests in flight
+            requests_per_minute: The account's RPM limit, unlimited if None
+            tokens_per_minute: The account's TPM limit, unlimited if None
+            max_retries: Retries of a request rejected with a 429
+            **kwargs: Passed to `embedder`
+        """
         self.embedder = partial(embedder, model=model, **kwargs)
+        self.model = model
+        self.count_tokens = count_tokens
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.max_retries = max_retries
+        self.limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self._semaphore = Semaphore(max_concurrency)
 
     async def __call__(self, inputs: list[str]) -> list[Vector]:
-        response = await self.embedder(inputs)
-        return [r["embedding"] for r in response["data"]]
+        batches = token_batches(
+            inputs, self.count_tokens, self.max_batch_size, self.max_batch_tokens
+        )
+        results = await gather(*(self._embed(batch, tokens) for batch, tokens in batches))
+        return [vector for vectors in results for vector in vectors]
+
+    async def _embed(self, inputs: list[str], tokens: int) -> list[Vector]:
+        async with self._semaphore:
+            for attempt in range(self.max_retries + 1):
+                await self.limiter.acquire(tokens)
+                try:
+                    response = await self.embedder(inputs)
+                    return [r["embedding"] for r in response["data"]]
+                except Exception as e:
+                    if not is_rate_limited(e) or attempt == self.max_retries:
+                        raise
+                    await sleep(retry_delay(e, attempt))
+
+    @property
+    def model_id(self) -> str:
+        return self.model
@@ -0,0 +1,151 @@
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from multiprocessing.context import BaseContext
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable
+
+import numpy as np
+
+from .base import Embed
+
+__all__ = ["ParallelEmbed"]
+
+
+class ParallelEmbed(Embed):
+    """
+    Shards batches across a pool of worker processes, each of which loads its own copy of
+    the model once, for CPU-bound local models.
+
+    Workers write their vectors straight into a shared memory block instead of pickling
+    them back. `load` is called in each worker, so it must be picklable, e.g. a module-level
+    function or a `functools.partial` of a model class.
+    """
+
+    load: Callable[[], Embed]
+    processes: int
+    shard_size: int
+
+    def __init__(
+        self,
+        load: Callable[[], Embed],
+        processes: int | None = None,
+        shard_size: int = 256,
+        mp_context: BaseContext | None = None,
+    ):
+        """
+        Args:
+            load: Creates the embedder, called once in each worker process
+            processes: Worker processes, one per core if None
+            shard_size: Most inputs sent to a worker at once
+            mp_context: Defaults to "spawn", as forking a process that already runs model
+                threads can deadlock
+        """
+        self.load = load
+        self.processes = processes or os.cpu_count() or 1
+        self.shard_size = shard_size
+        self._mp_context = mp_context or get_context("spawn")
+        self._pool: ProcessPoolExecutor | None = None
+        self._model_id: str | None = None
+        self._dimensions: int | None = None
+
+    @property
+    def model_id(self) -> str | None:
+        """The worker embedder's `model_id`, if it has one."""
+        self._describe()
+        return self._model_id
+
+    @property
+    def dimensions(self) -> int:
+        self._describe()
+        return self._dimensions
+
+    def __call__(self, inputs: list[str]) -> np.ndarray:
+        shape = (len(inputs), self.dimensions)
+        if not inputs:
+            return np.empty(shape, dtype=np.float32)
+
+        memory = SharedMemory(create=True, size=len(inputs) * self.dimensions * 4)
+        try:
+            futures = [
+                self._executor().submit(embed_into, memory.name, shape, start, shard)
+                for start, shard in self._shards(inputs)
+            ]
+            for future in futures:
+                future.result()
+            # Copied out, as the block is unlinked once we return
+            return np.ndarray(shape, dtype=np.float32, buffer=memory.buf).copy()
+        finally:
+            memory.close()
+            memory.unlink()
+
+    def close(self):
+        """Shuts the worker processes down."""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self) -> "ParallelEmbed":
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def _shards(self, inputs: list[str]) -> list[tuple[int, list[str]]]:
+        # Spread small batches over every worker, but cap large shards
+        size = min(self.shard_size, -(-len(inputs) // self.processes))
+        return [(start, inputs[start : start + size]) for start in range(0, len(inputs), size)]
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                self.processes,
+                mp_context=self._mp_context,
+                initializer=load_worker_embed,
+                initargs=(self.load,),
+            )
+        return self._pool
+
+    def _describe(self):
+        if self._dimensions is None:
+            self._model_id, self._dimensions = self._executor().submit(describe).result()
+
+
+# Worker process state and entry points
+
+_worker_embed: Embed | None = None
+
+
+def load_worker_embed(load: Callable[[], Embed]):
+    global _worker_embed
+    _worker_embed = load()
+
+
+def describe() -> tuple[str | None, int]:
+    return getattr(_worker_embed, "model_id", None), len(_worker_embed(["dimensions"])[0])
+
+
+def embed_into(name: str, shape: tuple[int, int], start: int, inputs: list[str]):
+    memory = attach(name)
+    try:
+        vectors = np.ndarray(shape, dtype=np.float32, buffer=memory.buf)
+        vectors[start : start + len(inputs)] = _worker_embed(inputs)
+        del vectors  # Views of the buffer must be released before closing it
+    finally:
+        memory.close()
+
+
+def attach(name: str) -> SharedMemory:
+    """
+    Opens a block created by the parent without registering it with the resource tracker,
+    which would otherwise unlink it, or warn about it, when the worker exits.
+    """
+    if sys.version_info >= (3, 13):
+        return SharedMemory(name, track=False)
+
+    from multiprocessing import resource_tracker
+
+    memory = SharedMemory(name)
+    resource_tracker.unregister(memory._name, "shared_memory")
+    return memory
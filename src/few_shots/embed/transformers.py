@@ -1,13 +1,52 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+
+import numpy as np
 from sentence_transformers import SentenceTransformer
 
-from few_shots.types import Vector
 from .base import Embed
 
 
 @dataclass
 class TransformersEmbed(Embed):
+    """
+    Args:
+        model: The SentenceTransformer model
+        processes: Worker processes started with `start_multi_process_pool` to shard batches
+            across, the calling thread only if None
+        batch_size: Inputs per forward pass
+        model_id: Identifies the model, defaults to the hub name or local path it was loaded from
+    """
+
     model: SentenceTransformer
+    processes: int | None = None
+    batch_size: int = 32
+    model_id: str | None = None
+    _pool: dict | None = field(default=None, init=False, repr=False)
+
+    def __post_init__(self):
+        self.model_id = self.model_id or name_or_path(self.model)
+
+    def __call__(self, inputs: list[str]) -> np.ndarray:
+        if self.processes is None or not inputs:
+            return self.model.encode(inputs, batch_size=self.batch_size, convert_to_numpy=True)
+
+        if self._pool is None:
+            self._pool = self.model.start_multi_process_pool(["cpu"] * self.processes)
+        return self.model.encode_multi_process(inputs, self._pool, batch_size=self.batch_size)
+
+    def close(self):
+        """Stops the worker processes, if any were started."""
+        if self._pool is not None:
+            SentenceTransformer.stop_multi_process_pool(self._pool)
+            self._pool = None
+
 
-    def __call__(self, inputs: list[str]) -> list[Vector]:
-        return self.model.encode(inputs).tolist()
+def name_or_path(model: SentenceTransformer) -> str | None:
+    """
+    The hub name of a model loaded from the hub, else the path of its transformer, None for
+    models built in memory.
+    """
+    if base_model := model.model_card_data.base_model:
+        return base_model
+    config = getattr(getattr(model[0], "auto_model", None), "config", None)
+    return getattr(config, "name_or_path", None) or None
@@ -1,15 +1,53 @@
+from __future__ import annotations
+
 from abc import abstractmethod
+from dataclasses import dataclass
+
+from few_shots.types import SearchParams, Vector, Shot, ScoredShot
+
 
-from few_shots.types import Vector, Shot, ScoredShot
+@dataclass(frozen=True)
+class StoreCapabilities:
+    """
+    Limits of a store's backend, which the clients split their calls to fit.
+
+    Args:
+        max_batch_size: Most shots per `add` and vectors per `list_many`, unlimited if None
+        max_ids: Most ids per `get` and `remove`, unlimited if None
+        batch_queries: Whether `list_many` sends its vectors in one request, if not the clients
+            call `list` for each vector concurrently
+        content_hashes: Whether `add` takes the shots' content hashes and `hashes` returns
+            them, which the clients use to skip re-embedding unchanged shots
+        concurrent_writes: Whether `add` and `remove` may be called concurrently, if not the
+            clients send their chunks one at a time
+    """
+
+    max_batch_size: int | None = None
+    max_ids: int | None = None
+    batch_queries: bool = True
+    content_hashes: bool = False
+    concurrent_writes: bool = False
 
 
 class Store:
+    capabilities: StoreCapabilities = StoreCapabilities()
+
     @abstractmethod
-    def add(self, shots: list[Shot], vectors: list[Vector], namespace: str): ...
+    def add(
+        self,
+        shots: list[Shot],
+        vectors: list[Vector],
+        namespace: str,
+        hashes: list[str] | None = None,
+    ): ...
 
     @abstractmethod
     def get(self, ids: list[str], namespace: str) -> list[Shot]: ...
 
+    def hashes(self, ids: list[str], namespace: str) -> dict[str, str]:
+        """Content hashes of the shots among `ids` that were added with one."""
+        raise NotImplementedError(f"{type(self).__name__} doesn't store content hashes")
+
     @abstractmethod
     def remove(self, ids: list[str], namespace: str): ...
 
@@ -17,16 +55,41 @@ class Store:
     def clear(self, namespace: str): ...
 
     @abstractmethod
-    def list(self, vector: Vector, namespace: str, limit: int) -> list[ScoredShot]: ...
+    def list(
+        self,
+        vector: Vector,
+        namespace: str,
+        limit: int,
+        search_params: SearchParams | None = None,
+    ) -> list[ScoredShot]: ...
+
+    @abstractmethod
+    def list_many(
+        self,
+        vectors: list[Vector],
+        namespace: str,
+        limit: int,
+        search_params: SearchParams | None = None,
+    ) -> list[list[ScoredShot]]: ...
 
 
 class AsyncStore(Store):
     @abstractmethod
-    async def add(self, shots: list[Shot], vectors: list[Vector], namespace: str): ...
+    async def add(
+        self,
+        shots: list[Shot],
+        vectors: list[Vector],
+        namespace: str,
+        hashes: list[str] | None = None,
+    ): ...
 
     @abstractmethod
     async def get(self, ids: list[str], namespace: str) -> list[Shot]: ...
 
+    async def hashes(self, ids: list[str], namespace: str) -> dict[str, str]:
+        """Content hashes of the shots among `ids` that were added with one."""
+        raise NotImplementedError(f"{type(self).__name__} doesn't store content hashes")
+
     @abstractmethod
     async def remove(self, ids: list[str], namespace: str): ...
 
@@ -34,4 +97,19 @@ class AsyncStore(Store):
     async def clear(self, namespace: str): ...
 
     @abstractmethod
-    async def list(self, vector: Vector, namespace: str, limit: int) -> list[ScoredShot]: ...
+    async def list(
+        self,
+        vector: Vector,
+        namespace: str,
+        limit: int,
+        search_params: SearchParams | None = None,
+    ) -> list[ScoredShot]: ...
+
+    @abstractmethod
+    async def list_many(
+        self,
+        vectors: list[Vector],
+        namespace: str,
+        limit: int,
+        search_params: SearchParams | None = None,
+    ) -> list[list[ScoredShot]]: ...
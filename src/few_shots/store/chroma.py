@@ -1,17 +1,21 @@
+from __future__ import annotations
+
+
 from chromadb import Collection
 from chromadb.api.async_client import AsyncCollection
 from sorcery import dict_of
 
 from few_shots.types import (
-    dump_io_value,
-    parse_io_value,
+    encode_io_value,
+    LazyShot,
     ScoredShot,
+    SearchParams,
     Shot,
     Vector,
 )
 from few_shots.utils.datetime import utcnow
 
-from .base import AsyncStore, Store
+from .base import AsyncStore, Store, StoreCapabilities
 
 __all__ = ["ChromaStore", "AsyncChromaStore"]
 
@@ -19,22 +23,48 @@ __all__ = ["ChromaStore", "AsyncChromaStore"]
 class ChromaStore(Store):
     collection: Collection
 
-    def __init__(self, collection: Collection):
+    def __init__(self, collection: Collection, max_batch_size: int = 5461):
+        """
+        Args:
+            collection: The Chroma collection to store shots in
+            max_batch_size: Most records per request, e.g. `client.get_max_batch_size()`.
+                Defaults to SQLite's limit for Chroma's default schema
+        """
         self.collection = collection
+        self.capabilities = StoreCapabilities(
+            max_batch_size=max_batch_size, max_ids=max_batch_size, content_hashes=True
+        )
 
-    def add(self, shots: list[Shot], vectors: list[Vector], namespace: str):
-        self.collection.upsert(**ChromaHelper.upsert_shots(shots, vectors, namespace))
+    def add(
+        self,
+        shots: list[Shot],
+        vectors: list[Vector],
+        namespace: str,
+        hashes: list[str] | None = None,
+    ):
+        self.collection.upsert(**ChromaHelper.upsert_shots(shots, vectors, namespace, hashes))
 
     def get(self, ids: list[str], _namespace: str) -> list[Shot]:
         return ChromaHelper.get_shots(self.collection.get(ids))
 
+    def hashes(self, ids: list[str], namespace: str) -> dict[str, str]:
+        return ChromaHelper.get_hashes(
+            self.collection.get(ids, include=["metadatas"]), namespace
+        )
+
     def remove(self, ids: list[str], _namespace: str):
         self.collection.delete(ids=ids)
 
     def clear(self, namespace: str):
         self.collection.delete(where=dict_of(namespace))
 
-    def list(self, vector: Vector, namespace: str, limit: int) -> list[ScoredShot]:
+    def list(
+        self,
+        vector: Vector,
+        namespace: str,
+        limit: int,
+        _search_params: SearchParams | None = None,
+    ) -> list[ScoredShot]:
         return ChromaHelper.query_scored_shots(
             self.collection.query(
                 query_embeddings=[vector],
@@ -43,26 +73,67 @@ class ChromaStore(Store):
             )
         )
 
+    def list_many(
+        self,
+        vectors: list[Vector],
+        namespace: str,
+        limit: int,
+        _search_params: SearchParams | None = None,
+    ) -> list[list[ScoredShot]]:
+        return ChromaHelper.query_many_scored_shots(
+            self.collection.query(
+                query_embeddings=vectors,
+                where=dict_of(namespace),
+                n_results=limit,
+            )
+        )
+
 
 class AsyncChromaStore(AsyncStore):
     collection: AsyncCollection
 
-    def __init__(self, collection: AsyncCollection):
+    def __init__(self, collection: AsyncCollection, max_batch_size: int = 5461):
+        """
+        Args:
+            collection: The Chroma collection to store shots in
+            max_batch_size: Most records per request. The async client only reports its limit
+                from a coroutine, so this defaults to SQLite's limit for Chroma's default schema
+        """
         self.collection = collection
+        self.capabilities = StoreCapabilities(
+            max_batch_size=max_batch_size, max_ids=max_batch_size, content_hashes=True
+        )
 
-    async def add(self, shots: list[Shot], vectors: list[Vector], namespace: str):
-        await self.collection.upsert(**ChromaHelper.upsert_shots(shots, vectors, namespace))
+    async def add(
+        self,
+        shots: list[Shot],
+        vectors: list[Vector],
+        namespace: str,
+        hashes: list[str] | None = None,
+    ):
+        await self.collection.upsert(**ChromaHelper.upsert_shots(shots, vectors, namespace, hashes))
 
     async def get(self, ids: list[str], _namespace: str) -> list[Shot]:
         return ChromaHelper.get_shots(await self.collection.get(ids))
 
+    async def hashes(self, ids: list[str], namespace: str) -> dict[str, str]:
+        return ChromaHelper.get_hashes(
+            await self.collection.get(ids, include=["metadatas"]), namespace
+        )
+
     async def remove(self, ids: list[str], _namespace: str):
         await self.collection.delete(ids=ids)
 
     async def clear(self, namespace: str):
         await self.collection.delete(where=dict_of(namespace))
 
-    async def list(self, vector: Vector, namespace: str, limit: int) -> list[ScoredShot]:
+    async def list(
+        self,
+        vector: Vector,
+        namespace: str,
+        limit: int,
+        _search_params: SearchParams | None = None,
+    ) -> list[ScoredShot]:
         return ChromaHelper.query_scored_shots(
             await self.collection.query(
                 query_embeddings=[vector],
@@ -71,24 +142,55 @@ class AsyncChromaStore(AsyncStore):
             )
         )
 
+    async def list_many(
+        self,
+        vectors: list[Vector],
+        namespace: str,
+        limit: int,
+        _search_params: SearchParams | None = None,
+    ) -> list[list[ScoredShot]]:
+        return ChromaHelper.query_many_scored_shots(
+            await self.collection.query(
+                query_embeddings=vectors,
+                where=dict_of(namespace),
+                n_results=limit,
+            )
+        )
+
 
 class ChromaHelper:
     @staticmethod
-    def upsert_shots(shots: list[Shot], vectors: list[Vector], namespace: str) -> dict:
+    def upsert_shots(
+        shots: list[Shot],
+        vectors: list[Vector],
+        namespace: str,
+        hashes: list[str] | None = None,
+    ) -> dict:
         updated_at = utcnow()
+        # Chroma merges upserted metadata, so an empty hash is written to replace an old one
+        metadatas = [
+            dict_of(namespace, updated_at, outputs=encode_io_value(s.outputs), hash=hash)
+            for s, hash in zip(shots, hashes or [""] * len(shots))
+        ]
         return dict(
             ids=[s.id for s in shots],
             embeddings=vectors,
-            documents=[s.key for s in shots],
-            metadatas=[
-                dict_of(namespace, updated_at, outputs=dump_io_value(s.outputs)) for s in shots
-            ],
+            documents=[encode_io_value(s.inputs) for s in shots],
+            metadatas=metadatas,
         )
 
+    @staticmethod
+    def get_hashes(results: dict, namespace: str) -> dict[str, str]:
+        return {
+            id: metadata["hash"]
+            for (id, metadata) in zip(results["ids"], results["metadatas"])
+            if metadata.get("namespace") == namespace and metadata.get("hash")
+        }
+
     @staticmethod
     def get_shots(results: dict) -> list[Shot]:
         return [
-            Shot(parse_io_value(inputs), parse_io_value(metadata["outputs"]), id)
+            LazyShot(inputs, metadata["outputs"], id)
             for (inputs, metadata, id) in zip(
                 results["documents"],
                 results["metadatas"],
@@ -98,15 +200,25 @@ class ChromaHelper:
 
     @staticmethod
     def query_scored_shots(results: dict) -> list[ScoredShot]:
+        return ChromaHelper.query_many_scored_shots(results)[0]
+
+    @staticmethod
+    def query_many_scored_shots(results: dict) -> list[list[ScoredShot]]:
+        """
+        One list of scored shots per query embedding, in the order they were queried.
+        """
         return [
-            ScoredShot(
-                distance,
-                Shot(parse_io_value(inputs), parse_io_value(metadata["outputs"]), id),
-            )
-            for (distance, id, inputs, metadata) in zip(
-                results["distances"][0],
-                results["ids"][0],
-                results["documents"][0],
-                results["metadatas"][0],
+            [
+                ScoredShot(
+                    distance,
+                    LazyShot(inputs, metadata["outputs"], id),
+                )
+                for (distance, id, inputs, metadata) in zip(*query_results)
+            ]
+            for query_results in zip(
+                results["distances"],
+                results["ids"],
+                results["documents"],
+                results["metadatas"],
             )
         ]
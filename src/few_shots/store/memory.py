@@ -1,15 +1,20 @@
+from __future__ import annotations
+
 from collections import defaultdict
-from operator import itemgetter
-from typing import Callable
+from typing import Callable, Literal, TypeVar
 
 import numpy as np
 
-from .base import ScoredShot, Shot, Store, Vector
+from .base import ScoredShot, SearchParams, Shot, Store, StoreCapabilities, Vector
 
 
 __all__ = ["MemoryStore"]
 
 
+DistanceType = TypeVar("DistanceType", bound=Literal["cosine", "l2"])
+DistanceFunction = Callable[[Vector, Vector], float]
+
+
 def cosine_distance(a: Vector, b: Vector) -> float:
     if not (norm_a := np.linalg.norm(a)) or not (norm_b := np.linalg.norm(b)):
         return 1.0
@@ -17,36 +22,213 @@ def cosine_distance(a: Vector, b: Vector) -> float:
 
 
 class MemoryStore(Store):
-    # namespace => id => (shot, vector)
-    _storage: dict[str, dict[str, tuple[Shot, Vector]]]
-    distance: Callable[[Vector, Vector], float]
+    capabilities = StoreCapabilities(content_hashes=True)
 
-    def __init__(self, distance: Callable[[Vector, Vector], float] = cosine_distance):
-        self._storage = defaultdict(dict)
-        self.distance = distance
+    # namespace => vectors matrix, norms, id => row
+    _storage: dict[str, "VectorTable"]
+    distance: DistanceType | DistanceFunction
+    compaction_ratio: float
 
-    def add(self, shots: list[Shot], vectors: list[Vector], namespace: str):
-        for shot, vector in zip(shots, vectors):
-            self._storage[namespace][shot.id] = (shot, vector)
+    def __init__(
+        self,
+        distance: DistanceType | DistanceFunction = "cosine",
+        compaction_ratio: float = 0.25,
+    ):
+        """
+        Args:
+            distance: Either "cosine" or "l2", or a function of two vectors, which is called
+                for every stored vector and so is much slower
+            compaction_ratio: Fraction of removed rows in a namespace that triggers compaction
+        """
+        self._storage = defaultdict(VectorTable)
+        self.distance = "cosine" if distance is cosine_distance else distance
+        self.compaction_ratio = compaction_ratio
+
+    def add(
+        self,
+        shots: list[Shot],
+        vectors: list[Vector],
+        namespace: str,
+        hashes: list[str] | None = None,
+    ):
+        self._storage[namespace].upsert(shots, vectors, hashes)
 
     def get(self, ids: list[str], namespace: str) -> list[Shot]:
-        results: list[Shot] = []
-        for id in ids:
-            result = self._storage[namespace].get(id)
-            if result:
-                results.append(result[0])
-        return results
+        table = self._storage[namespace]
+        return [table.shots[table.rows[id]] for id in ids if id in table.rows]
+
+    def hashes(self, ids: list[str], namespace: str) -> dict[str, str]:
+        table = self._storage[namespace]
+        return {id: table.hashes[id] for id in ids if id in table.hashes}
 
     def remove(self, ids: list[str], namespace: str):
-        for id in ids:
-            del self._storage[namespace][id]
+        table = self._storage[namespace]
+        table.delete(ids)
+        if table.tombstones > self.compaction_ratio * table.size:
+            table.compact()
 
     def clear(self, namespace: str):
-        self._storage[namespace].clear()
+        self._storage.pop(namespace, None)
 
-    def list(self, vector: Vector, namespace: str, limit: int) -> list[ScoredShot]:
-        scored_shots = [
-            ScoredShot(self.distance(vector, emb), shot)
-            for (shot, emb) in self._storage[namespace].values()
+    def list(
+        self,
+        vector: Vector,
+        namespace: str,
+        limit: int,
+        _search_params: SearchParams | None = None,
+    ) -> list[ScoredShot]:
+        return self._query([vector], namespace, limit)[0]
+
+    def list_many(
+        self,
+        vectors: list[Vector],
+        namespace: str,
+        limit: int,
+        _search_params: SearchParams | None = None,
+    ) -> list[list[ScoredShot]]:
+        return self._query(vectors, namespace, limit)
+
+    def _query(
+        self,
+        vectors: list[Vector],
+        namespace: str,
+        limit: int,
+    ) -> list[list[ScoredShot]]:
+        table = self._storage.get(namespace)
+        if table is None or not table.rows or limit <= 0:
+            return [[] for _ in vectors]
+
+        distances = table.distances(np.asarray(vectors, dtype=np.float32), self.distance)
+        return [
+            [ScoredShot(float(query[row]), table.shots[row]) for row in top_k(query, limit)]
+            for query in distances
         ]
-        return sorted(scored_shots, key=itemgetter(1), reverse=True)[:limit]
+
+
+def top_k(distances: np.ndarray, k: int) -> np.ndarray:
+    """
+    Indices of the `k` smallest finite distances, sorted ascending.
+    """
+    k = min(k, int(np.isfinite(distances).sum()))
+    if k < len(distances):
+        candidates = np.argpartition(distances, k - 1)[:k]
+    else:
+        candidates = np.arange(len(distances))
+    candidates = candidates[np.argsort(distances[candidates], kind="stable")]
+    return candidates[:k]
+
+
+class VectorTable:
+    """
+    Contiguous float32 matrix of a namespace's vectors, grown geometrically.
+
+    Removed rows are tombstoned (their norm is set to NaN) until `compact` is called.
+    """
+
+    matrix: np.ndarray
+    norms: np.ndarray
+    shots: list[Shot | None]
+    rows: dict[str, int]
+    hashes: dict[str, str]
+    size: int
+    tombstones: int
+
+    def __init__(self):
+        self.matrix = np.empty((0, 0), dtype=np.float32)
+        self.norms = np.empty(0, dtype=np.float32)
+        self.shots = []
+        self.rows = {}
+        self.hashes = {}
+        self.size = 0
+        self.tombstones = 0
+
+    def upsert(self, shots: list[Shot], vectors: list[Vector], hashes: list[str] | None = None):
+        if not shots:
+            return
+
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self._reserve(self.size + len(shots), vectors.shape[1])
+
+        for shot, vector in zip(shots, vectors):
+            row = self.rows.get(shot.id)
+            if row is None:
+                row = self.rows[shot.id] = self.size
+                self.shots.append(shot)
+                self.size += 1
+            else:
+                self.shots[row] = shot
+            self.matrix[row] = vector
+
+        rows = [self.rows[shot.id] for shot in shots]
+        self.norms[rows] = np.linalg.norm(self.matrix[rows], axis=1)
+
+        if hashes is None:
+            # Like the other backends, a shot written without a hash drops its old one
+            for shot in shots:
+                self.hashes.pop(shot.id, None)
+        else:
+            for shot, hash in zip(shots, hashes):
+                self.hashes[shot.id] = hash
+
+    def delete(self, ids: list[str]):
+        for id in ids:
+            row = self.rows.pop(id, None)
+            self.hashes.pop(id, None)
+            if row is not None:
+                self.shots[row] = None
+                self.norms[row] = np.nan
+                self.tombstones += 1
+
+    def compact(self):
+        alive = [row for row in range(self.size) if self.shots[row] is not None]
+        self.matrix = self.matrix[alive]
+        self.norms = self.norms[alive]
+        self.shots = [self.shots[row] for row in alive]
+        self.rows = {shot.id: row for row, shot in enumerate(self.shots)}
+        self.size = len(alive)
+        self.tombstones = 0
+
+    def distances(
+        self,
+        vectors: np.ndarray,
+        distance: DistanceType | DistanceFunction,
+    ) -> np.ndarray:
+        """
+        Distances from each of `vectors` to every row, `inf` for tombstones.
+        """
+        matrix, norms = self.matrix[: self.size], self.norms[: self.size]
+        if callable(distance):
+            distances = np.array(
+                [[distance(vector, row) for row in matrix] for vector in vectors],
+                dtype=np.float64,
+            ).reshape(len(vectors), self.size)
+            distances[:, np.isnan(norms)] = np.inf
+            return distances
+
+        dots = vectors @ matrix.T
+        if distance == "l2":
+            squared = norms**2 - 2 * dots + np.einsum("ij,ij->i", vectors, vectors)[:, None]
+            distances = np.sqrt(np.maximum(squared, 0))
+        else:
+            denominator = np.linalg.norm(vectors, axis=1)[:, None] * norms
+            with np.errstate(divide="ignore", invalid="ignore"):
+                distances = 1 - dots / denominator
+            distances[denominator == 0] = 1.0
+
+        distances[:, np.isnan(norms)] = np.inf
+        return distances
+
+    def _reserve(self, rows: int, dimensions: int):
+        capacity, current_dimensions = self.matrix.shape
+        if self.size and dimensions != current_dimensions:
+            raise ValueError(f"Expected {current_dimensions}-dimensional vectors, got {dimensions}")
+        if rows <= capacity and dimensions == current_dimensions:
+            return
+
+        capacity = max(rows, 2 * capacity, 16)
+        matrix = np.empty((capacity, dimensions), dtype=np.float32)
+        norms = np.empty(capacity, dtype=np.float32)
+        if self.size:
+            matrix[: self.size] = self.matrix[: self.size]
+            norms[: self.size] = self.norms[: self.size]
+        self.matrix, self.norms = matrix, norms
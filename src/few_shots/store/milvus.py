@@ -1,27 +1,38 @@
+from __future__ import annotations
+
 from typing import Literal, TypeVar
+
+import ujson
 from pymilvus import (
+    AsyncMilvusClient,
     CollectionSchema,
     DataType,
     FieldSchema,
     MilvusClient,
 )
+from pymilvus.milvus_client import IndexParams
 
 from few_shots.types import (
-    dump_io_value,
-    parse_io_value,
+    encode_io_value,
+    LazyShot,
     ScoredShot,
+    SearchParams,
     Shot,
     Vector,
 )
-from few_shots.utils.asyncio import asyncify_class
+from few_shots.utils.datetime import utcnow
+
+from .base import AsyncStore, Store, StoreCapabilities
 
-from .base import Store
+__all__ = ["MilvusStore", "AsyncMilvusStore", "MetricType"]
 
 
 MetricType = TypeVar("MetricType", bound=Literal["L2", "IP", "COSINE", "HAMMING", "JACCARD"])
 
 
 class MilvusStore(Store):
+    capabilities = StoreCapabilities(content_hashes=True)
+
     client: MilvusClient
     collection_name: str
 
@@ -29,77 +40,65 @@ class MilvusStore(Store):
         self.client = client
         self.collection_name = collection_name
 
-    def setup(self, size: int, metric_type: MetricType = "COSINE"):
-        if self.client.has_collection(self.collection_name):
-            return
+    def setup(self, size: int, metric_type: MetricType = "COSINE", num_partitions: int = 64):
+        """
+        Creates and loads the collection, or only loads it if it already exists.
 
-        fields = [
-            FieldSchema("id", DataType.VARCHAR, max_length=128, is_primary=True),
-            FieldSchema("namespace", DataType.VARCHAR, max_length=512),
-            FieldSchema("vector", DataType.FLOAT_VECTOR, dim=size),
-            FieldSchema("payload", DataType.JSON),
-            FieldSchema("updated_at", DataType.FLOAT),
-        ]
-
-        self.client.create_collection(
-            collection_name=self.collection_name,
-            schema=CollectionSchema(fields),
-            index=self.client.prepare_index_params(
-                field_name="vector",
-                metric_type=metric_type,
-                index_type="AUTOINDEX",
-                index_name="vectors_index",
-            ),
-        )
+        Args:
+            size: The number of dimensions in the vectors to be stored
+            metric_type: The distance metric of the vector index
+            num_partitions: Partitions that namespaces are hashed into. `namespace` is the
+                partition key, so searches only scan the namespace's partition
+        """
+        if not self.client.has_collection(self.collection_name):
+            self.client.create_collection(
+                **MilvusHelper.create_collection(
+                    self.collection_name, size, metric_type, num_partitions
+                )
+            )
+        self.client.load_collection(self.collection_name)
 
     def teardown(self):
         self.client.drop_collection(self.collection_name)
 
-    def add(self, shots: list[Shot], vectors: list[Vector], namespace: str):
+    def add(
+        self,
+        shots: list[Shot],
+        vectors: list[Vector],
+        namespace: str,
+        hashes: list[str] | None = None,
+    ):
         self.client.upsert(
             collection_name=self.collection_name,
-            data=[
-                {
-                    "id": shot.id,
-                    "namespace": namespace,
-                    "vectors": vector,
-                    "payload": {
-                        "inputs": dump_io_value(shot.inputs),
-                        "outputs": dump_io_value(shot.outputs),
-                    },
-                }
-                for shot, vector in zip(shots, vectors)
-            ],
+            data=MilvusHelper.upsert_data(shots, vectors, namespace, hashes),
         )
 
     def get(self, ids: list[str], namespace: str) -> list[Shot]:
         response = self.client.query(
             collection_name=self.collection_name,
-            filter=f"namespace == '{namespace}'",
+            filter=MilvusHelper.filter(namespace, ids),
             output_fields=["id", "payload"],
-            ids=ids,
-        )[0]
-
-        results: list[Shot] = []
-        for datum in response:
-            metadata = datum.get("entity", {}).get("payload")
-            inputs = parse_io_value(metadata["inputs"])
-            outputs = parse_io_value(metadata["outputs"])
-            results.append(Shot(inputs, outputs, datum["id"]))
+        )
+        return MilvusHelper.query_shots(response)
 
-        return results
+    def hashes(self, ids: list[str], namespace: str) -> dict[str, str]:
+        response = self.client.query(
+            collection_name=self.collection_name,
+            filter=MilvusHelper.filter(namespace, ids),
+            output_fields=["id", "payload"],
+        )
+        return MilvusHelper.query_hashes(response)
 
     def remove(self, ids: list[str], namespace: str):
         self.client.delete(
             collection_name=self.collection_name,
-            ids=ids,
-            filter=f"namespace == '{namespace}'",
+            filter=MilvusHelper.filter(namespace, ids),
         )
 
     def clear(self, namespace: str):
         self.client.delete(
             collection_name=self.collection_name,
-            filter=f"namespace == '{namespace}'",
+            filter=MilvusHelper.filter(namespace),
         )
 
     def list(
@@ -107,23 +106,235 @@ class MilvusStore(Store):
         vector: Vector,
         namespace: str,
         limit: int,
+        search_params: SearchParams | None = None,
     ) -> list[ScoredShot]:
+        return self.list_many([vector], namespace, limit, search_params)[0]
+
+    def list_many(
+        self,
+        vectors: list[Vector],
+        namespace: str,
+        limit: int,
+        search_params: SearchParams | None = None,
+    ) -> list[list[ScoredShot]]:
         response = self.client.search(
             collection_name=self.collection_name,
-            data=[vector],
-            filter=f"namespace == '{namespace}'",
+            data=vectors,
+            filter=MilvusHelper.filter(namespace),
+            limit=limit,
+            output_fields=["payload"],
+            search_params=MilvusHelper.search_params(search_params),
+        )
+        return MilvusHelper.search_scored_shots(response)
+
+
+class AsyncMilvusStore(AsyncStore):
+    capabilities = StoreCapabilities(content_hashes=True)
+
+    client: AsyncMilvusClient
+    collection_name: str
+
+    def __init__(self, client: AsyncMilvusClient, collection_name: str):
+        self.client = client
+        self.collection_name = collection_name
+
+    async def setup(
+        self,
+        size: int,
+        metric_type: MetricType = "COSINE",
+        num_partitions: int = 64,
+    ):
+        """
+        Creates and loads the collection, or only loads it if it already exists.
+        See `MilvusStore.setup`.
+        """
+        if not await self.client.has_collection(self.collection_name):
+            await self.client.create_collection(
+                **MilvusHelper.create_collection(
+                    self.collection_name, size, metric_type, num_partitions
+                )
+            )
+        await self.client.load_collection(self.collection_name)
+
+    async def teardown(self):
+        await self.client.drop_collection(self.collection_name)
+
+    async def add(
+        self,
+        shots: list[Shot],
+        vectors: list[Vector],
+        namespace: str,
+        hashes: list[str] | None = None,
+    ):
+        await self.client.upsert(
+            collection_name=self.collection_name,
+            data=MilvusHelper.upsert_data(shots, vectors, namespace, hashes),
+        )
+
+    async def get(self, ids: list[str], namespace: str) -> list[Shot]:
+        response = await self.client.query(
+            collection_name=self.collection_name,
+            filter=MilvusHelper.filter(namespace, ids),
+            output_fields=["id", "payload"],
+        )
+        return MilvusHelper.query_shots(response)
+
+    async def hashes(self, ids: list[str], namespace: str) -> dict[str, str]:
+        response = await self.client.query(
+            collection_name=self.collection_name,
+            filter=MilvusHelper.filter(namespace, ids),
+            output_fields=["id", "payload"],
+        )
+        return MilvusHelper.query_hashes(response)
+
+    async def remove(self, ids: list[str], namespace: str):
+        await self.client.delete(
+            collection_name=self.collection_name,
+            filter=MilvusHelper.filter(namespace, ids),
+        )
+
+    async def clear(self, namespace: str):
+        await self.client.delete(
+            collection_name=self.collection_name,
+            filter=MilvusHelper.filter(namespace),
+        )
+
+    async def list(
+        self,
+        vector: Vector,
+        namespace: str,
+        limit: int,
+        search_params: SearchParams | None = None,
+    ) -> list[ScoredShot]:
+        return (await self.list_many([vector], namespace, limit, search_params))[0]
+
+    async def list_many(
+        self,
+        vectors: list[Vector],
+        namespace: str,
+        limit: int,
+        search_params: SearchParams | None = None,
+    ) -> list[list[ScoredShot]]:
+        response = await self.client.search(
+            collection_name=self.collection_name,
+            data=vectors,
+            filter=MilvusHelper.filter(namespace),
             limit=limit,
-        )[0]
+            output_fields=["payload"],
+            search_params=MilvusHelper.search_params(search_params),
+        )
+        return MilvusHelper.search_scored_shots(response)
 
-        results: list[ScoredShot] = []
-        for datum in response:
-            metadata = datum.get("entity", {}).get("payload")
-            inputs = parse_io_value(metadata["inputs"])
-            outputs = parse_io_value(metadata["outputs"])
-            results.append(ScoredShot(datum["distance"], Shot(inputs, outputs, datum["id"])))
 
-        return results
+class MilvusHelper:
+    @staticmethod
+    def create_collection(
+        collection_name: str,
+        size: int,
+        metric_type: MetricType = "COSINE",
+        num_partitions: int = 64,
+    ) -> dict:
+        """
+        Use these as kwargs for `.create_collection`.
+        """
+        fields = [
+            FieldSchema("id", DataType.VARCHAR, max_length=128, is_primary=True),
+            FieldSchema("namespace", DataType.VARCHAR, max_length=512, is_partition_key=True),
+            FieldSchema("vector", DataType.FLOAT_VECTOR, dim=size),
+            FieldSchema("payload", DataType.JSON),
+            FieldSchema("updated_at", DataType.DOUBLE),
+        ]
 
+        index_params = IndexParams()
+        index_params.add_index(
+            field_name="vector",
+            metric_type=metric_type,
+            index_type="AUTOINDEX",
+            index_name="vectors_index",
+        )
 
-@asyncify_class
-class AsyncMilvusStore(MilvusStore): ...
+        return dict(
+            collection_name=collection_name,
+            schema=CollectionSchema(fields),
+            index_params=index_params,
+            num_partitions=num_partitions,
+        )
+
+    @staticmethod
+    def filter(namespace: str, ids: list[str] | None = None) -> str:
+        """
+        Boolean expression matching the namespace, and the ids if given. Values are quoted as
+        JSON strings, which Milvus parses with the same escapes.
+        """
+        expression = f"namespace == {ujson.dumps(namespace, escape_forward_slashes=False)}"
+        if ids is not None:
+            expression += f" and id in {ujson.dumps(ids, escape_forward_slashes=False)}"
+        return expression
+
+    @staticmethod
+    def search_params(search_params: SearchParams | None) -> dict:
+        """
+        Milvus has no per-query exact search, `ef` applies to HNSW and `nprobe` to IVF indexes.
+        """
+        if search_params is None:
+            return {}
+        params = {
+            key: value
+            for key, value in (("ef", search_params.ef), ("nprobe", search_params.nprobe))
+            if value is not None
+        }
+        return {"params": params}
+
+    @staticmethod
+    def upsert_data(
+        shots: list[Shot],
+        vectors: list[Vector],
+        namespace: str,
+        hashes: list[str] | None = None,
+    ) -> list[dict]:
+        updated_at = utcnow()
+        data = [
+            {
+                "id": shot.id,
+                "namespace": namespace,
+                "vector": vector,
+                "payload": {
+                    "inputs": encode_io_value(shot.inputs),
+                    "outputs": encode_io_value(shot.outputs),
+                },
+                "updated_at": updated_at,
+            }
+            for shot, vector in zip(shots, vectors)
+        ]
+        for datum, hash in zip(data, hashes or ()):
+            datum["payload"]["hash"] = hash
+        return data
+
+    @staticmethod
+    def shot(id: str, payload: dict) -> Shot:
+        return LazyShot(payload["inputs"], payload["outputs"], id)
+
+    @staticmethod
+    def query_shots(response: list[dict]) -> list[Shot]:
+        return [MilvusHelper.shot(datum["id"], datum["payload"]) for datum in response]
+
+    @staticmethod
+    def query_hashes(response: list[dict]) -> dict[str, str]:
+        return {
+            datum["id"]: datum["payload"]["hash"]
+            for datum in response
+            if "hash" in datum["payload"]
+        }
+
+    @staticmethod
+    def search_scored_shots(response: list[list[dict]]) -> list[list[ScoredShot]]:
+        return [
+            [
+                ScoredShot(
+                    datum["distance"],
+                    MilvusHelper.shot(datum["id"], datum["entity"]["payload"]),
+                )
+                for datum in hits
+            ]
+            for hits in response
+        ]
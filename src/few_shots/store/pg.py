@@ -1,36 +1,75 @@
-from typing import Literal, TypeVar
+from __future__ import annotations
+
+from contextlib import asynccontextmanager, contextmanager
+from hashlib import md5
+from math import isqrt
+from time import perf_counter
+from typing import AsyncIterator, Iterator, Literal, TypeVar
 from uuid import UUID
-from psycopg import AsyncConnection, Connection
+from psycopg import AsyncConnection, AsyncCursor, Connection, Cursor
 from psycopg.rows import TupleRow
 from psycopg.types.json import Jsonb
+from psycopg_pool import AsyncConnectionPool, ConnectionPool
 from pgvector.psycopg import register_vector, register_vector_async
+import ujson
 
-from few_shots.types import ScoredShot, Shot, Vector
+from few_shots.types import as_floats, ScoredShot, SearchParams, Shot, Vector
+from few_shots.utils.metrics import LatencyStats
 
-from .base import Store
+from .base import Store, StoreCapabilities
 
 
 __all__ = ["PGStore", "AsyncPGStore"]
 
 
-DistanceType = TypeVar("DistanceType", bound=Literal["cosine", "l2"])
+DistanceType = TypeVar("DistanceType", bound=Literal["cosine", "l2", "ip"])
+IndexType = Literal["auto", "hnsw", "ivfflat", "diskann"]
 
 
 class PGStore(Store):
+    capabilities = StoreCapabilities(content_hashes=True)
+
     _sql: "SQLHelper"
-    connection: Connection
+    connection: Connection | ConnectionPool
+    copy_threshold: int
+    pool_wait: LatencyStats
 
     def __init__(
         self,
-        connection: Connection[TupleRow],
+        connection: Connection[TupleRow] | ConnectionPool,
         tablename: str,
         schema: str = "public",
         distance: DistanceType = "cosine",
+        copy_threshold: int = 1000,
+        partitioned: bool = False,
     ):
-        self._sql = SQLHelper(tablename, schema, distance)
+        """
+        Args:
+            connection: Connection to the database, or a pool to run queries in parallel on
+            tablename: Name of the table to store shots in
+            schema: Schema of the table
+            distance: Distance metric used for similarity search
+            copy_threshold: Batches of at least this many shots are upserted with a binary COPY
+                into a staging table instead of one INSERT per shot
+            partitioned: LIST-partition the table by namespace, keyed on (namespace, id),
+                so each namespace gets its own vector index and queries only search it
+        """
+        self._sql = SQLHelper(tablename, schema, distance, partitioned)
+        self._partitions: set[str] = set()
         self.connection = connection
+        self.copy_threshold = copy_threshold
+        self.pool_wait = LatencyStats()
+        if isinstance(connection, ConnectionPool):
+            # Each write checks out its own connection
+            self.capabilities = StoreCapabilities(content_hashes=True, concurrent_writes=True)
 
-    def setup(self, dimensions: int, m: int = 64, ef_construction: int = 128):
+    def setup(
+        self,
+        dimensions: int,
+        m: int = 64,
+        ef_construction: int = 128,
+        defer_index: bool = False,
+    ):
         """
         Sets up the database table and index for vector similarity search.
         Idempotent, will not re-create the table if it already exists.
@@ -40,106 +79,376 @@ class PGStore(Store):
             dimensions: The number of dimensions in the vectors to be stored
             m: Number of connections per element in HNSW index (pgvector only)
             ef_construction: Size of the dynamic candidate list for constructing HNSW index (pgvector only)
+            defer_index: Only create the table, call `build_index` once the initial data is loaded
 
         Raises:
             ValueError: If pgvector extension is not installed in the database
         """
-        with self.connection.cursor() as cursor:
+        with self._cursor() as cursor:
             cursor.execute(self._sql.pgvector_create())
             cursor.execute(self._sql.table_create(dimensions))
 
-            cursor.execute(self._sql.diskann_check())
-            if cursor.fetchone():
+            if not defer_index:
+                cursor.execute(self._sql.diskann_check())
+                if cursor.fetchone():
+                    cursor.execute(self._sql.diskann_index())
+                else:
+                    cursor.execute(self._sql.pgvector_index(m, ef_construction))
+
+            register_vector(cursor.connection)
+
+    def build_index(
+        self,
+        index: IndexType = "auto",
+        m: int = 64,
+        ef_construction: int = 128,
+        lists: int | None = None,
+        maintenance_work_mem: str = "1GB",
+        max_parallel_maintenance_workers: int = 7,
+    ):
+        """
+        Builds the vector index over the rows already loaded, after `setup(defer_index=True)`.
+        Building once is much cheaper than inserting every row into a live graph index.
+        No-op if the index already exists.
+
+        Args:
+            index: "hnsw", "ivfflat", "diskann", or "auto" for DiskANN if available, HNSW otherwise
+            m: Number of connections per element in HNSW index
+            ef_construction: Size of the dynamic candidate list for constructing HNSW index
+            lists: Number of IVFFlat lists, sized from the row count by default
+            maintenance_work_mem: Memory for the build, the HNSW graph is built faster in memory
+            max_parallel_maintenance_workers: Workers used by the build, in addition to the leader
+        """
+        with self._cursor() as cursor, cursor.connection.transaction():
+            cursor.execute(self._sql.set_local(), ("maintenance_work_mem", maintenance_work_mem))
+            cursor.execute(
+                self._sql.set_local(),
+                ("max_parallel_maintenance_workers", str(max_parallel_maintenance_workers)),
+            )
+
+            if index == "auto":
+                cursor.execute(self._sql.diskann_check())
+                index = "diskann" if cursor.fetchone() else "hnsw"
+
+            if index == "diskann":
                 cursor.execute(self._sql.diskann_index())
+            elif index == "ivfflat":
+                if lists is None:
+                    cursor.execute(self._sql.row_count())
+                    lists = SQLHelper.ivfflat_lists(cursor.fetchone()[0])
+                cursor.execute(self._sql.ivfflat_index(lists))
             else:
                 cursor.execute(self._sql.pgvector_index(m, ef_construction))
 
-        register_vector(self.connection)
+    @staticmethod
+    def configure(connection: Connection):
+        """
+        Registers the pgvector types on a connection. Once the extension exists, pass it as
+        `ConnectionPool(..., configure=PGStore.configure)` to do so once per pooled connection.
+        """
+        register_vector(connection)
+
+    @contextmanager
+    def _cursor(self) -> Iterator[Cursor]:
+        if not isinstance(self.connection, ConnectionPool):
+            with self.connection.cursor() as cursor:
+                yield cursor
+            return
+
+        start = perf_counter()
+        with self.connection.connection() as connection:
+            self.pool_wait.observe(perf_counter() - start)
+            with connection.cursor() as cursor:
+                yield cursor
 
     def teardown(self):
-        with self.connection.cursor() as cursor:
+        with self._cursor() as cursor:
             cursor.execute(self._sql.table_drop())
+        self._partitions.clear()
 
-    def add(self, shots: list[Shot], vectors: list[Vector], namespace: str):
-        with self.connection.cursor() as cursor:
+    def add(
+        self,
+        shots: list[Shot],
+        vectors: list[Vector],
+        namespace: str,
+        hashes: list[str] | None = None,
+    ):
+        self._ensure_partition(namespace)
+        if len(shots) >= self.copy_threshold:
+            return self._copy(shots, vectors, namespace, hashes)
+
+        with self._cursor() as cursor:
             cursor.executemany(
                 self._sql.upsert(),
-                self._sql.upsert_shots(shots, vectors, namespace),
+                self._sql.upsert_shots(shots, vectors, namespace, hashes),
             )
 
-    def get(self, ids: list[str], _namespace: str) -> list[Shot]:
-        with self.connection.cursor() as cursor:
-            cursor.execute(self._sql.select(), (ids,))
+    def _ensure_partition(self, namespace: str):
+        if not self._sql.partitioned or namespace in self._partitions:
+            return
+        with self._cursor() as cursor:
+            cursor.execute(self._sql.partition_create(namespace))
+        self._partitions.add(namespace)
+
+    def _copy(
+        self,
+        shots: list[Shot],
+        vectors: list[Vector],
+        namespace: str,
+        hashes: list[str] | None,
+    ):
+        with self._cursor() as cursor:
+            if cursor.connection.adapters.types.get("vector") is None:
+                register_vector(cursor.connection)
+            cursor.execute(self._sql.staging_create())
+            cursor.execute(self._sql.staging_truncate())
+            with cursor.copy(self._sql.staging_copy()) as copy:
+                copy.set_types(self._sql.staging_copy_types())
+                for row in self._sql.copy_rows(shots, vectors, namespace, hashes):
+                    copy.write_row(row)
+            cursor.execute(self._sql.staging_merge())
+
+    def get(self, ids: list[str], namespace: str) -> list[Shot]:
+        with self._cursor() as cursor:
+            cursor.execute(self._sql.select(), (ids, namespace))
             return self._sql.select_shots(cursor.fetchall())
 
-    def remove(self, ids: list[str], _namespace: str):
-        with self.connection.cursor() as cursor:
-            cursor.execute(self._sql.remove(), (ids,))
+    def hashes(self, ids: list[str], namespace: str) -> dict[str, str]:
+        with self._cursor() as cursor:
+            cursor.execute(self._sql.select_hashes(), (ids, namespace))
+            return {str(id): hash for (id, hash) in cursor.fetchall()}
+
+    def remove(self, ids: list[str], namespace: str):
+        with self._cursor() as cursor:
+            cursor.execute(self._sql.remove(), (ids, namespace))
 
     def clear(self, namespace: str):
-        with self.connection.cursor() as cursor:
+        with self._cursor() as cursor:
             cursor.execute(self._sql.clear(), (namespace,))
 
-    def list(self, vector: Vector, namespace: str, limit: int) -> list[ScoredShot]:
-        with self.connection.cursor() as cursor:
+    def list(
+        self,
+        vector: Vector,
+        namespace: str,
+        limit: int,
+        search_params: SearchParams | None = None,
+    ) -> list[ScoredShot]:
+        with self._cursor() as cursor, self._search_settings(cursor, search_params):
             cursor.execute(self._sql.query(), (vector, namespace, limit))
             return self._sql.query_scored_shots(cursor.fetchall())
 
+    def list_many(
+        self,
+        vectors: list[Vector],
+        namespace: str,
+        limit: int,
+        search_params: SearchParams | None = None,
+    ) -> list[list[ScoredShot]]:
+        with self._cursor() as cursor, self._search_settings(cursor, search_params):
+            cursor.execute(
+                self._sql.query_many(),
+                (self._sql.vector_array(vectors), namespace, limit),
+            )
+            return self._sql.query_many_scored_shots(len(vectors), cursor.fetchall())
+
+    @contextmanager
+    def _search_settings(self, cursor: Cursor, search_params: SearchParams | None):
+        settings = self._sql.search_settings(search_params)
+        if not settings:
+            yield
+            return
+
+        # Rolled back rather than committed so the settings never outlive the query
+        with cursor.connection.transaction(force_rollback=True):
+            for name, value in settings:
+                cursor.execute(self._sql.set_local(), (name, value))
+            yield
+
 
 class AsyncPGStore(Store):
+    capabilities = StoreCapabilities(content_hashes=True)
+
     _sql: "SQLHelper"
-    connection: AsyncConnection
+    connection: AsyncConnection | AsyncConnectionPool
+    copy_threshold: int
+    pool_wait: LatencyStats
 
     def __init__(
         self,
-        connection: AsyncConnection[TupleRow],
+        connection: AsyncConnection[TupleRow] | AsyncConnectionPool,
         tablename: str,
         schema: str = "public",
         distance: DistanceType = "cosine",
+        copy_threshold: int = 1000,
+        partitioned: bool = False,
     ):
-        self._sql = SQLHelper(tablename, schema, distance)
+        """
+        Args:
+            connection: Connection to the database, or a pool to run queries in parallel on
+            tablename: Name of the table to store shots in
+            schema: Schema of the table
+            distance: Distance metric used for similarity search
+            copy_threshold: Batches of at least this many shots are upserted with a binary COPY
+                into a staging table instead of one INSERT per shot
+            partitioned: LIST-partition the table by namespace, keyed on (namespace, id),
+                so each namespace gets its own vector index and queries only search it
+        """
+        self._sql = SQLHelper(tablename, schema, distance, partitioned)
+        self._partitions: set[str] = set()
         self.connection = connection
+        self.copy_threshold = copy_threshold
+        self.pool_wait = LatencyStats()
+        if isinstance(connection, AsyncConnectionPool):
+            # Each write checks out its own connection
+            self.capabilities = StoreCapabilities(content_hashes=True, concurrent_writes=True)
 
-    async def setup(self, dimensions: int, m: int = 64, ef_construction: int = 128):
+    async def setup(
+        self,
+        dimensions: int,
+        m: int = 64,
+        ef_construction: int = 128,
+        defer_index: bool = False,
+    ):
         """
         Sets up the database table and index for vector similarity search.
         Idempotent, will not re-create the table if it already exists.
         Will use DiskANN as an index if available, HNSW otherwise.
+        With `defer_index`, only the table is created and `build_index` is called after loading.
         """
-        async with self.connection.cursor() as cursor:
+        async with self._cursor() as cursor:
             await cursor.execute(self._sql.pgvector_create())
             await cursor.execute(self._sql.table_create(dimensions))
 
-            await cursor.execute(self._sql.diskann_check())
-            if await cursor.fetchone():
+            if not defer_index:
+                await cursor.execute(self._sql.diskann_check())
+                if await cursor.fetchone():
+                    await cursor.execute(self._sql.diskann_index())
+                else:
+                    await cursor.execute(self._sql.pgvector_index(m, ef_construction))
+
+            await register_vector_async(cursor.connection)
+
+    async def build_index(
+        self,
+        index: IndexType = "auto",
+        m: int = 64,
+        ef_construction: int = 128,
+        lists: int | None = None,
+        maintenance_work_mem: str = "1GB",
+        max_parallel_maintenance_workers: int = 7,
+    ):
+        """
+        Builds the vector index over the rows already loaded, after `setup(defer_index=True)`.
+        See `PGStore.build_index`.
+        """
+        async with self._cursor() as cursor, cursor.connection.transaction():
+            await cursor.execute(
+                self._sql.set_local(), ("maintenance_work_mem", maintenance_work_mem)
+            )
+            await cursor.execute(
+                self._sql.set_local(),
+                ("max_parallel_maintenance_workers", str(max_parallel_maintenance_workers)),
+            )
+
+            if index == "auto":
+                await cursor.execute(self._sql.diskann_check())
+                index = "diskann" if await cursor.fetchone() else "hnsw"
+
+            if index == "diskann":
                 await cursor.execute(self._sql.diskann_index())
+            elif index == "ivfflat":
+                if lists is None:
+                    await cursor.execute(self._sql.row_count())
+                    lists = SQLHelper.ivfflat_lists((await cursor.fetchone())[0])
+                await cursor.execute(self._sql.ivfflat_index(lists))
             else:
                 await cursor.execute(self._sql.pgvector_index(m, ef_construction))
 
-        await register_vector_async(self.connection)
+    @staticmethod
+    async def configure(connection: AsyncConnection):
+        """
+        Registers the pgvector types on a connection. Once the extension exists, pass it as
+        `AsyncConnectionPool(..., configure=AsyncPGStore.configure)` to do so once per pooled
+        connection.
+        """
+        await register_vector_async(connection)
+
+    @asynccontextmanager
+    async def _cursor(self) -> AsyncIterator[AsyncCursor]:
+        if not isinstance(self.connection, AsyncConnectionPool):
+            async with self.connection.cursor() as cursor:
+                yield cursor
+            return
+
+        start = perf_counter()
+        async with self.connection.connection() as connection:
+            self.pool_wait.observe(perf_counter() - start)
+            async with connection.cursor() as cursor:
+                yield cursor
 
     async def teardown(self):
-        async with self.connection.cursor() as cursor:
+        async with self._cursor() as cursor:
             await cursor.execute(self._sql.table_drop())
+        self._partitions.clear()
 
-    async def add(self, shots: list[Shot], vectors: list[Vector], namespace: str):
-        async with self.connection.cursor() as cursor:
+    async def add(
+        self,
+        shots: list[Shot],
+        vectors: list[Vector],
+        namespace: str,
+        hashes: list[str] | None = None,
+    ):
+        await self._ensure_partition(namespace)
+        if len(shots) >= self.copy_threshold:
+            return await self._copy(shots, vectors, namespace, hashes)
+
+        async with self._cursor() as cursor:
             await cursor.executemany(
                 self._sql.upsert(),
-                self._sql.upsert_shots(shots, vectors, namespace),
+                self._sql.upsert_shots(shots, vectors, namespace, hashes),
             )
 
-    async def get(self, ids: list[str], _namespace: str) -> list[Shot]:
-        async with self.connection.cursor() as cursor:
-            await cursor.execute(self._sql.select(), (ids,))
+    async def _ensure_partition(self, namespace: str):
+        if not self._sql.partitioned or namespace in self._partitions:
+            return
+        async with self._cursor() as cursor:
+            await cursor.execute(self._sql.partition_create(namespace))
+        self._partitions.add(namespace)
+
+    async def _copy(
+        self,
+        shots: list[Shot],
+        vectors: list[Vector],
+        namespace: str,
+        hashes: list[str] | None,
+    ):
+        async with self._cursor() as cursor:
+            if cursor.connection.adapters.types.get("vector") is None:
+                await register_vector_async(cursor.connection)
+            await cursor.execute(self._sql.staging_create())
+            await cursor.execute(self._sql.staging_truncate())
+            async with cursor.copy(self._sql.staging_copy()) as copy:
+                copy.set_types(self._sql.staging_copy_types())
+                for row in self._sql.copy_rows(shots, vectors, namespace, hashes):
+                    await copy.write_row(row)
+            await cursor.execute(self._sql.staging_merge())
+
+    async def get(self, ids: list[str], namespace: str) -> list[Shot]:
+        async with self._cursor() as cursor:
+            await cursor.execute(self._sql.select(), (ids, namespace))
             return self._sql.select_shots(await cursor.fetchall())
 
-    async def remove(self, ids: list[str], _namespace: str):
-        async with self.connection.cursor() as cursor:
-            await cursor.execute(self._sql.remove(), (ids,))
+    async def hashes(self, ids: list[str], namespace: str) -> dict[str, str]:
+        async with self._cursor() as cursor:
+            await cursor.execute(self._sql.select_hashes(), (ids, namespace))
+            return {str(id): hash for (id, hash) in await cursor.fetchall()}
+
+    async def remove(self, ids: list[str], namespace: str):
+        async with self._cursor() as cursor:
+            await cursor.execute(self._sql.remove(), (ids, namespace))
 
     async def clear(self, namespace: str):
-        async with self.connection.cursor() as cursor:
+        async with self._cursor() as cursor:
             await cursor.execute(self._sql.clear(), (namespace,))
 
     async def list(
@@ -147,32 +456,88 @@ class AsyncPGStore(Store):
         vector: Vector,
         namespace: str,
         limit: int,
+        search_params: SearchParams | None = None,
     ) -> list[ScoredShot]:
-        async with self.connection.cursor() as cursor:
+        async with self._cursor() as cursor, self._search_settings(cursor, search_params):
             await cursor.execute(self._sql.query(), (vector, namespace, limit))
             return self._sql.query_scored_shots(await cursor.fetchall())
 
+    async def list_many(
+        self,
+        vectors: list[Vector],
+        namespace: str,
+        limit: int,
+        search_params: SearchParams | None = None,
+    ) -> list[list[ScoredShot]]:
+        async with self._cursor() as cursor, self._search_settings(cursor, search_params):
+            await cursor.execute(
+                self._sql.query_many(),
+                (self._sql.vector_array(vectors), namespace, limit),
+            )
+            return self._sql.query_many_scored_shots(len(vectors), await cursor.fetchall())
+
+    @asynccontextmanager
+    async def _search_settings(self, cursor: AsyncCursor, search_params: SearchParams | None):
+        settings = self._sql.search_settings(search_params)
+        if not settings:
+            yield
+            return
+
+        # Rolled back rather than committed so the settings never outlive the query
+        async with cursor.connection.transaction(force_rollback=True):
+            for name, value in settings:
+                await cursor.execute(self._sql.set_local(), (name, value))
+            yield
+
 
 class SQLHelper:
     tablename: str
     schema: str
     distance: DistanceType
+    partitioned: bool
+
+    operators = {"cosine": "<=>", "l2": "<->", "ip": "<#>"}
 
     def __init__(
         self,
         tablename: str,
         schema: str = "public",
         distance: DistanceType = "cosine",
+        partitioned: bool = False,
     ):
         self.tablename = tablename
         self.schema = schema
         self.distance = distance
+        self.partitioned = partitioned
+
+    @property
+    def operator(self) -> str:
+        """
+        The distance operator matching the index's operator class, so ORDER BY can use the index.
+        """
+        return self.operators[self.distance]
+
+    @property
+    def conflict_target(self) -> str:
+        return "(namespace, id)" if self.partitioned else "(id)"
 
     @staticmethod
     def utcnow():
         return "timezone('utc', now())"
 
     def table_create(self, vector_dimensions: int):
+        if self.partitioned:
+            return f"""\
+            CREATE TABLE IF NOT EXISTS {self.schema}.{self.tablename} (
+                id UUID NOT NULL,
+                namespace VARCHAR(256) NOT NULL,
+                payload JSONB NOT NULL,
+                vector VECTOR({vector_dimensions}) NOT NULL,
+                updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT {self.utcnow()},
+                PRIMARY KEY (namespace, id)
+            ) PARTITION BY LIST (namespace);
+            """
+
         return f"""\
         CREATE TABLE IF NOT EXISTS {self.schema}.{self.tablename} (
             id UUID PRIMARY KEY,
@@ -183,6 +548,18 @@ class SQLHelper:
         );
         """
 
+    def partition_create(self, namespace: str):
+        """
+        The partition inherits the parent table's indexes, giving the namespace its own.
+        """
+        suffix = md5(namespace.encode()).hexdigest()[:16]
+        literal = namespace.replace("'", "''")
+        return f"""\
+        CREATE TABLE IF NOT EXISTS {self.schema}.{self.tablename}_{suffix}
+        PARTITION OF {self.schema}.{self.tablename}
+        FOR VALUES IN ('{literal}');
+        """
+
     def table_drop(self):
         return f"DROP TABLE IF EXISTS {self.schema}.{self.tablename};"
 
@@ -202,6 +579,54 @@ class SQLHelper:
         WITH (m = {m}, ef_construction = {ef_construction});
         """
 
+    def ivfflat_index(self, lists: int):
+        return f"""\
+        CREATE INDEX IF NOT EXISTS index_{self.tablename}_vector
+        ON {self.schema}.{self.tablename}
+        USING ivfflat (vector vector_{self.distance}_ops)
+        WITH (lists = {lists});
+        """
+
+    @staticmethod
+    def ivfflat_lists(rows: int) -> int:
+        """
+        pgvector's recommendation: rows / 1000 up to 1M rows, sqrt(rows) beyond.
+        """
+        return max(rows // 1000 if rows <= 1_000_000 else isqrt(rows), 1)
+
+    def row_count(self):
+        return f"SELECT count(*) FROM {self.schema}.{self.tablename};"
+
+    @staticmethod
+    def search_settings(search_params: SearchParams | None) -> list[tuple[str, str]]:
+        """
+        The `SET LOCAL` settings that apply `search_params` to a query. Both index types get
+        `iterative_scan`, as the query doesn't know which one the table has, and IVFFlat,
+        which has no strict order, scans in relaxed order instead.
+        """
+        if search_params is None:
+            return []
+
+        settings = []
+        if search_params.ef is not None:
+            settings.append(("hnsw.ef_search", str(search_params.ef)))
+        if search_params.nprobe is not None:
+            settings.append(("ivfflat.probes", str(search_params.nprobe)))
+        if search_params.iterative_scan is not None:
+            settings.append(("hnsw.iterative_scan", search_params.iterative_scan))
+            settings.append(("ivfflat.iterative_scan", "relaxed_order"))
+        if search_params.exact:
+            # Vector indexes are only used through index scans, so this forces a sequential scan
+            settings.append(("enable_indexscan", "off"))
+        return settings
+
+    @staticmethod
+    def set_local():
+        """
+        Parameterizable `SET LOCAL`, reverted when the transaction ends.
+        """
+        return "SELECT set_config(%s, %s, true);"
+
     @staticmethod
     def diskann_check():
         return "SELECT * FROM pg_extension WHERE extname = 'vectorscale';"
@@ -214,14 +639,14 @@ class SQLHelper:
         return f"""\
         CREATE INDEX IF NOT EXISTS index_{self.tablename}_vector
         ON {self.schema}.{self.tablename}
-        USING DISKANN (vector);
+        USING DISKANN (vector vector_{self.distance}_ops);
         """
 
     def upsert(self):
         return f"""\
         INSERT INTO {self.schema}.{self.tablename} (id, namespace, payload, vector, updated_at)
         VALUES (%s, %s, %s, %s, {self.utcnow()})
-        ON CONFLICT (id) DO UPDATE SET
+        ON CONFLICT {self.conflict_target} DO UPDATE SET
             namespace = EXCLUDED.namespace,
             payload = EXCLUDED.payload,
             vector = EXCLUDED.vector,
@@ -233,23 +658,96 @@ class SQLHelper:
         shots: list[Shot],
         vectors: list[Vector],
         namespace: str,
+        hashes: list[str] | None = None,
     ) -> list[tuple[str, str, Jsonb, Vector]]:
         return [
-            (
-                shot.id,
-                namespace,
-                Jsonb({"inputs": shot.inputs, "outputs": shot.outputs}),
-                vector,
-            )
-            for shot, vector in zip(shots, vectors)
+            (shot.id, namespace, Jsonb(self.payload(shot, hash)), vector)
+            for shot, vector, hash in zip(shots, vectors, hashes or [None] * len(shots))
         ]
 
+    @staticmethod
+    def payload(shot: Shot, hash: str | None = None) -> dict:
+        """
+        The content hash is kept in the payload, so tables created before it need no migration.
+        """
+        payload = {"inputs": shot.inputs, "outputs": shot.outputs}
+        if hash is not None:
+            payload["hash"] = hash
+        return payload
+
+    def staging_table(self):
+        return f"{self.tablename}_staging"
+
+    def staging_create(self):
+        """
+        Session-local table that COPY streams rows into before they are merged.
+        """
+        return f"""\
+        CREATE TEMPORARY TABLE IF NOT EXISTS {self.staging_table()}
+        (LIKE {self.schema}.{self.tablename} INCLUDING DEFAULTS);
+        """
+
+    def staging_truncate(self):
+        return f"TRUNCATE {self.staging_table()};"
+
+    def staging_copy(self):
+        return f"""\
+        COPY {self.staging_table()} (id, namespace, payload, vector)
+        FROM STDIN (FORMAT BINARY);
+        """
+
+    @staticmethod
+    def staging_copy_types():
+        return ["uuid", "text", "jsonb", "vector"]
+
+    def staging_merge(self):
+        return f"""\
+        INSERT INTO {self.schema}.{self.tablename} (id, namespace, payload, vector, updated_at)
+        SELECT id, namespace, payload, vector, {self.utcnow()}
+        FROM {self.staging_table()}
+        ON CONFLICT {self.conflict_target} DO UPDATE SET
+            namespace = EXCLUDED.namespace,
+            payload = EXCLUDED.payload,
+            vector = EXCLUDED.vector,
+            updated_at = {self.utcnow()};
+        """
+
+    def copy_rows(
+        self,
+        shots: list[Shot],
+        vectors: list[Vector],
+        namespace: str,
+        hashes: list[str] | None = None,
+    ) -> list[tuple[UUID, str, Jsonb, Vector]]:
+        """
+        Rows for `staging_copy`. A single INSERT can only update a row once,
+        so only the last of several shots with the same id is kept.
+        """
+        rows = {
+            id: (UUID(id), namespace, payload, vector)
+            for (id, namespace, payload, vector) in self.upsert_shots(
+                shots, vectors, namespace, hashes
+            )
+        }
+        return list(rows.values())
+
     def select(self):
         return f"""\
         SELECT {self.tablename}.id,
                {self.tablename}.payload
         FROM {self.schema}.{self.tablename}
-        WHERE {self.tablename}.id = ANY(%s);
+        WHERE {self.tablename}.id = ANY(%s)
+          AND {self.tablename}.namespace = %s;
+        """
+
+    def select_hashes(self):
+        return f"""\
+        SELECT {self.tablename}.id,
+               {self.tablename}.payload->'hash'
+        FROM {self.schema}.{self.tablename}
+        WHERE {self.tablename}.id = ANY(%s)
+          AND {self.tablename}.namespace = %s
+          AND {self.tablename}.payload ? 'hash';
         """
 
     def select_shots(self, tuples: list[tuple[UUID, dict]]) -> list[Shot]:
@@ -259,7 +757,7 @@ class SQLHelper:
         return f"""\
         SELECT {self.tablename}.id,
                {self.tablename}.payload,
-               {self.tablename}.vector <-> %s::vector AS distance
+               {self.tablename}.vector {self.operator} %s::vector AS distance
         FROM {self.schema}.{self.tablename}
         WHERE {self.tablename}.namespace = %s
         ORDER BY distance ASC
@@ -278,8 +776,49 @@ class SQLHelper:
             for (id, payload, distance) in tuples
         ]
 
+    def query_many(self):
+        """
+        Runs one LIMIT-ed nearest neighbour query per vector in a single round trip.
+        """
+        return f"""\
+        SELECT queries.ordinality,
+               matches.id,
+               matches.payload,
+               matches.distance
+        FROM unnest(%s::vector[]) WITH ORDINALITY AS queries (vector, ordinality)
+        CROSS JOIN LATERAL (
+            SELECT {self.tablename}.id,
+                   {self.tablename}.payload,
+                   {self.tablename}.vector {self.operator} queries.vector AS distance
+            FROM {self.schema}.{self.tablename}
+            WHERE {self.tablename}.namespace = %s
+            ORDER BY distance ASC
+            LIMIT %s
+        ) AS matches
+        ORDER BY queries.ordinality ASC, matches.distance ASC;
+        """
+
+    @staticmethod
+    def vector_array(vectors: list[Vector]) -> list[str]:
+        """
+        Text representation of the vectors, cast to `vector[]` by the query.
+        """
+        return [ujson.dumps(as_floats(vector)) for vector in vectors]
+
+    def query_many_scored_shots(
+        self,
+        num_queries: int,
+        tuples: list[tuple[int, UUID, dict, float]],
+    ) -> list[list[ScoredShot]]:
+        results: list[list[ScoredShot]] = [[] for _ in range(num_queries)]
+        for ordinality, id, payload, distance in tuples:
+            results[ordinality - 1].append(
+                ScoredShot(distance, Shot(payload["inputs"], payload["outputs"], str(id)))
+            )
+        return results
+
     def remove(self):
-        return f"DELETE FROM {self.schema}.{self.tablename} WHERE id = ANY(%s)"
+        return f"DELETE FROM {self.schema}.{self.tablename} WHERE id = ANY(%s) AND namespace = %s"
 
     def clear(self):
         return f"DELETE FROM {self.schema}.{self.tablename} WHERE namespace = %s"
@@ -1,7 +1,11 @@
-from typing import List
+from typing import Iterator, List, Literal, TypeVar
 
+from asyncer import asyncify
 from qdrant_client import QdrantClient, AsyncQdrantClient
 from qdrant_client.models import (
+    BinaryQuantization,
+    BinaryQuantizationConfig,
+    CompressionRatio,
     Distance,
     FieldCondition,
     Filter,
@@ -10,37 +14,124 @@ from qdrant_client.models import (
     KeywordIndexParams,
     MatchValue,
     PointStruct,
+    ProductQuantization,
+    ProductQuantizationConfig,
+    QuantizationConfig,
+    QuantizationSearchParams,
+    QueryRequest,
+    QueryResponse,
     Record,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
     ScoredPoint,
+    SearchParams as QdrantSearchParams,
     VectorParams,
 )
 from sorcery import dict_of
 
 from few_shots.types import (
-    dump_io_value,
-    parse_io_value,
+    encode_io_value,
+    LazyShot,
     ScoredShot,
+    SearchParams,
     Shot,
     Vector,
 )
 from few_shots.utils.datetime import utcnow
 
-from .base import AsyncStore, Store
+from .base import AsyncStore, Store, StoreCapabilities
 
-__all__ = ["QdrantStore", "AsyncQdrantStore", "Distance"]
+__all__ = ["QdrantStore", "AsyncQdrantStore", "Distance", "QuantizationType"]
+
+
+QuantizationType = TypeVar("QuantizationType", bound=Literal["scalar", "binary", "product"])
 
 
 class QdrantStore(Store):
+    capabilities = StoreCapabilities(content_hashes=True)
+
     client: QdrantClient
     collection_name: str
+    upload_threshold: int
+    batch_size: int
+    parallel: int
 
-    def __init__(self, client: QdrantClient, collection_name: str):
+    def __init__(
+        self,
+        client: QdrantClient,
+        collection_name: str,
+        upload_threshold: int = 1000,
+        batch_size: int = 256,
+        parallel: int = 1,
+    ):
+        """
+        Args:
+            client: The Qdrant client
+            collection_name: The collection to store shots in
+            upload_threshold: Batches of at least this many shots are sent with `upload_points`
+                in `batch_size` chunks instead of a single upsert request
+            batch_size: Points per request when uploading
+            parallel: Worker processes used when uploading, requires a remote client
+        """
         self.client = client
         self.collection_name = collection_name
+        self.upload_threshold = upload_threshold
+        self.batch_size = batch_size
+        self.parallel = parallel
+
+    @classmethod
+    def from_url(
+        cls,
+        url: str,
+        collection_name: str,
+        prefer_grpc: bool = True,
+        **kwargs,
+    ) -> "QdrantStore":
+        """
+        Connects to a Qdrant server, over gRPC by default, which is considerably faster than
+        REST for uploads and queries. Remaining kwargs go to the store, or to the client if the
+        store does not take them.
+        """
+        store_kwargs = {
+            key: kwargs.pop(key)
+            for key in ("upload_threshold", "batch_size", "parallel")
+            if key in kwargs
+        }
+        client = QdrantClient(url=url, prefer_grpc=prefer_grpc, **kwargs)
+        return cls(client, collection_name, **store_kwargs)
 
-    def setup(self, size: int, distance: Distance, payload_m: int = 16):
+    def setup(
+        self,
+        size: int,
+        distance: Distance,
+        payload_m: int = 16,
+        quantization: QuantizationType | QuantizationConfig | None = None,
+        always_ram: bool = True,
+        on_disk: bool = False,
+    ):
+        """
+        Creates the collection and its namespace index.
+
+        Args:
+            size: The number of dimensions in the vectors to be stored
+            distance: The distance metric
+            payload_m: Connections per element in the per-namespace HNSW graphs
+            quantization: "scalar" (int8, 4x smaller), "binary" (32x) or "product" (16x)
+                quantization, or a Qdrant quantization config
+            always_ram: Keep the quantized vectors in RAM
+            on_disk: Store the original vectors on disk, only read to rescore
+        """
         self.client.create_collection(
-            **QdrantHelper.create_collection(self.collection_name, size, distance, payload_m)
+            **QdrantHelper.create_collection(
+                self.collection_name,
+                size,
+                distance,
+                payload_m,
+                quantization,
+                always_ram,
+                on_disk,
+            )
         )
         self.client.create_payload_index(
             **QdrantHelper.create_payload_index(self.collection_name),
@@ -49,10 +140,56 @@ class QdrantStore(Store):
     def teardown(self):
         self.client.delete_collection(self.collection_name)
 
-    def add(self, shots: List[Shot], vectors: List[Vector], namespace: str):
+    def add(
+        self,
+        shots: List[Shot],
+        vectors: List[Vector],
+        namespace: str,
+        hashes: List[str] | None = None,
+    ):
+        if len(shots) >= self.upload_threshold:
+            return self._upload(shots, vectors, namespace, True, hashes)
+
         self.client.upsert(
             collection_name=self.collection_name,
-            points=QdrantHelper.upsert_points(shots, vectors, namespace),
+            points=QdrantHelper.upsert_points(shots, vectors, namespace, hashes),
+        )
+
+    def upload(
+        self,
+        shots: List[Shot],
+        vectors: List[Vector],
+        namespace: str,
+        wait: bool = False,
+        hashes: List[str] | None = None,
+    ):
+        """
+        Bulk upload for (re-)indexing: points are streamed in `batch_size` chunks across
+        `parallel` workers, and by default without waiting for each batch to be applied.
+
+        Args:
+            shots: Shots to upload
+            vectors: Vectors of the shots
+            namespace: Namespace to upload the shots to
+            wait: Wait for each batch to be persisted before sending the next one
+            hashes: Content hashes of the shots
+        """
+        self._upload(shots, vectors, namespace, wait, hashes)
+
+    def _upload(
+        self,
+        shots: List[Shot],
+        vectors: List[Vector],
+        namespace: str,
+        wait: bool,
+        hashes: List[str] | None = None,
+    ):
+        self.client.upload_points(
+            collection_name=self.collection_name,
+            points=QdrantHelper.points(shots, vectors, namespace, hashes),
+            batch_size=self.batch_size,
+            parallel=self.parallel,
+            wait=wait,
         )
 
     def get(self, ids: List[str], _namespace: str) -> List[Shot]:
@@ -60,6 +197,12 @@ class QdrantStore(Store):
             self.client.retrieve(collection_name=self.collection_name, ids=ids)
         )
 
+    def hashes(self, ids: List[str], namespace: str) -> dict[str, str]:
+        return QdrantHelper.retrieve_hashes(
+            self.client.retrieve(collection_name=self.collection_name, **QdrantHelper.hashes(ids)),
+            namespace,
+        )
+
     def remove(self, ids: List[str], namespace: str):
         self.client.delete(
             collection_name=self.collection_name,
@@ -72,27 +215,108 @@ class QdrantStore(Store):
             points_selector=QdrantHelper.selector(namespace),
         )
 
-    def list(self, vector: Vector, namespace: str, limit: int) -> List[ScoredShot]:
-        results = self.client.search(
-            collection_name=namespace,
-            query_vector=vector,
-            query_filter=QdrantHelper.selector(namespace),
-            limit=limit,
+    def list(
+        self,
+        vector: Vector,
+        namespace: str,
+        limit: int,
+        search_params: SearchParams | None = None,
+    ) -> List[ScoredShot]:
+        response = self.client.query_points(
+            collection_name=self.collection_name,
+            **QdrantHelper.query(vector, namespace, limit, search_params),
+        )
+        return QdrantHelper.search_scored_shots(response.points)
+
+    def list_many(
+        self,
+        vectors: List[Vector],
+        namespace: str,
+        limit: int,
+        search_params: SearchParams | None = None,
+    ) -> List[List[ScoredShot]]:
+        responses = self.client.query_batch_points(
+            collection_name=self.collection_name,
+            requests=QdrantHelper.query_requests(vectors, namespace, limit, search_params),
         )
-        return QdrantHelper.search_scored_shots(results)
+        return QdrantHelper.batch_scored_shots(responses)
 
 
 class AsyncQdrantStore(AsyncStore):
+    capabilities = StoreCapabilities(content_hashes=True)
+
     client: AsyncQdrantClient
     collection_name: str
+    upload_threshold: int
+    batch_size: int
+    parallel: int
 
-    def __init__(self, client: AsyncQdrantClient, collection_name: str):
+    def __init__(
+        self,
+        client: AsyncQdrantClient,
+        collection_name: str,
+        upload_threshold: int = 1000,
+        batch_size: int = 256,
+        parallel: int = 1,
+    ):
+        """
+        Args:
+            client: The Qdrant client
+            collection_name: The collection to store shots in
+            upload_threshold: Batches of at least this many shots are sent with `upload_points`
+                in `batch_size` chunks instead of a single upsert request
+            batch_size: Points per request when uploading
+            parallel: Worker processes used when uploading, requires a remote client
+        """
         self.client = client
         self.collection_name = collection_name
+        self.upload_threshold = upload_threshold
+        self.batch_size = batch_size
+        self.parallel = parallel
+
+    @classmethod
+    def from_url(
+        cls,
+        url: str,
+        collection_name: str,
+        prefer_grpc: bool = True,
+        **kwargs,
+    ) -> "AsyncQdrantStore":
+        """
+        Connects to a Qdrant server, over gRPC by default, which is considerably faster than
+        REST for uploads and queries. Remaining kwargs go to the store, or to the client if the
+        store does not take them.
+        """
+        store_kwargs = {
+            key: kwargs.pop(key)
+            for key in ("upload_threshold", "batch_size", "parallel")
+            if key in kwargs
+        }
+        client = AsyncQdrantClient(url=url, prefer_grpc=prefer_grpc, **kwargs)
+        return cls(client, collection_name, **store_kwargs)
 
-    async def setup(self, size: int, distance: Distance, payload_m: int = 16):
+    async def setup(
+        self,
+        size: int,
+        distance: Distance,
+        payload_m: int = 16,
+        quantization: QuantizationType | QuantizationConfig | None = None,
+        always_ram: bool = True,
+        on_disk: bool = False,
+    ):
+        """
+        Creates the collection and its namespace index. See `QdrantStore.setup`.
+        """
         await self.client.create_collection(
-            **QdrantHelper.create_collection(self.collection_name, size, distance, payload_m)
+            **QdrantHelper.create_collection(
+                self.collection_name,
+                size,
+                distance,
+                payload_m,
+                quantization,
+                always_ram,
+                on_disk,
+            )
         )
         await self.client.create_payload_index(
             **QdrantHelper.create_payload_index(self.collection_name),
@@ -101,10 +325,56 @@ class AsyncQdrantStore(AsyncStore):
     async def teardown(self):
         await self.client.delete_collection(self.collection_name)
 
-    async def add(self, shots: List[Shot], vectors: List[Vector], namespace: str):
+    async def add(
+        self,
+        shots: List[Shot],
+        vectors: List[Vector],
+        namespace: str,
+        hashes: List[str] | None = None,
+    ):
+        if len(shots) >= self.upload_threshold:
+            return await self._upload(shots, vectors, namespace, True, hashes)
+
         await self.client.upsert(
-            collection_name=namespace,
-            points=QdrantHelper.upsert_points(shots, vectors, namespace),
+            collection_name=self.collection_name,
+            points=QdrantHelper.upsert_points(shots, vectors, namespace, hashes),
+        )
+
+    async def upload(
+        self,
+        shots: List[Shot],
+        vectors: List[Vector],
+        namespace: str,
+        wait: bool = False,
+        hashes: List[str] | None = None,
+    ):
+        """
+        Bulk upload for (re-)indexing: points are streamed in `batch_size` chunks across
+        `parallel` workers, and by default without waiting for each batch to be applied.
+
+        Args:
+            shots: Shots to upload
+            vectors: Vectors of the shots
+            namespace: Namespace to upload the shots to
+            wait: Wait for each batch to be persisted before sending the next one
+            hashes: Content hashes of the shots
+        """
+        await self._upload(shots, vectors, namespace, wait, hashes)
+
+    async def _upload(
+        self,
+        shots: List[Shot],
+        vectors: List[Vector],
+        namespace: str,
+        wait: bool,
+        hashes: List[str] | None = None,
+    ):
+        await asyncify(self.client.upload_points)(
+            collection_name=self.collection_name,
+            points=QdrantHelper.points(shots, vectors, namespace, hashes),
+            batch_size=self.batch_size,
+            parallel=self.parallel,
+            wait=wait,
         )
 
     async def get(self, ids: List[str], _namespace: str) -> List[Shot]:
@@ -112,40 +382,100 @@ class AsyncQdrantStore(AsyncStore):
             await self.client.retrieve(collection_name=self.collection_name, ids=ids)
         )
 
+    async def hashes(self, ids: List[str], namespace: str) -> dict[str, str]:
+        return QdrantHelper.retrieve_hashes(
+            await self.client.retrieve(
+                collection_name=self.collection_name, **QdrantHelper.hashes(ids)
+            ),
+            namespace,
+        )
+
     async def remove(self, ids: List[str], namespace: str):
         await self.client.delete(
-            collection_name=namespace,
+            collection_name=self.collection_name,
             points_selector=QdrantHelper.selector(namespace, ids),
         )
 
     async def clear(self, namespace: str):
         await self.client.delete(
-            collection_name=namespace,
+            collection_name=self.collection_name,
             points_selector=QdrantHelper.selector(namespace),
         )
 
-    async def list(self, vector: Vector, namespace: str, limit: int) -> List[ScoredShot]:
-        results = await self.client.search(
-            collection_name=namespace,
-            query_vector=vector,
-            query_filter=QdrantHelper.selector(namespace),
-            limit=limit,
+    async def list(
+        self,
+        vector: Vector,
+        namespace: str,
+        limit: int,
+        search_params: SearchParams | None = None,
+    ) -> List[ScoredShot]:
+        response = await self.client.query_points(
+            collection_name=self.collection_name,
+            **QdrantHelper.query(vector, namespace, limit, search_params),
+        )
+        return QdrantHelper.search_scored_shots(response.points)
+
+    async def list_many(
+        self,
+        vectors: List[Vector],
+        namespace: str,
+        limit: int,
+        search_params: SearchParams | None = None,
+    ) -> List[List[ScoredShot]]:
+        responses = await self.client.query_batch_points(
+            collection_name=self.collection_name,
+            requests=QdrantHelper.query_requests(vectors, namespace, limit, search_params),
         )
-        return QdrantHelper.search_scored_shots(results)
+        return QdrantHelper.batch_scored_shots(responses)
 
 
 class QdrantHelper:
     @staticmethod
-    def create_collection(collection_name: str, size: int, distance: Distance, payload_m: int = 16):
+    def create_collection(
+        collection_name: str,
+        size: int,
+        distance: Distance,
+        payload_m: int = 16,
+        quantization: QuantizationType | QuantizationConfig | None = None,
+        always_ram: bool = True,
+        on_disk: bool = False,
+    ):
         """
         Use these as kwargs for `.create_collection` for optimal performance.
         """
         return dict(
             collection_name=collection_name,
-            vectors_config=VectorParams(size=size, distance=distance),
+            vectors_config=VectorParams(size=size, distance=distance, on_disk=on_disk),
             hnsw_config=HnswConfigDiff(payload_m=payload_m, m=0),
+            quantization_config=QdrantHelper.quantization_config(quantization, always_ram),
         )
 
+    @staticmethod
+    def quantization_config(
+        quantization: QuantizationType | QuantizationConfig | None,
+        always_ram: bool = True,
+    ) -> QuantizationConfig | None:
+        if quantization is None or not isinstance(quantization, str):
+            return quantization
+        if quantization == "scalar":
+            return ScalarQuantization(
+                scalar=ScalarQuantizationConfig(
+                    type=ScalarType.INT8,
+                    quantile=0.99,
+                    always_ram=always_ram,
+                )
+            )
+        if quantization == "binary":
+            return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=always_ram))
+        if quantization == "product":
+            return ProductQuantization(
+                product=ProductQuantizationConfig(
+                    compression=CompressionRatio.X16,
+                    always_ram=always_ram,
+                )
+            )
+        raise ValueError(f"Unknown quantization: {quantization}")
+
     @staticmethod
     def create_payload_index(collection_name: str):
         """
@@ -166,35 +496,116 @@ class QdrantHelper:
         )
         return Filter(must=[cond])
 
+    @staticmethod
+    def search_params(search_params: SearchParams | None) -> QdrantSearchParams | None:
+        """
+        `ef` maps to `hnsw_ef` and `exact` to a full scan, Qdrant has no IVF or iterative scan.
+        `oversampling` and `rescore` apply to quantized collections.
+        """
+        if search_params is None:
+            return None
+
+        quantization = None
+        if search_params.oversampling is not None or search_params.rescore is not None:
+            quantization = QuantizationSearchParams(
+                oversampling=search_params.oversampling,
+                rescore=search_params.rescore,
+            )
+
+        return QdrantSearchParams(
+            hnsw_ef=search_params.ef,
+            exact=search_params.exact,
+            quantization=quantization,
+        )
+
+    @staticmethod
+    def query(
+        vector: Vector,
+        namespace: str,
+        limit: int,
+        search_params: SearchParams | None = None,
+    ) -> dict:
+        """
+        Use these as kwargs for `.query_points`.
+        """
+        return dict(
+            query=vector,
+            query_filter=QdrantHelper.selector(namespace),
+            search_params=QdrantHelper.search_params(search_params),
+            limit=limit,
+            with_payload=True,
+        )
+
+    @staticmethod
+    def query_requests(
+        vectors: List[Vector],
+        namespace: str,
+        limit: int,
+        search_params: SearchParams | None = None,
+    ) -> List[QueryRequest]:
+        query_filter = QdrantHelper.selector(namespace)
+        params = QdrantHelper.search_params(search_params)
+        return [
+            QueryRequest(
+                query=vector,
+                filter=query_filter,
+                params=params,
+                limit=limit,
+                with_payload=True,
+            )
+            for vector in vectors
+        ]
+
     @staticmethod
     def upsert_points(
         shots: List[Shot],
         vectors: List[Vector],
         namespace: str,
+        hashes: List[str] | None = None,
     ) -> List[PointStruct]:
+        return list(QdrantHelper.points(shots, vectors, namespace, hashes))
+
+    @staticmethod
+    def points(
+        shots: List[Shot],
+        vectors: List[Vector],
+        namespace: str,
+        hashes: List[str] | None = None,
+    ) -> Iterator[PointStruct]:
+        """
+        Lazily built points, so uploads only hold one batch of them at a time.
+        """
         updated_at = utcnow()
-        return [
-            PointStruct(
-                id=shot.id,
-                vector=vector,
-                payload=dict_of(
-                    namespace,
-                    updated_at,
-                    inputs=dump_io_value(shot.inputs),
-                    outputs=dump_io_value(shot.outputs),
-                ),
+        for shot, vector, hash in zip(shots, vectors, hashes or [None] * len(shots)):
+            payload = dict_of(
+                namespace,
+                updated_at,
+                inputs=encode_io_value(shot.inputs),
+                outputs=encode_io_value(shot.outputs),
             )
-            for shot, vector in zip(shots, vectors)
-        ]
+            if hash is not None:
+                payload["hash"] = hash
+            yield PointStruct(id=shot.id, vector=vector, payload=payload)
+
+    @staticmethod
+    def hashes(ids: List[str]) -> dict:
+        """
+        Use these as kwargs for `.retrieve` to read only the content hashes.
+        """
+        return dict(ids=ids, with_payload=["namespace", "hash"], with_vectors=False)
+
+    @staticmethod
+    def retrieve_hashes(results: List[Record], namespace: str) -> dict[str, str]:
+        return {
+            str(result.id): result.payload["hash"]
+            for result in results
+            if result.payload.get("namespace") == namespace and "hash" in result.payload
+        }
 
     @staticmethod
     def retrieve_shots(results: List[Record]) -> list[Shot]:
         return [
-            Shot(
-                inputs=parse_io_value(result.payload["inputs"]),
-                outputs=parse_io_value(result.payload["outputs"]),
-                id=str(result.id),
-            )
+            LazyShot(result.payload["inputs"], result.payload["outputs"], str(result.id))
             for result in results
         ]
 
@@ -203,11 +614,11 @@ class QdrantHelper:
         return [
             ScoredShot(
                 result.score,
-                Shot(
-                    id=result.id,
-                    inputs=parse_io_value(result.payload["inputs"]),
-                    outputs=parse_io_value(result.payload["outputs"]),
-                ),
+                LazyShot(result.payload["inputs"], result.payload["outputs"], str(result.id)),
             )
             for result in results
         ]
+
+    @staticmethod
+    def batch_scored_shots(responses: List[QueryResponse]) -> List[List[ScoredShot]]:
+        return [QdrantHelper.search_scored_shots(response.points) for response in responses]
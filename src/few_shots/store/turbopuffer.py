@@ -1,12 +1,24 @@
+from __future__ import annotations
+
+import os
+from asyncio import gather
 from typing import Literal, TypeVar
+from urllib.parse import quote
 
-import turbopuffer as tpuf
+import httpx
 
-from few_shots.types import Shot, Vector, ScoredShot
-from few_shots.utils.asyncio import asyncify_class
+from few_shots.types import (
+    as_floats,
+    encode_io_value,
+    LazyShot,
+    ScoredShot,
+    SearchParams,
+    Shot,
+    Vector,
+)
 from few_shots.utils.datetime import utcnow
 
-from .base import Store
+from .base import AsyncStore, Store, StoreCapabilities
 
 __all__ = ["DistanceMetric", "TurboPufferStore", "AsyncTurboPufferStore"]
 
@@ -14,51 +26,290 @@ DistanceMetric = TypeVar("DistanceMetric", bound=Literal["cosine_distance", "euc
 
 
 class TurboPufferStore(Store):
+    # Fetching by id is a query, whose top_k is capped at 1200
+    capabilities = StoreCapabilities(max_ids=1200, batch_queries=False, content_hashes=True)
+    client: httpx.Client
     distance_metric: DistanceMetric
 
-    def __init__(self, distance_metric: DistanceMetric = "cosine_distance"):
+    def __init__(
+        self,
+        distance_metric: DistanceMetric = "cosine_distance",
+        client: httpx.Client | None = None,
+        api_key: str | None = None,
+        base_url: str | None = None,
+    ):
+        """
+        Args:
+            distance_metric: The distance metric of the namespaces' vector indexes
+            client: A pooled HTTP client with the base URL and API key set, created from
+                `api_key` and `base_url` if None
+            api_key: Defaults to the TURBOPUFFER_API_KEY environment variable
+            base_url: Defaults to the TURBOPUFFER_BASE_URL environment variable, then the
+                public API
+        """
         self.distance_metric = distance_metric
+        self.client = client or httpx.Client(**TurboPufferHelper.client_config(api_key, base_url))
 
-    def add(self, shots: list[Shot], vectors: list[Vector], namespace: str):
-        updated_at = utcnow()
-        tpuf.Namespace(namespace).upsert(
-            ids=[shot.id for shot in shots],
-            vectors=vectors,
-            attributes={
-                "inputs": [shot.input for shot in shots],
-                "outputs": [shot.output for shot in shots],
-                "updated_at": [updated_at for _ in shots],
-            },
+    def add(
+        self,
+        shots: list[Shot],
+        vectors: list[Vector],
+        namespace: str,
+        hashes: list[str] | None = None,
+    ):
+        response = self.client.post(
+            TurboPufferHelper.path(namespace),
+            json=TurboPufferHelper.upsert(shots, vectors, self.distance_metric, hashes),
         )
+        response.raise_for_status()
 
     def get(self, ids: list[str], namespace: str) -> list[Shot]:
-        raise NotImplementedError("TurboPuffer does not support get")
+        response = self.client.post(
+            TurboPufferHelper.query_path(namespace),
+            json=TurboPufferHelper.query_ids(ids),
+        )
+        return TurboPufferHelper.rows_to_shots(ids, TurboPufferHelper.rows(response))
+
+    def hashes(self, ids: list[str], namespace: str) -> dict[str, str]:
+        response = self.client.post(
+            TurboPufferHelper.query_path(namespace),
+            json=TurboPufferHelper.query_ids(ids, ["hash"]),
+        )
+        return TurboPufferHelper.rows_to_hashes(TurboPufferHelper.rows(response))
 
     def remove(self, ids: list[str], namespace: str):
-        tpuf.Namespace(namespace).delete(ids)
+        response = self.client.post(
+            TurboPufferHelper.path(namespace),
+            json=TurboPufferHelper.delete(ids),
+        )
+        response.raise_for_status()
 
     def clear(self, namespace: str):
-        tpuf.Namespace(namespace).delete_all()
-
-    def list(self, query_vector: Vector, namespace: str, limit: int):
-        vector_results = tpuf.Namespace(namespace).query(
-            vector=query_vector,
-            top_k=limit,
-            distance_metric=self.distance_metric,
-            include_attributes=["inputs", "outputs"],
+        TurboPufferHelper.raise_unless_missing(
+            self.client.delete(TurboPufferHelper.path(namespace))
+        )
+
+    def list(
+        self,
+        vector: Vector,
+        namespace: str,
+        limit: int,
+        _search_params: SearchParams | None = None,
+    ) -> list[ScoredShot]:
+        response = self.client.post(
+            TurboPufferHelper.query_path(namespace),
+            json=TurboPufferHelper.query(vector, limit, self.distance_metric),
+        )
+        return TurboPufferHelper.scored_shots(TurboPufferHelper.rows(response))
+
+    def list_many(
+        self,
+        vectors: list[Vector],
+        namespace: str,
+        limit: int,
+        _search_params: SearchParams | None = None,
+    ) -> list[list[ScoredShot]]:
+        """
+        TurboPuffer queries take one vector, so this runs one query per vector.
+        """
+        return [self.list(vector, namespace, limit) for vector in vectors]
+
+
+class AsyncTurboPufferStore(AsyncStore):
+    # Fetching by id is a query, whose top_k is capped at 1200
+    capabilities = StoreCapabilities(max_ids=1200, batch_queries=False, content_hashes=True)
+    client: httpx.AsyncClient
+    distance_metric: DistanceMetric
+
+    def __init__(
+        self,
+        distance_metric: DistanceMetric = "cosine_distance",
+        client: httpx.AsyncClient | None = None,
+        api_key: str | None = None,
+        base_url: str | None = None,
+    ):
+        """
+        Args:
+            distance_metric: The distance metric of the namespaces' vector indexes
+            client: A pooled HTTP client with the base URL and API key set, created from
+                `api_key` and `base_url` if None
+            api_key: Defaults to the TURBOPUFFER_API_KEY environment variable
+            base_url: Defaults to the TURBOPUFFER_BASE_URL environment variable, then the
+                public API
+        """
+        self.distance_metric = distance_metric
+        self.client = client or httpx.AsyncClient(
+            **TurboPufferHelper.client_config(api_key, base_url)
+        )
+
+    async def add(
+        self,
+        shots: list[Shot],
+        vectors: list[Vector],
+        namespace: str,
+        hashes: list[str] | None = None,
+    ):
+        response = await self.client.post(
+            TurboPufferHelper.path(namespace),
+            json=TurboPufferHelper.upsert(shots, vectors, self.distance_metric, hashes),
+        )
+        response.raise_for_status()
+
+    async def get(self, ids: list[str], namespace: str) -> list[Shot]:
+        response = await self.client.post(
+            TurboPufferHelper.query_path(namespace),
+            json=TurboPufferHelper.query_ids(ids),
+        )
+        return TurboPufferHelper.rows_to_shots(ids, TurboPufferHelper.rows(response))
+
+    async def hashes(self, ids: list[str], namespace: str) -> dict[str, str]:
+        response = await self.client.post(
+            TurboPufferHelper.query_path(namespace),
+            json=TurboPufferHelper.query_ids(ids, ["hash"]),
+        )
+        return TurboPufferHelper.rows_to_hashes(TurboPufferHelper.rows(response))
+
+    async def remove(self, ids: list[str], namespace: str):
+        response = await self.client.post(
+            TurboPufferHelper.path(namespace),
+            json=TurboPufferHelper.delete(ids),
+        )
+        response.raise_for_status()
+
+    async def clear(self, namespace: str):
+        TurboPufferHelper.raise_unless_missing(
+            await self.client.delete(TurboPufferHelper.path(namespace))
         )
-        return [
-            ScoredShot(
-                row.dist,
-                Shot(
-                    id=row.id,
-                    input=row.attributes["inputs"],
-                    output=row.attributes["outputs"],
-                ),
-            )
-            for row in vector_results
-        ]
-
-
-@asyncify_class
-class AsyncTurboPufferStore(TurboPufferStore): ...
+
+    async def list(
+        self,
+        vector: Vector,
+        namespace: str,
+        limit: int,
+        _search_params: SearchParams | None = None,
+    ) -> list[ScoredShot]:
+        response = await self.client.post(
+            TurboPufferHelper.query_path(namespace),
+            json=TurboPufferHelper.query(vector, limit, self.distance_metric),
+        )
+        return TurboPufferHelper.scored_shots(TurboPufferHelper.rows(response))
+
+    async def list_many(
+        self,
+        vectors: list[Vector],
+        namespace: str,
+        limit: int,
+        _search_params: SearchParams | None = None,
+    ) -> list[list[ScoredShot]]:
+        """
+        TurboPuffer queries take one vector, so this runs the queries concurrently.
+        """
+        return list(await gather(*(self.list(vector, namespace, limit) for vector in vectors)))
+
+
+class TurboPufferHelper:
+    @staticmethod
+    def client_config(api_key: str | None = None, base_url: str | None = None) -> dict:
+        """
+        Use these as kwargs for `httpx.Client` / `httpx.AsyncClient`.
+        """
+        api_key = api_key or os.environ.get("TURBOPUFFER_API_KEY")
+        if not api_key:
+            raise ValueError("Pass an api_key or set the TURBOPUFFER_API_KEY environment variable")
+        return dict(
+            base_url=base_url
+            or os.environ.get("TURBOPUFFER_BASE_URL", "https://api.turbopuffer.com"),
+            headers={"Authorization": f"Bearer {api_key}"},
+            timeout=30.0,
+        )
+
+    @staticmethod
+    def path(namespace: str) -> str:
+        return f"/v1/vectors/{quote(namespace, safe='')}"
+
+    @staticmethod
+    def query_path(namespace: str) -> str:
+        return f"{TurboPufferHelper.path(namespace)}/query"
+
+    @staticmethod
+    def upsert(
+        shots: list[Shot],
+        vectors: list[Vector],
+        distance_metric: DistanceMetric,
+        hashes: list[str] | None = None,
+    ) -> dict:
+        updated_at = utcnow()
+        attributes = {
+            "inputs": [encode_io_value(shot.inputs) for shot in shots],
+            "outputs": [encode_io_value(shot.outputs) for shot in shots],
+            "updated_at": [updated_at for _ in shots],
+        }
+        if hashes is not None:
+            attributes["hash"] = hashes
+        return {
+            "ids": [shot.id for shot in shots],
+            "vectors": [as_floats(vector) for vector in vectors],
+            "attributes": attributes,
+            "distance_metric": distance_metric,
+        }
+
+    @staticmethod
+    def delete(ids: list[str]) -> dict:
+        """
+        Upserting a null vector deletes the id.
+        """
+        return {"ids": ids, "vectors": [None for _ in ids]}
+
+    @staticmethod
+    def query(vector: Vector, limit: int, distance_metric: DistanceMetric) -> dict:
+        return {
+            "vector": as_floats(vector),
+            "top_k": limit,
+            "distance_metric": distance_metric,
+            "include_attributes": ["inputs", "outputs"],
+        }
+
+    @staticmethod
+    def query_ids(ids: list[str], attributes: list[str] | None = None) -> dict:
+        return {
+            "top_k": len(ids),
+            "filters": ["id", "In", ids],
+            "include_attributes": attributes or ["inputs", "outputs"],
+        }
+
+    @staticmethod
+    def raise_unless_missing(response: httpx.Response):
+        if response.status_code != 404:
+            response.raise_for_status()
+
+    @staticmethod
+    def rows(response: httpx.Response) -> list[dict]:
+        """
+        Rows of a query response, none if the namespace does not exist yet.
+        """
+        if response.status_code == 404:
+            return []
+        response.raise_for_status()
+        return response.json()
+
+    @staticmethod
+    def shot(row: dict) -> Shot:
+        attributes = row["attributes"]
+        return LazyShot(attributes["inputs"], attributes["outputs"], str(row["id"]))
+
+    @staticmethod
+    def rows_to_shots(ids: list[str], rows: list[dict]) -> list[Shot]:
+        shots = {str(row["id"]): TurboPufferHelper.shot(row) for row in rows}
+        return [shots[id] for id in ids if id in shots]
+
+    @staticmethod
+    def rows_to_hashes(rows: list[dict]) -> dict[str, str]:
+        return {
+            str(row["id"]): row["attributes"]["hash"]
+            for row in rows
+            if row["attributes"].get("hash") is not None
+        }
+
+    @staticmethod
+    def scored_shots(rows: list[dict]) -> list[ScoredShot]:
+        return [ScoredShot(row["dist"], TurboPufferHelper.shot(row)) for row in rows]
@@ -1,44 +1,77 @@
+from __future__ import annotations
+
+import re
+from asyncio import Semaphore, gather
+from hashlib import md5
+
 from sorcery import dict_of
 from weaviate import WeaviateAsyncClient, WeaviateClient
 from weaviate.classes.config import Property, DataType, VectorDistances, Configure
 from weaviate.classes.data import DataObject
 from weaviate.classes.query import Filter
+from weaviate.classes.tenants import Tenant, TenantActivityStatus
+from weaviate.collections.classes.batch import ErrorObject
 from weaviate.collections.classes.internal import QueryReturnType
-from weaviate.exceptions import WeaviateBaseError
+from weaviate.exceptions import WeaviateBaseError, WeaviateBatchError
 
 from few_shots.types import (
-    dump_io_value,
-    parse_io_value,
+    encode_io_value,
+    LazyShot,
     ScoredShot,
+    SearchParams,
     Shot,
     Vector,
 )
 from few_shots.utils.datetime import utcnow
+from few_shots.utils.iter import batched
 
-from .base import AsyncStore, Store
+from .base import AsyncStore, Store, StoreCapabilities
 
 __all__ = ["WeaviateStore", "AsyncWeaviateStore", "VectorDistances"]
 
 
 class WeaviateStore(Store):
+    # Fetches and deletes by id are capped at the server's QUERY_MAXIMUM_RESULTS
+    capabilities = StoreCapabilities(max_ids=10_000, batch_queries=False, content_hashes=True)
     client: WeaviateClient
     collection_name: str
     distance_metric: VectorDistances
+    multi_tenancy: bool
+    batch_size: int | None
+    concurrent_requests: int
 
     def __init__(
         self,
         client: WeaviateClient,
         collection_name: str,
         distance_metric: VectorDistances = VectorDistances.COSINE,
+        multi_tenancy: bool = False,
+        batch_size: int | None = None,
+        concurrent_requests: int = 2,
     ):
+        """
+        Args:
+            client: The Weaviate client
+            collection_name: The collection to store shots in
+            distance_metric: The distance metric of the vector index
+            multi_tenancy: Store each namespace as a tenant with its own vector index, instead of
+                filtering one shared index by a namespace property
+            batch_size: Objects per batch request, sized dynamically by Weaviate if None
+            concurrent_requests: Batch requests sent concurrently with a fixed `batch_size`
+        """
         self.client = client
         self.collection_name = collection_name
         self.distance_metric = distance_metric
+        self.multi_tenancy = multi_tenancy
+        self.batch_size = batch_size
+        self.concurrent_requests = concurrent_requests
 
     def setup(self):
         try:
             self.collection = self.client.collections.create(
-                **WeaviateHelper.collection_config(self.collection_name, self.distance_metric)
+                **WeaviateHelper.collection_config(
+                    self.collection_name, self.distance_metric, self.multi_tenancy
+                )
             )
         except WeaviateBaseError:
             self.collection = self.client.collections.get(self.collection_name)
@@ -46,85 +79,254 @@ class WeaviateStore(Store):
     def teardown(self):
         self.client.collections.delete(self.collection_name)
 
-    def add(self, shots: list[Shot], vectors: list[Vector], namespace: str):
-        self.collection.data.insert_many(WeaviateHelper.upsert_shots(shots, vectors, namespace))
+    def add(
+        self,
+        shots: list[Shot],
+        vectors: list[Vector],
+        namespace: str,
+        hashes: list[str] | None = None,
+    ):
+        """
+        Imports through Weaviate's batcher, which upserts by the shots' deterministic ids.
+        """
+        collection = self._collection(namespace)
+        if self.batch_size is None:
+            batcher = collection.batch.dynamic()
+        else:
+            batcher = collection.batch.fixed_size(self.batch_size, self.concurrent_requests)
 
-    def get(self, ids: list[str], _namespace: str):
-        return WeaviateHelper.fetch_shots(ids, self.collection.query.fetch_objects_by_ids(ids))
+        with batcher as batch:
+            for obj in WeaviateHelper.upsert_shots(shots, vectors, namespace, hashes):
+                batch.add_object(properties=obj.properties, uuid=obj.uuid, vector=obj.vector)
 
-    def remove(self, ids: list[str], _namespace: str):
-        self.collection.data.delete_many(Filter.by_id().contains_any(ids))
+        WeaviateHelper.raise_for_errors(collection.batch.failed_objects)
+
+    def get(self, ids: list[str], namespace: str):
+        return WeaviateHelper.fetch_shots(
+            ids, self._collection(namespace).query.fetch_objects_by_ids(ids)
+        )
+
+    def hashes(self, ids: list[str], namespace: str) -> dict[str, str]:
+        return WeaviateHelper.fetch_hashes(
+            self._collection(namespace).query.fetch_objects_by_ids(
+                ids, return_properties=["namespace", "hash"]
+            ),
+            namespace,
+        )
+
+    def remove(self, ids: list[str], namespace: str):
+        self._collection(namespace).data.delete_many(Filter.by_id().contains_any(ids))
 
     def clear(self, namespace: str):
-        self.collection.data.delete_many(Filter.by_property("namespace").equal(namespace))
+        if self.multi_tenancy:
+            self.collection.tenants.remove([WeaviateHelper.tenant(namespace)])
+        else:
+            self.collection.data.delete_many(WeaviateHelper.namespace_filter(namespace))
+
+    def deactivate(self, namespaces: list[str], offload: bool = False):
+        """
+        Frees the resources of idle tenants, which are reactivated when next accessed.
+
+        Args:
+            namespaces: Namespaces to deactivate
+            offload: Move the tenants to cold storage rather than only unloading them
+                (requires an offload module)
+        """
+        self.collection.tenants.update(WeaviateHelper.deactivated_tenants(namespaces, offload))
 
-    def list(self, vector: Vector, namespace: str, limit: int) -> list[ScoredShot]:
+    def list(
+        self,
+        vector: Vector,
+        namespace: str,
+        limit: int,
+        _search_params: SearchParams | None = None,
+    ) -> list[ScoredShot]:
         return WeaviateHelper.query_scored_shots(
-            self.collection.query.near_vector(
+            self._collection(namespace).query.near_vector(
                 vector,
-                filters=Filter.by_property("namespace").equal(namespace),
+                filters=self._filter(namespace),
                 limit=limit,
             )
         )
 
+    def list_many(
+        self,
+        vectors: list[Vector],
+        namespace: str,
+        limit: int,
+        _search_params: SearchParams | None = None,
+    ) -> list[list[ScoredShot]]:
+        """
+        Weaviate has no multi-vector near_vector search, so this runs one query per vector.
+        """
+        return [self.list(vector, namespace, limit) for vector in vectors]
+
+    def _collection(self, namespace: str):
+        if self.multi_tenancy:
+            return self.collection.with_tenant(WeaviateHelper.tenant(namespace))
+        return self.collection
+
+    def _filter(self, namespace: str):
+        return None if self.multi_tenancy else WeaviateHelper.namespace_filter(namespace)
+
 
 class AsyncWeaviateStore(AsyncStore):
+    # Fetches and deletes by id are capped at the server's QUERY_MAXIMUM_RESULTS
+    capabilities = StoreCapabilities(max_ids=10_000, batch_queries=False, content_hashes=True)
     client: WeaviateAsyncClient
     collection_name: str
     distance_metric: VectorDistances
+    multi_tenancy: bool
+    batch_size: int | None
+    concurrent_requests: int
 
     def __init__(
         self,
         client: WeaviateAsyncClient,
         collection_name: str,
         distance_metric: VectorDistances = VectorDistances.COSINE,
+        multi_tenancy: bool = False,
+        batch_size: int | None = None,
+        concurrent_requests: int = 2,
     ):
+        """
+        Args:
+            client: The async Weaviate client
+            collection_name: The collection to store shots in
+            distance_metric: The distance metric of the vector index
+            multi_tenancy: Store each namespace as a tenant with its own vector index, instead of
+                filtering one shared index by a namespace property
+            batch_size: Objects per insert request, 100 if None
+            concurrent_requests: Insert requests sent concurrently
+        """
         self.client = client
         self.collection_name = collection_name
         self.distance_metric = distance_metric
+        self.multi_tenancy = multi_tenancy
+        self.batch_size = batch_size
+        self.concurrent_requests = concurrent_requests
 
     async def setup(self):
         try:
             self.collection = await self.client.collections.create(
-                **WeaviateHelper.collection_config(self.collection_name, self.distance_metric)
+                **WeaviateHelper.collection_config(
+                    self.collection_name, self.distance_metric, self.multi_tenancy
+                )
             )
         except WeaviateBaseError:
-            self.collection = await self.client.collections.get(self.collection_name)
+            self.collection = self.client.collections.get(self.collection_name)
 
     async def teardown(self):
         await self.client.collections.delete(self.collection_name)
 
-    async def add(self, shots: list[Shot], vectors: list[Vector], namespace: str):
-        await self.collection.data.insert_many(
-            WeaviateHelper.upsert_shots(shots, vectors, namespace)
-        )
+    async def add(
+        self,
+        shots: list[Shot],
+        vectors: list[Vector],
+        namespace: str,
+        hashes: list[str] | None = None,
+    ):
+        """
+        The async client only batches with server-side streaming (Weaviate >= 1.36), so this
+        sends `batch_size` chunks through `insert_many`, `concurrent_requests` at a time.
+        Objects upsert by the shots' deterministic ids.
+        """
+        collection = self._collection(namespace)
+        semaphore = Semaphore(self.concurrent_requests)
+
+        async def insert(chunk: list[DataObject]) -> list[ErrorObject]:
+            async with semaphore:
+                return list((await collection.data.insert_many(chunk)).errors.values())
+
+        objects = WeaviateHelper.upsert_shots(shots, vectors, namespace, hashes)
+        errors = await gather(*(insert(c) for c in batched(objects, self.batch_size or 100)))
+        WeaviateHelper.raise_for_errors([error for chunk in errors for error in chunk])
 
-    async def get(self, ids: list[str], _namespace: str):
+    async def get(self, ids: list[str], namespace: str):
         return WeaviateHelper.fetch_shots(
-            ids, await self.collection.query.fetch_objects_by_ids(ids)
+            ids, await self._collection(namespace).query.fetch_objects_by_ids(ids)
+        )
+
+    async def hashes(self, ids: list[str], namespace: str) -> dict[str, str]:
+        return WeaviateHelper.fetch_hashes(
+            await self._collection(namespace).query.fetch_objects_by_ids(
+                ids, return_properties=["namespace", "hash"]
+            ),
+            namespace,
         )
 
-    async def remove(self, ids: list[str], _namespace: str):
-        await self.collection.data.delete_many(Filter.by_id().contains_any(ids))
+    async def remove(self, ids: list[str], namespace: str):
+        await self._collection(namespace).data.delete_many(Filter.by_id().contains_any(ids))
 
     async def clear(self, namespace: str):
-        await self.collection.data.delete_many(Filter.by_property("namespace").equal(namespace))
+        if self.multi_tenancy:
+            await self.collection.tenants.remove([WeaviateHelper.tenant(namespace)])
+        else:
+            await self.collection.data.delete_many(WeaviateHelper.namespace_filter(namespace))
 
-    async def list(self, vector: Vector, namespace: str, limit: int) -> list[ScoredShot]:
+    async def deactivate(self, namespaces: list[str], offload: bool = False):
+        """
+        Frees the resources of idle tenants, which are reactivated when next accessed.
+        See `WeaviateStore.deactivate`.
+        """
+        await self.collection.tenants.update(
+            WeaviateHelper.deactivated_tenants(namespaces, offload)
+        )
+
+    async def list(
+        self,
+        vector: Vector,
+        namespace: str,
+        limit: int,
+        _search_params: SearchParams | None = None,
+    ) -> list[ScoredShot]:
         return WeaviateHelper.query_scored_shots(
-            await self.collection.query.near_vector(
+            await self._collection(namespace).query.near_vector(
                 vector,
-                filters=Filter.by_property("namespace").equal(namespace),
+                filters=self._filter(namespace),
                 limit=limit,
             )
         )
 
+    async def list_many(
+        self,
+        vectors: list[Vector],
+        namespace: str,
+        limit: int,
+        _search_params: SearchParams | None = None,
+    ) -> list[list[ScoredShot]]:
+        """
+        Weaviate has no multi-vector near_vector search, so this runs the queries concurrently.
+        """
+        return list(await gather(*(self.list(vector, namespace, limit) for vector in vectors)))
+
+    def _collection(self, namespace: str):
+        if self.multi_tenancy:
+            return self.collection.with_tenant(WeaviateHelper.tenant(namespace))
+        return self.collection
+
+    def _filter(self, namespace: str):
+        return None if self.multi_tenancy else WeaviateHelper.namespace_filter(namespace)
+
 
 class WeaviateHelper:
     @staticmethod
-    def collection_config(collection_name: str, distance_metric: VectorDistances) -> dict:
+    def collection_config(
+        collection_name: str,
+        distance_metric: VectorDistances,
+        multi_tenancy: bool = False,
+    ) -> dict:
         return dict(
             name=collection_name,
+            multi_tenancy_config=(
+                Configure.multi_tenancy(
+                    enabled=True,
+                    auto_tenant_creation=True,
+                    auto_tenant_activation=True,
+                )
+                if multi_tenancy
+                else None
+            ),
             properties=[
                 Property(
                     name="namespace",
@@ -134,30 +336,72 @@ class WeaviateHelper:
                 Property(name="inputs", data_type=DataType.TEXT),
                 Property(name="outputs", data_type=DataType.TEXT),
                 Property(name="updated_at", data_type=DataType.NUMBER),
+                Property(name="hash", data_type=DataType.TEXT),
             ],
             vector_index_config=Configure.VectorIndex.hnsw(distance_metric=distance_metric),
         )
 
+    @staticmethod
+    def tenant(namespace: str) -> str:
+        """
+        Tenant names are limited to 64 alphanumerics, dashes and underscores, so other
+        namespaces are hashed.
+        """
+        if re.fullmatch(r"[A-Za-z0-9_-]{1,64}", namespace):
+            return namespace
+        return f"ns-{md5(namespace.encode()).hexdigest()}"
+
+    @staticmethod
+    def deactivated_tenants(namespaces: list[str], offload: bool = False) -> list[Tenant]:
+        status = TenantActivityStatus.OFFLOADED if offload else TenantActivityStatus.INACTIVE
+        return [
+            Tenant(name=WeaviateHelper.tenant(namespace), activity_status=status)
+            for namespace in namespaces
+        ]
+
+    @staticmethod
+    def namespace_filter(namespace: str):
+        return Filter.by_property("namespace").equal(namespace)
+
+    @staticmethod
+    def raise_for_errors(errors: list[ErrorObject]):
+        if errors:
+            raise WeaviateBatchError(
+                f"{len(errors)} objects failed to import, first error: {errors[0].message}"
+            )
+
     @staticmethod
     def upsert_shots(
         shots: list[Shot],
         vectors: list[Vector],
         namespace: str,
+        hashes: list[str] | None = None,
     ) -> list[DataObject]:
         updated_at = utcnow()
-        return [
+        objects = [
             DataObject(
                 uuid=shot.id,
                 vector=vector,
                 properties=dict_of(
                     namespace,
                     updated_at,
-                    inputs=dump_io_value(shot.inputs),
-                    outputs=dump_io_value(shot.outputs),
+                    inputs=encode_io_value(shot.inputs),
+                    outputs=encode_io_value(shot.outputs),
                 ),
             )
             for shot, vector in zip(shots, vectors)
         ]
+        for obj, hash in zip(objects, hashes or ()):
+            obj.properties["hash"] = hash
+        return objects
+
+    @staticmethod
+    def fetch_hashes(response: QueryReturnType, namespace: str) -> dict[str, str]:
+        return {
+            str(o.uuid): o.properties["hash"]
+            for o in response.objects
+            if o.properties.get("namespace") == namespace and o.properties.get("hash")
+        }
 
     @staticmethod
     def fetch_shots(ids: list[str], response: QueryReturnType) -> list[Shot]:
@@ -165,11 +409,7 @@ class WeaviateHelper:
         Weaviate returns objects in a random order, so we need to order them by the ids we requested.
         """
         shots = {
-            str(o.uuid): Shot(
-                parse_io_value(o.properties["inputs"]),
-                parse_io_value(o.properties["outputs"]),
-                str(o.uuid),
-            )
+            str(o.uuid): LazyShot(o.properties["inputs"], o.properties["outputs"], str(o.uuid))
             for o in response.objects
         }
         return [shots[id] for id in ids if id in shots]
@@ -179,11 +419,7 @@ class WeaviateHelper:
         return [
             ScoredShot(
                 o.metadata.distance,
-                Shot(
-                    parse_io_value(o.properties["inputs"]),
-                    parse_io_value(o.properties["outputs"]),
-                    str(o.uuid),
-                ),
+                LazyShot(o.properties["inputs"], o.properties["outputs"], str(o.uuid)),
             )
             for o in response.objects
         ]
@@ -1,31 +1,63 @@
 from dataclasses import dataclass
-from functools import cached_property
-from typing import NamedTuple, TypeVar
+from hashlib import sha256
+from typing import Literal, NamedTuple, TypeVar
 from uuid import uuid5, NAMESPACE_OID
 
-import ujson
+import numpy as np
+
+from few_shots.utils.codec import get_codec
 
 
 IO = TypeVar("IO", bound=dict | str)
 Datum = TypeVar("Datum", bound=tuple[IO, IO] | tuple[IO, IO, str])
-Vector = TypeVar("Vector", bound=list[float])
+# A 1-D float32 array, or a list of floats. Embedders may return batches as 2-D arrays
+Vector = TypeVar("Vector", bound=np.ndarray | list[float])
+
+
+def as_floats(vector: Vector) -> list[float]:
+    """Python floats, for backends whose drivers or JSON encoders don't take NumPy arrays."""
+    if isinstance(vector, np.ndarray):
+        return vector.tolist()
+    return [float(x) for x in vector]
 
 
 def is_io_value(value) -> bool:
     return isinstance(value, (dict, str))
 
 
+# Only JSON-encoded payloads start with these
+JSON_PREFIXES = ("{", '"')
+
+
 def parse_io_value(value: str) -> IO:
+    """
+    Reads a payload written by `encode_io_value`. Plain strings are returned as they are,
+    without trying to decode them first.
+    """
+    if not value.startswith(JSON_PREFIXES):
+        return value
     try:
-        return ujson.loads(value)
-    except ujson.JSONDecodeError:
+        return get_codec().loads(value)
+    except ValueError:
+        # A string that was stored as-is, before strings like it were quoted
         return value
 
 
 def dump_io_value(data: IO) -> str:
+    """Canonical text of `data`, which shot ids are hashed from and inputs are embedded as."""
     if isinstance(data, str):
         return data
-    return ujson.dumps(data, sort_keys=True)
+    return get_codec().dumps(data)
+
+
+def encode_io_value(data: IO) -> str:
+    """
+    Serializes `data` for a store payload. Like `dump_io_value`, except that strings that
+    would read as JSON are quoted, so `parse_io_value` can tell the two types apart.
+    """
+    if isinstance(data, str) and not data.startswith(JSON_PREFIXES):
+        return data
+    return get_codec().dumps(data)
 
 
 def id_io_value(data: IO) -> str:
@@ -34,19 +66,122 @@ def id_io_value(data: IO) -> str:
 
 @dataclass
 class Shot:
+    # `_key` memoizes the canonical inputs, and is kept out of the dataclass fields so
+    # `replace` and `asdict` only see the three above
+    __slots__ = ("inputs", "outputs", "id", "_key")
+
     inputs: IO
     outputs: IO
     id: str
 
     def __init__(self, inputs: IO, outputs: IO, id: str = ""):
-        super().__init__()
         self.inputs = inputs
         self.outputs = outputs
-        self.id = id or id_io_value(inputs)
+        # Without an id, the canonical inputs are hashed for one, so keep them as the key
+        self._key = None if id else dump_io_value(inputs)
+        self.id = id or str(uuid5(NAMESPACE_OID, self._key))
 
-    @cached_property
+    @property
+    def key(self) -> str:
+        if self._key is None:
+            self._key = dump_io_value(self.inputs)
+        return self._key
+
+
+_UNSET = object()
+
+
+class LazyShot(Shot):
+    """
+    Read-only `Shot` read from a store, holding the serialized inputs and outputs and only
+    parsing them on first access. Its `key` is the serialized inputs as stored, unless they
+    are a quoted string. `dataclasses.replace` makes a plain `Shot` of its parsed values.
+    """
+
+    __slots__ = ("_inputs", "_outputs", "_raw_outputs")
+
+    def __new__(cls, *args, **fields):
+        # `replace` calls the class with the dataclass fields as keywords
+        if "inputs" in fields:
+            return Shot(**fields)
+        return super().__new__(cls)
+
+    def __init__(self, raw_inputs: str, raw_outputs: str, id: str):
+        for name, value in (
+            ("_key", raw_inputs),
+            ("_raw_outputs", raw_outputs),
+            ("_inputs", _UNSET),
+            ("_outputs", _UNSET),
+            ("id", id),
+        ):
+            object.__setattr__(self, name, value)
+
+    @property
+    def inputs(self) -> IO:
+        if self._inputs is _UNSET:
+            object.__setattr__(self, "_inputs", parse_io_value(self._key))
+        return self._inputs
+
+    @property
+    def outputs(self) -> IO:
+        if self._outputs is _UNSET:
+            object.__setattr__(self, "_outputs", parse_io_value(self._raw_outputs))
+        return self._outputs
+
+    @property
     def key(self) -> str:
-        return dump_io_value(self.inputs)
+        if self._key.startswith('"'):
+            return self.inputs
+        return self._key
+
+    def __setattr__(self, name: str, value):
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Shot):
+            return NotImplemented
+        return (self.inputs, self.outputs, self.id) == (other.inputs, other.outputs, other.id)
+
+    # Unhashable like `Shot`, which it compares equal to
+    __hash__ = None
+
+    def __reduce__(self):
+        return LazyShot, (self._key, self._raw_outputs, self.id)
+
+
+def content_hash(shot: Shot, model_id: str) -> str:
+    """
+    Hash of what a stored shot is made of, its inputs, outputs and the embedding model, which
+    changes whenever re-adding the shot would store something different.
+    """
+    content = "\0".join((model_id, shot.key, encode_io_value(shot.outputs)))
+    return sha256(content.encode()).hexdigest()
 
 
 ScoredShot = NamedTuple("ScoredShot", [("score", float), ("shot", Shot)])
+
+AddProgress = NamedTuple("AddProgress", [("ids", list[str]), ("added", int)])
+
+
+@dataclass(frozen=True)
+class SearchParams:
+    """
+    Per-query recall/latency tradeoff, translated by each store to its native settings.
+    Stores ignore the fields they have no per-query equivalent for.
+
+    Args:
+        ef: Size of the HNSW candidate list, higher is slower with better recall
+        exact: Search every vector instead of using the index
+        iterative_scan: Keep scanning the index when the namespace filter leaves fewer than
+            `limit` results (pgvector >= 0.8 only), IVFFlat indexes always use "relaxed_order"
+        nprobe: Number of IVF lists probed
+        oversampling: With quantized vectors, fetch `limit * oversampling` candidates to rescore
+        rescore: With quantized vectors, rerank candidates by their original vectors
+    """
+
+    ef: int | None = None
+    exact: bool = False
+    iterative_scan: Literal["relaxed_order", "strict_order"] | None = None
+    nprobe: int | None = None
+    oversampling: float | None = None
+    rescore: bool | None = None
@@ -21,6 +21,6 @@ def syncify_class(cls: C) -> C:
 def asyncify_class(cls: C) -> C:
     for base in [cls] + list(cls.__bases__):
         for name, method in base.__dict__.items():
-            if not iscoroutinefunction(method) and is_target(name):
+            if callable(method) and not iscoroutinefunction(method) and is_target(name):
                 setattr(cls, name, asyncify(method))
     return cls
@@ -0,0 +1,115 @@
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+from threading import Lock
+from time import monotonic
+from typing import Generic, Hashable, TypeVar
+
+from few_shots.types import ScoredShot, SearchParams
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+
+
+class LRUCache(Generic[K, V]):
+    """
+    Thread-safe, bounded mapping that evicts the least recently used entry first.
+    With a `ttl`, entries also expire that many seconds after they were set.
+    """
+
+    maxsize: int
+    ttl: float | None
+    stats: CacheStats
+
+    def __init__(self, maxsize: int = 10_000, ttl: float | None = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stats = CacheStats()
+        # key => (expiry, value)
+        self._data: OrderedDict[K, tuple[float, V]] = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: K, default: V | None = None) -> V | None:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] <= monotonic():
+                del self._data[key]
+                self.stats.expirations += 1
+                entry = None
+            if entry is None:
+                self.stats.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.stats.hits += 1
+            return entry[1]
+
+    def set(self, key: K, value: V):
+        expiry = float("inf") if self.ttl is None else monotonic() + self.ttl
+        with self._lock:
+            self._data[key] = (expiry, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.stats.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key: K) -> bool:
+        entry = self._data.get(key)
+        return entry is not None and entry[0] > monotonic()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class ResultCache:
+    """
+    `list` results keyed by namespace, input, limit and search params in an `LRUCache`.
+
+    Each namespace has a generation that is part of the key and is bumped by writes to the
+    namespace, so results from before a write are never returned and age out of the LRU.
+    """
+
+    results: LRUCache[tuple, list[ScoredShot]]
+
+    def __init__(self, maxsize: int = 10_000, ttl: float | None = None):
+        """
+        Args:
+            maxsize: Maximum number of cached results
+            ttl: Seconds a result stays valid, also bounding staleness from writes by
+                other processes, forever if None
+        """
+        self.results = LRUCache(maxsize, ttl)
+        self._generations: defaultdict[str, int] = defaultdict(int)
+
+    @property
+    def stats(self) -> CacheStats:
+        return self.results.stats
+
+    def key(
+        self,
+        namespace: str,
+        inputs: str,
+        limit: int,
+        search_params: SearchParams | None,
+    ) -> tuple:
+        return (namespace, self._generations[namespace], inputs, limit, search_params)
+
+    def get(self, key: tuple) -> list[ScoredShot] | None:
+        results = self.results.get(key)
+        return None if results is None else list(results)
+
+    def set(self, key: tuple, results: list[ScoredShot]):
+        self.results.set(key, list(results))
+
+    def invalidate(self, namespace: str):
+        self._generations[namespace] += 1
@@ -0,0 +1,52 @@
+from dataclasses import dataclass
+from typing import Any, Callable
+
+import ujson
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+@dataclass(frozen=True)
+class Codec:
+    """
+    JSON functions for `IO` values. `dumps` must be canonical (sorted keys, fixed
+    formatting), as shot ids are hashes of its output.
+    """
+
+    dumps: Callable[[dict], str]
+    loads: Callable[[str], Any]
+
+
+def ujson_dumps(value: dict) -> str:
+    return ujson.dumps(value, sort_keys=True)
+
+
+UJSON = Codec(ujson_dumps, ujson.loads)
+
+if orjson is not None:
+
+    def orjson_dumps(value: dict) -> str:
+        return orjson.dumps(value, option=orjson.OPT_SORT_KEYS).decode()
+
+    # Doesn't escape "/" or non-ASCII characters like ujson does, so it hashes those inputs
+    # to different ids. Only use it for new stores.
+    ORJSON = Codec(orjson_dumps, orjson.loads)
+
+# Any decoder reads any encoder's output, so decode with the fastest one available while
+# keeping ujson's encoding, and with it existing ids.
+DEFAULT = Codec(ujson_dumps, orjson.loads if orjson is not None else ujson.loads)
+
+_codec = DEFAULT
+
+
+def get_codec() -> Codec:
+    return _codec
+
+
+def set_codec(codec: Codec):
+    """Changes the codec used by `few_shots.types` for the whole process."""
+    global _codec
+    _codec = codec
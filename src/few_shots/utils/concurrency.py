@@ -0,0 +1,32 @@
+from asyncio import Semaphore, gather
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def map_concurrently(fn: Callable[[T], R], items: list[T], max_concurrency: int) -> list[R]:
+    """Calls `fn` on each item from up to `max_concurrency` threads, keeping the order."""
+    if len(items) <= 1 or max_concurrency <= 1:
+        return [fn(item) for item in items]
+    with ThreadPoolExecutor(min(max_concurrency, len(items))) as executor:
+        return list(executor.map(fn, items))
+
+
+async def amap_concurrently(
+    fn: Callable[[T], Awaitable[R]],
+    items: list[T],
+    max_concurrency: int,
+) -> list[R]:
+    """Awaits `fn` on each item, at most `max_concurrency` at a time, keeping the order."""
+    if len(items) == 1:
+        return [await fn(items[0])]
+
+    semaphore = Semaphore(max_concurrency)
+
+    async def call(item: T) -> R:
+        async with semaphore:
+            return await fn(item)
+
+    return list(await gather(*(call(item) for item in items)))
@@ -0,0 +1,38 @@
+from itertools import islice
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator, Sequence, TypeVar
+
+T = TypeVar("T")
+
+
+def batched(iterable: Iterable[T], size: int) -> Iterator[list[T]]:
+    """Lazily splits `iterable` into lists of `size` items, the last one possibly shorter."""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def chunked(items: Sequence[T], size: int | None) -> list[Sequence[T]]:
+    """
+    Splits `items` into slices of at most `size` items, or one slice if `size` is None.
+    Slices of NumPy arrays are views, so chunking a batch of vectors doesn't copy it.
+    """
+    if size is None or len(items) <= size:
+        return [items]
+    return [items[i : i + size] for i in range(0, len(items), size)]
+
+
+async def abatched(iterable: Iterable[T] | AsyncIterable[T], size: int) -> AsyncIterator[list[T]]:
+    """Like `batched`, but also accepts async iterables."""
+    if not isinstance(iterable, AsyncIterable):
+        for batch in batched(iterable, size):
+            yield batch
+        return
+
+    batch: list[T] = []
+    async for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
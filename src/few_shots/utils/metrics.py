@@ -0,0 +1,19 @@
+from dataclasses import dataclass
+
+
+@dataclass
+class LatencyStats:
+    """Running count, total and maximum of observed durations, in seconds."""
+
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
@@ -0,0 +1,56 @@
+from asyncio import Lock, sleep
+from time import monotonic
+
+
+class TokenBucket:
+    """Holds up to `capacity` units, refilled continuously at `rate` units per second."""
+
+    capacity: float
+    rate: float
+
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.level = capacity
+        self._updated = monotonic()
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` units are available, 0 if they already are."""
+        now = monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+        return max(0.0, (min(amount, self.capacity) - self.level) / self.rate)
+
+    def take(self, amount: float):
+        self.level -= min(amount, self.capacity)
+
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute limits, each a `TokenBucket` that starts full.
+    Callers are served in arrival order.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float | None = None,
+        tokens_per_minute: float | None = None,
+    ):
+        self._requests = (
+            TokenBucket(requests_per_minute, requests_per_minute / 60)
+            if requests_per_minute
+            else None
+        )
+        self._tokens = (
+            TokenBucket(tokens_per_minute, tokens_per_minute / 60) if tokens_per_minute else None
+        )
+        self._lock = Lock()
+
+    async def acquire(self, tokens: int = 0):
+        """Waits until one request of `tokens` tokens fits both limits, then counts it."""
+        needs = [(b, n) for b, n in ((self._requests, 1), (self._tokens, tokens)) if b is not None]
+        async with self._lock:
+            while wait := max((bucket.wait_time(amount) for bucket, amount in needs), default=0):
+                await sleep(wait)
+            for bucket, amount in needs:
+                bucket.take(amount)
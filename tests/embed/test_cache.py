@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+from few_shots.embed.cache import AsyncCachedEmbed, CachedEmbed
+
+
+class CountingEmbed:
+    model_id = "counting"
+
+    def __init__(self):
+        self.calls: list[list[str]] = []
+
+    def __call__(self, inputs: list[str]):
+        self.calls.append(inputs)
+        return [[float(len(i)), 1.0] for i in inputs]
+
+
+class AsyncCountingEmbed(CountingEmbed):
+    async def __call__(self, inputs: list[str]):
+        return super().__call__(inputs)
+
+
+def test_dedupes_and_caches():
+    embed = CountingEmbed()
+    cached = CachedEmbed(embed)
+
+    assert cached(["a", "bb", "a"]).tolist() == [[1.0, 1.0], [2.0, 1.0], [1.0, 1.0]]
+    assert cached(["bb", "ccc"]).tolist() == [[2.0, 1.0], [3.0, 1.0]]
+    assert embed.calls == [["a", "bb"], ["ccc"]]
+
+
+def test_evicts_least_recently_used():
+    embed = CountingEmbed()
+    cached = CachedEmbed(embed, maxsize=2)
+
+    cached(["a", "bb"])
+    cached(["a"])
+    cached(["ccc"])
+    cached(["a", "bb"])
+    assert embed.calls == [["a", "bb"], ["ccc"], ["bb"]]
+    assert cached.cache.stats.evictions == 2
+
+
+def test_model_id_scopes_keys():
+    assert CachedEmbed(CountingEmbed()).cache.key("a") != CachedEmbed(
+        CountingEmbed(), model_id="other"
+    ).cache.key("a")
+
+
+def test_requires_model_id():
+    def embed(inputs: list[str]):
+        return [[1.0, 0.0] for _ in inputs]
+
+    with pytest.raises(ValueError):
+        CachedEmbed(embed)
+    assert CachedEmbed(embed, model_id="model").model_id == "model"
+
+
+def test_persists_to_disk(tmp_path):
+    path = str(tmp_path / "embeddings.db")
+    CachedEmbed(CountingEmbed(), path=path)(["a", "bb"])
+
+    embed = CountingEmbed()
+    assert CachedEmbed(embed, path=path)(["bb", "a", "ccc"]).tolist() == [
+        [2.0, 1.0],
+        [1.0, 1.0],
+        [3.0, 1.0],
+    ]
+    assert embed.calls == [["ccc"]]
+
+
+@pytest.mark.asyncio
+async def test_async_cached_embed():
+    embed = AsyncCountingEmbed()
+    cached = AsyncCachedEmbed(embed)
+
+    assert (await cached(["a", "a"])).tolist() == [[1.0, 1.0], [1.0, 1.0]]
+    assert (await cached(["a", "bb"])).tolist() == [[1.0, 1.0], [2.0, 1.0]]
+    assert embed.calls == [["a"], ["bb"]]
+
+
+def test_vectors_are_float32(tmp_path):
+    path = str(tmp_path / "embeddings.db")
+    vectors = CachedEmbed(CountingEmbed(), path=path)(["a", "bb"])
+    assert vectors.dtype == np.float32 and vectors.shape == (2, 2)
+
+    cached = CachedEmbed(CountingEmbed(), path=path)
+    assert cached(["bb"]).tolist() == [[2.0, 1.0]]
+    assert cached.cache.memory.get(cached.cache.key("bb")).dtype == np.float32
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from few_shots.async_client import AsyncFewShots
+from few_shots.embed.coalesce import CoalescingEmbed
+from few_shots.store.memory import MemoryStore
+from few_shots.utils.asyncio import asyncify_class
+
+
+class RecordingEmbed:
+    def __init__(self):
+        self.calls: list[list[str]] = []
+
+    async def __call__(self, inputs: list[str]):
+        self.calls.append(inputs)
+        await asyncio.sleep(0.01)
+        return [[float(len(i)), 1.0] for i in inputs]
+
+
+@pytest.mark.asyncio
+async def test_coalesces_concurrent_calls():
+    embed = RecordingEmbed()
+    coalesced = CoalescingEmbed(embed, window=0.01)
+
+    results = await asyncio.gather(coalesced(["a"]), coalesced(["bb", "a"]), coalesced(["ccc"]))
+    assert results == [[[1.0, 1.0]], [[2.0, 1.0], [1.0, 1.0]], [[3.0, 1.0]]]
+    assert embed.calls == [["a", "bb", "ccc"]]
+
+
+@pytest.mark.asyncio
+async def test_dedupes_in_flight_inputs():
+    embed = RecordingEmbed()
+    coalesced = CoalescingEmbed(embed, window=0)
+
+    first = asyncio.create_task(coalesced(["a"]))
+    await asyncio.sleep(0.001)  # "a" is now in flight
+    assert await coalesced(["a"]) == await first
+    assert embed.calls == [["a"]]
+
+
+@pytest.mark.asyncio
+async def test_flushes_at_max_batch_size():
+    embed = RecordingEmbed()
+    coalesced = CoalescingEmbed(embed, window=10, max_batch_size=2)
+
+    await asyncio.gather(coalesced(["a", "bb"]), coalesced(["ccc", "dddd"]))
+    assert embed.calls == [["a", "bb"], ["ccc", "dddd"]]
+
+
+@pytest.mark.asyncio
+async def test_propagates_errors():
+    async def failing(inputs: list[str]):
+        raise ValueError("boom")
+
+    coalesced = CoalescingEmbed(failing)
+    with pytest.raises(ValueError):
+        await asyncio.gather(coalesced(["a"]), coalesced(["b"]))
+
+
+@pytest.mark.asyncio
+async def test_client_list():
+    @asyncify_class
+    class AsyncMemoryStore(MemoryStore): ...
+
+    embed = RecordingEmbed()
+    client = AsyncFewShots(embed=CoalescingEmbed(embed, window=0.01), store=AsyncMemoryStore())
+    await client.add([("input1", "output1"), ("input2", "output2")])
+
+    results = await asyncio.gather(*(client.list(f"input{i}", limit=1) for i in range(10)))
+    assert len(results) == 10
+    assert len(embed.calls) == 2
@@ -0,0 +1,92 @@
+import asyncio
+import time
+
+import pytest
+
+from few_shots.embed.openai import AsyncOpenAIEmbed, OpenAIEmbed, token_batches
+from few_shots.utils.ratelimit import RateLimiter
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+class FakeEmbeddings:
+    """Embeds an input as its length, rejecting the first `failures` requests with a 429."""
+
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.requests: list[list[str]] = []
+
+    def response(self, input: list[str], model: str):
+        if self.failures:
+            self.failures -= 1
+            raise RateLimitError()
+        self.requests.append(input)
+        return {"data": [{"embedding": [float(len(text))]} for text in input]}
+
+    def __call__(self, input: list[str], model: str):
+        return self.response(input, model)
+
+
+class AsyncFakeEmbeddings(FakeEmbeddings):
+    async def __call__(self, input: list[str], model: str):
+        await asyncio.sleep(0.01 * (len(input) % 3))  # Finish out of order
+        return self.response(input, model)
+
+
+def test_token_batches():
+    inputs = ["aa", "b", "cccc", "d", "eeeeeeeeee", "f"]
+    batches = token_batches(inputs, len, max_batch_size=3, max_batch_tokens=5)
+    assert batches == [(["aa", "b"], 3), (["cccc", "d"], 5), (["eeeeeeeeee"], 10), (["f"], 1)]
+    assert token_batches([], len, 3, 5) == []
+
+
+def test_openai_embed_batches_and_retries(monkeypatch):
+    monkeypatch.setattr(time, "sleep", lambda _: None)
+    embeddings = FakeEmbeddings(failures=2)
+    embed = OpenAIEmbed(
+        lambda input, model: embeddings(input, model),
+        model="fake",
+        count_tokens=len,
+        max_batch_size=2,
+    )
+
+    inputs = ["a" * i for i in range(1, 6)]
+    assert embed(inputs) == [[1.0], [2.0], [3.0], [4.0], [5.0]]
+    assert embeddings.requests == [inputs[:2], inputs[2:4], inputs[4:]]
+
+
+def test_openai_embed_gives_up():
+    embed = OpenAIEmbed(FakeEmbeddings(failures=1), model="fake", max_retries=0)
+    with pytest.raises(RateLimitError):
+        embed(["a"])
+
+
+@pytest.mark.asyncio
+async def test_async_openai_embed_keeps_order():
+    embeddings = AsyncFakeEmbeddings(failures=1)
+    embed = AsyncOpenAIEmbed(
+        embeddings,
+        model="fake",
+        count_tokens=len,
+        max_batch_tokens=4,
+        max_concurrency=3,
+        requests_per_minute=6000,
+    )
+
+    inputs = ["a" * (i % 4 + 1) for i in range(12)]
+    assert await embed(inputs) == [[float(len(text))] for text in inputs]
+    assert sorted(len(r) for r in embeddings.requests) == sorted(
+        len(batch) for batch, _ in token_batches(inputs, len, 2048, 4)
+    )
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_waits_for_tokens():
+    limiter = RateLimiter(tokens_per_minute=600)  # 10 tokens per second
+
+    start = time.monotonic()
+    await limiter.acquire(600)
+    await limiter.acquire(3)
+    assert 0.2 < time.monotonic() - start < 1.0
@@ -0,0 +1,48 @@
+import os
+
+import numpy as np
+import pytest
+
+from few_shots.embed.parallel import ParallelEmbed
+
+
+class PidEmbed:
+    """Embeds an input as its length and the id of the worker process embedding it."""
+
+    model_id = "pid"
+
+    def __call__(self, inputs: list[str]):
+        return [[float(len(text)), float(os.getpid())] for text in inputs]
+
+
+class LengthEmbed:
+    def __call__(self, inputs: list[str]):
+        return [[float(len(text))] for text in inputs]
+
+
+@pytest.fixture(scope="module")
+def embed():
+    with ParallelEmbed(PidEmbed, processes=2, shard_size=3) as embed:
+        yield embed
+
+
+def test_parallel_embed(embed: ParallelEmbed):
+    inputs = ["a" * i for i in range(10)]
+    vectors = embed(inputs)
+
+    assert vectors.dtype == np.float32 and vectors.shape == (10, 2)
+    assert vectors[:, 0].tolist() == [float(i) for i in range(10)]
+    assert os.getpid() not in vectors[:, 1]
+    assert embed.model_id == "pid"
+
+
+def test_parallel_embed_shards(embed: ParallelEmbed):
+    assert [len(shard) for _, shard in embed._shards(["a"] * 4)] == [2, 2]
+    assert [start for start, _ in embed._shards(["a"] * 7)] == [0, 3, 6]
+    assert embed([]).shape == (0, 2)
+
+
+def test_parallel_embed_without_model_id():
+    with ParallelEmbed(LengthEmbed, processes=1) as embed:
+        assert embed(["ab"]).tolist() == [[2.0]]
+        assert embed.model_id is None
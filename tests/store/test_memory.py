@@ -0,0 +1,91 @@
+import numpy as np
+
+from few_shots.store.memory import cosine_distance, MemoryStore, top_k
+from few_shots.types import Shot
+
+
+def make_shots(n: int) -> list[Shot]:
+    return [Shot(f"input{i}", f"output{i}") for i in range(n)]
+
+
+def test_top_k():
+    distances = np.array([0.5, 0.1, np.inf, 0.3, 0.2])
+    assert top_k(distances, 3).tolist() == [1, 4, 3]
+    assert top_k(distances, 10).tolist() == [1, 4, 3, 0]
+
+
+def test_list_sorted_by_distance():
+    store = MemoryStore()
+    shots = make_shots(3)
+    store.add(shots, [[1.0, 0.0], [0.0, 1.0], [1.0, 1.0]], "test")
+
+    results = store.list([0.0, 1.0], "test", limit=2)
+    assert [r.shot for r in results] == [shots[1], shots[2]]
+    assert results[0].score == 0.0
+    assert results[0].score < results[1].score
+
+
+def test_l2_distance():
+    store = MemoryStore(distance="l2")
+    shots = make_shots(2)
+    store.add(shots, [[3.0, 4.0], [1.0, 1.0]], "test")
+
+    (d0, s0), (d1, s1) = store.list([0.0, 0.0], "test", limit=2)
+    assert [s0, s1] == [shots[1], shots[0]]
+    assert np.isclose(d0, np.sqrt(2))
+    assert np.isclose(d1, 5.0)
+
+
+def test_distance_function():
+    def manhattan(a, b) -> float:
+        return float(np.abs(np.subtract(a, b)).sum())
+
+    store = MemoryStore(distance=manhattan)
+    shots = make_shots(3)
+    store.add(shots, [[3.0, 4.0], [1.0, 1.0], [0.0, 2.0]], "test")
+    store.remove([shots[2].id], "test")
+
+    (d0, s0), (d1, s1) = store.list([0.0, 0.0], "test", limit=5)
+    assert [s0, s1] == [shots[1], shots[0]]
+    assert (d0, d1) == (2.0, 7.0)
+
+    # The former default function takes the vectorized path
+    assert MemoryStore(distance=cosine_distance).distance == "cosine"
+
+
+def test_zero_vector():
+    store = MemoryStore()
+    [shot] = make_shots(1)
+    store.add([shot], [[0.0, 0.0]], "test")
+    assert store.list([1.0, 0.0], "test", limit=1)[0].score == 1.0
+
+
+def test_upsert_replaces_row():
+    store = MemoryStore()
+    shot = Shot("input", "output")
+    store.add([shot], [[1.0, 0.0]], "test")
+    store.add([Shot("input", "updated")], [[0.0, 1.0]], "test")
+
+    [(distance, result)] = store.list([0.0, 1.0], "test", limit=5)
+    assert result.outputs == "updated"
+    assert distance == 0.0
+
+
+def test_tombstones_and_compaction():
+    store = MemoryStore(compaction_ratio=0.5)
+    shots = make_shots(4)
+    store.add(shots, np.eye(4).tolist(), "test")
+
+    store.remove([shots[0].id], "test")
+    table = store._storage["test"]
+    assert table.tombstones == 1
+    assert shots[0] not in [r.shot for r in store.list([1.0, 0, 0, 0], "test", limit=4)]
+    assert store.get([shots[0].id, shots[1].id], "test") == [shots[1]]
+
+    store.remove([shots[1].id, shots[2].id], "test")
+    assert table.tombstones == 0
+    assert table.size == 1
+    assert [r.shot for r in store.list([1.0, 0, 0, 0], "test", limit=4)] == [shots[3]]
+
+    store.add(shots[:2], np.eye(4)[:2].tolist(), "test")
+    assert len(store.list([1.0, 0, 0, 0], "test", limit=4)) == 3
@@ -0,0 +1,28 @@
+from few_shots.store.milvus import MilvusHelper, MilvusStore
+from few_shots.types import Shot, Vector
+
+
+def test_filter_quotes_values():
+    assert MilvusHelper.filter("it's \"a\"/b") == 'namespace == "it\'s \\"a\\"/b"'
+    assert MilvusHelper.filter("n", ["x", "y"]) == 'namespace == "n" and id in ["x","y"]'
+
+
+def test_namespace_is_partition_key():
+    schema = MilvusHelper.create_collection("test", 2)["schema"]
+    [namespace] = [field for field in schema.fields if field.name == "namespace"]
+    assert namespace.is_partition_key
+
+
+def test_namespaces_are_isolated(
+    milvus_store: MilvusStore,
+    str_shots: list[Shot],
+    mock_vectors: list[Vector],
+):
+    other = Shot("input3", "output3")
+    milvus_store.add(str_shots, mock_vectors, "it's")
+    milvus_store.add([other], mock_vectors[:1], "other")
+
+    assert [r.shot for r in milvus_store.list(mock_vectors[0], "it's", limit=5)] == str_shots
+    milvus_store.remove([s.id for s in str_shots], "other")
+    assert len(milvus_store.get([s.id for s in str_shots], "it's")) == 2
+    assert milvus_store.get([other.id], "it's") == []
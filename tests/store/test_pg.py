@@ -0,0 +1,154 @@
+import asyncio
+
+import pytest
+from psycopg import AsyncConnection, Connection
+
+from few_shots.store.pg import AsyncPGStore, PGStore, SQLHelper
+from few_shots.types import SearchParams, Shot
+
+
+def test_copy_upsert(pg_conn: Connection, str_shots: list[Shot], namespace: str):
+    store = PGStore(connection=pg_conn, tablename="few_shots_copy", copy_threshold=1)
+    store.setup(dimensions=2)
+    try:
+        store.add(str_shots, [[1.0, 2.0], [3.0, 4.0]], namespace)
+        updated = [Shot(str_shots[0].inputs, "updated"), str_shots[1], Shot("input3", "output3")]
+        store.add(updated, [[1.0, 2.0], [3.0, 4.0], [5.0, 6.0]], namespace)
+
+        results = store.get([s.id for s in updated], namespace)
+        assert sorted(results, key=lambda s: s.id) == sorted(updated, key=lambda s: s.id)
+        assert len(store.list([1.0, 2.0], namespace, limit=5)) == 3
+    finally:
+        store.teardown()
+
+
+async def test_async_copy_upsert(
+    async_pg_conn: AsyncConnection,
+    str_shots: list[Shot],
+    namespace: str,
+):
+    store = AsyncPGStore(connection=async_pg_conn, tablename="few_shots_copy", copy_threshold=1)
+    await store.setup(dimensions=2)
+    try:
+        shots = [*str_shots, Shot(str_shots[0].inputs, "updated")]
+        await store.add(shots, [[1.0, 2.0], [3.0, 4.0], [5.0, 6.0]], namespace)
+
+        results = await store.get([s.id for s in shots[1:]], namespace)
+        assert sorted(results, key=lambda s: s.id) == sorted(shots[1:], key=lambda s: s.id)
+    finally:
+        await store.teardown()
+
+
+async def test_async_pool_runs_queries_in_parallel(
+    async_pg_pool_store: AsyncPGStore,
+    str_shots: list[Shot],
+    mock_vectors: list[list[float]],
+    namespace: str,
+):
+    await async_pg_pool_store.add(str_shots, mock_vectors, namespace)
+
+    results = await asyncio.gather(
+        *(async_pg_pool_store.list(mock_vectors[0], namespace, limit=1) for _ in range(8))
+    )
+    assert all(r[0].shot == str_shots[0] for r in results)
+    assert async_pg_pool_store.pool_wait.count >= 9
+
+
+def test_query_uses_distance_operator():
+    assert "<=>" in SQLHelper("t", distance="cosine").query()
+    assert "<->" in SQLHelper("t", distance="l2").query()
+    assert "<#>" in SQLHelper("t", distance="ip").query_many()
+
+
+def test_partition_create_escapes_namespace():
+    sql = SQLHelper("t", partitioned=True).partition_create("it's")
+    assert "FOR VALUES IN ('it''s')" in sql
+
+
+def test_get_and_remove_are_namespaced(pg_conn: Connection, str_shots: list[Shot]):
+    store = PGStore(connection=pg_conn, tablename="few_shots_ns")
+    store.setup(dimensions=2)
+    try:
+        store.add(str_shots, [[1.0, 2.0], [3.0, 4.0]], "a")
+        ids = [s.id for s in str_shots]
+
+        assert store.get(ids, "b") == []
+        store.remove(ids, "b")
+        assert len(store.get(ids, "a")) == 2
+    finally:
+        store.teardown()
+
+
+def test_partitioned(pg_conn: Connection, str_shots: list[Shot]):
+    store = PGStore(connection=pg_conn, tablename="few_shots_part", partitioned=True)
+    store.setup(dimensions=2)
+    try:
+        store.add(str_shots, [[1.0, 2.0], [3.0, 4.0]], "a")
+        store.add(str_shots[:1], [[1.0, 2.0]], "b")
+        store.add(str_shots[:1], [[1.0, 2.0]], "b")
+
+        assert len(store.list([1.0, 2.0], "a", limit=5)) == 2
+        assert [r.shot for r in store.list([1.0, 2.0], "b", limit=5)] == str_shots[:1]
+
+        store.clear("a")
+        assert store.list([1.0, 2.0], "a", limit=5) == []
+        assert len(store.list([1.0, 2.0], "b", limit=5)) == 1
+    finally:
+        store.teardown()
+
+
+def test_ivfflat_lists():
+    assert SQLHelper.ivfflat_lists(10) == 1
+    assert SQLHelper.ivfflat_lists(500_000) == 500
+    assert SQLHelper.ivfflat_lists(4_000_000) == 2000
+
+
+@pytest.mark.parametrize("index", ["hnsw", "ivfflat"])
+def test_deferred_index(pg_conn: Connection, str_shots: list[Shot], namespace: str, index: str):
+    store = PGStore(connection=pg_conn, tablename="few_shots_deferred", copy_threshold=1)
+    store.setup(dimensions=2, defer_index=True)
+    try:
+        indexdef = "SELECT indexdef FROM pg_indexes WHERE tablename = 'few_shots_deferred'"
+        assert not any("vector" in row[0] for row in pg_conn.execute(indexdef))
+
+        store.add(str_shots, [[1.0, 2.0], [3.0, 4.0]], namespace)
+        store.build_index(index=index)
+        assert any(f"USING {index}" in row[0] for row in pg_conn.execute(indexdef))
+        assert len(store.list([1.0, 2.0], namespace, limit=5)) == 2
+    finally:
+        store.teardown()
+
+
+async def test_async_deferred_index(
+    async_pg_conn: AsyncConnection,
+    str_shots: list[Shot],
+    namespace: str,
+):
+    store = AsyncPGStore(connection=async_pg_conn, tablename="few_shots_deferred")
+    await store.setup(dimensions=2, defer_index=True)
+    try:
+        await store.add(str_shots, [[1.0, 2.0], [3.0, 4.0]], namespace)
+        await store.build_index(index="ivfflat")
+        assert len(await store.list([1.0, 2.0], namespace, limit=5)) == 2
+    finally:
+        await store.teardown()
+
+
+def test_search_settings():
+    assert SQLHelper.search_settings(None) == []
+    assert SQLHelper.search_settings(SearchParams(ef=100, nprobe=10, exact=True)) == [
+        ("hnsw.ef_search", "100"),
+        ("ivfflat.probes", "10"),
+        ("enable_indexscan", "off"),
+    ]
+    # IVFFlat only scans in relaxed order
+    assert SQLHelper.search_settings(SearchParams(iterative_scan="strict_order")) == [
+        ("hnsw.iterative_scan", "strict_order"),
+        ("ivfflat.iterative_scan", "relaxed_order"),
+    ]
+
+
+def test_search_settings_are_scoped_to_the_query(pg_store: PGStore, pg_conn: Connection):
+    pg_store.list([1.0, 2.0], "default", 5, SearchParams(ef=100, exact=True))
+    assert pg_conn.execute("SHOW enable_indexscan").fetchone()[0] == "on"
+    assert pg_conn.execute("SHOW hnsw.ef_search").fetchone()[0] == "40"
@@ -0,0 +1,64 @@
+import pytest
+from qdrant_client.local.async_qdrant_local import AsyncQdrantLocal
+from qdrant_client.local.qdrant_local import QdrantLocal
+from qdrant_client.models import ScalarQuantization
+
+from few_shots.store.qdrant import AsyncQdrantStore, Distance, QdrantHelper, QdrantStore
+from few_shots.types import SearchParams, Shot
+
+
+def test_add_uploads_large_batches(namespace: str):
+    store = QdrantStore(QdrantLocal(":memory:"), "test", upload_threshold=2, batch_size=3)
+    store.setup(size=2, distance=Distance.COSINE)
+
+    shots = [Shot(f"input{i}", f"output{i}") for i in range(10)]
+    store.add(shots, [[1.0, float(i)] for i in range(10)], namespace)
+
+    results = store.get([s.id for s in shots], namespace)
+    assert sorted(results, key=lambda s: s.id) == sorted(shots, key=lambda s: s.id)
+    assert [r.shot for r in store.list([1.0, 0.0], namespace, limit=1)] == shots[:1]
+
+
+def test_upload(namespace: str):
+    store = QdrantStore(QdrantLocal(":memory:"), "test", batch_size=4)
+    store.setup(size=2, distance=Distance.COSINE)
+
+    shots = [Shot(f"input{i}", f"output{i}") for i in range(10)]
+    store.upload(shots, [[1.0, float(i)] for i in range(10)], namespace, wait=True)
+    assert len(store.list([1.0, 0.0], namespace, limit=20)) == 10
+
+
+async def test_async_upload(namespace: str):
+    store = AsyncQdrantStore(AsyncQdrantLocal(":memory:"), "test", upload_threshold=2)
+    await store.setup(size=2, distance=Distance.COSINE)
+
+    shots = [Shot(f"input{i}", f"output{i}") for i in range(10)]
+    await store.add(shots, [[1.0, float(i)] for i in range(10)], namespace)
+    assert len(await store.list([1.0, 0.0], namespace, limit=20)) == 10
+
+    await store.upload(shots[:1], [[0.0, 1.0]], namespace, wait=True)
+    assert [r.shot for r in await store.list([0.0, 1.0], namespace, limit=1)] == shots[:1]
+
+
+@pytest.mark.parametrize("quantization", ["scalar", "binary", "product"])
+def test_quantization(quantization: str, str_shots: list[Shot], namespace: str):
+    store = QdrantStore(QdrantLocal(":memory:"), "test")
+    store.setup(size=2, distance=Distance.COSINE, quantization=quantization, on_disk=True)
+
+    store.add(str_shots, [[1.0, 2.0], [3.0, 4.0]], namespace)
+    results = store.list([1.0, 2.0], namespace, 2, SearchParams(oversampling=2.0, rescore=True))
+    assert [r.shot for r in results] == str_shots
+
+
+def test_quantization_config():
+    assert QdrantHelper.quantization_config(None) is None
+    config = QdrantHelper.quantization_config("scalar", always_ram=False)
+    assert isinstance(config, ScalarQuantization) and config.scalar.always_ram is False
+    with pytest.raises(ValueError):
+        QdrantHelper.quantization_config("float8")
+
+
+def test_search_params():
+    assert QdrantHelper.search_params(SearchParams(ef=32)).quantization is None
+    params = QdrantHelper.search_params(SearchParams(oversampling=2.0, rescore=True))
+    assert params.quantization.oversampling == 2.0 and params.quantization.rescore
@@ -2,14 +2,24 @@
 Since some stores are stateful, make sure to clear them at the beginning of each test.
 """
 
+import numpy as np
 import pytest
 from pytest_lazy_fixtures import lf
 
 from few_shots.store.base import Store, AsyncStore
-from few_shots.types import Shot, Vector
+from few_shots.types import SearchParams, Shot, Vector
 
 
-providers = ["chroma", "pg", "qdrant", "weaviate"]  # TODO: Add Milvus & TurboPuffer
+providers = [
+    "memory",
+    "chroma",
+    "milvus",
+    "pg",
+    "pg_pool",
+    "qdrant",
+    "turbopuffer",
+    "weaviate",
+]
 
 
 lazy_sync_stores = [lf(f"{p}_store") for p in providers]
@@ -109,3 +119,151 @@ async def test_async_structured_io(
 
     assert [s0, s1] == struct_shots
     assert [s0, s1] == await store.get([s0.id, s1.id], namespace)
+
+
+@pytest.mark.parametrize("store", lazy_sync_stores)
+def test_list_many(
+    store: Store,
+    str_shots: list[Shot],
+    mock_vectors: list[Vector],
+    namespace: str,
+):
+    store.clear(namespace)
+    store.add(str_shots, mock_vectors, namespace)
+
+    results = store.list_many(mock_vectors, namespace, limit=1)
+    assert [[s.shot for s in scored_shots] for scored_shots in results] == [
+        [str_shots[0]],
+        [str_shots[1]],
+    ]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("store", lazy_async_stores)
+async def test_async_list_many(
+    store: AsyncStore,
+    str_shots: list[Shot],
+    mock_vectors: list[Vector],
+    namespace: str,
+):
+    await store.clear(namespace)
+    await store.add(str_shots, mock_vectors, namespace)
+
+    results = await store.list_many(mock_vectors, namespace, limit=1)
+    assert [[s.shot for s in scored_shots] for scored_shots in results] == [
+        [str_shots[0]],
+        [str_shots[1]],
+    ]
+
+
+@pytest.mark.parametrize("store", lazy_sync_stores)
+def test_numpy_vectors(
+    store: Store,
+    str_shots: list[Shot],
+    mock_vectors: list[Vector],
+    namespace: str,
+):
+    store.clear(namespace)
+    vectors = np.array(mock_vectors, dtype=np.float32)
+    store.add(str_shots, vectors, namespace)
+
+    assert [s.shot for s in store.list(vectors[0], namespace, limit=2)] == str_shots
+    results = store.list_many(vectors, namespace, limit=1)
+    assert [[s.shot for s in scored_shots] for scored_shots in results] == [
+        [str_shots[0]],
+        [str_shots[1]],
+    ]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("store", lazy_async_stores)
+async def test_async_numpy_vectors(
+    store: AsyncStore,
+    str_shots: list[Shot],
+    mock_vectors: list[Vector],
+    namespace: str,
+):
+    await store.clear(namespace)
+    vectors = np.array(mock_vectors, dtype=np.float32)
+    await store.add(str_shots, vectors, namespace)
+
+    results = await store.list_many(vectors, namespace, limit=1)
+    assert [[s.shot for s in scored_shots] for scored_shots in results] == [
+        [str_shots[0]],
+        [str_shots[1]],
+    ]
+
+
+@pytest.mark.parametrize("store", lazy_sync_stores)
+def test_hashes(
+    store: Store,
+    str_shots: list[Shot],
+    mock_vectors: list[Vector],
+    namespace: str,
+):
+    store.clear(namespace)
+    ids = [shot.id for shot in str_shots]
+    store.add(str_shots[:1], mock_vectors[:1], namespace, ["hash1"])
+    store.add(str_shots[1:], mock_vectors[1:], namespace)
+    assert store.hashes(ids, namespace) == {ids[0]: "hash1"}
+
+    store.add(str_shots, mock_vectors, namespace, ["hash2", "hash3"])
+    assert store.hashes(ids, namespace) == {ids[0]: "hash2", ids[1]: "hash3"}
+    assert store.hashes(ids, "other") == {}
+
+    store.remove(ids[:1], namespace)
+    assert store.hashes(ids, namespace) == {ids[1]: "hash3"}
+
+    store.add(str_shots[1:], mock_vectors[1:], namespace)
+    assert store.hashes(ids, namespace) == {}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("store", lazy_async_stores)
+async def test_async_hashes(
+    store: AsyncStore,
+    str_shots: list[Shot],
+    mock_vectors: list[Vector],
+    namespace: str,
+):
+    await store.clear(namespace)
+    ids = [shot.id for shot in str_shots]
+    await store.add(str_shots, mock_vectors, namespace, ["hash1", "hash2"])
+    assert await store.hashes(ids, namespace) == {ids[0]: "hash1", ids[1]: "hash2"}
+
+
+@pytest.mark.parametrize("store", lazy_sync_stores)
+@pytest.mark.parametrize("search_params", [SearchParams(ef=64), SearchParams(exact=True)])
+def test_list_search_params(
+    store: Store,
+    str_shots: list[Shot],
+    mock_vectors: list[Vector],
+    namespace: str,
+    search_params: SearchParams,
+):
+    store.clear(namespace)
+    store.add(str_shots, mock_vectors, namespace)
+
+    results = store.list(mock_vectors[0], namespace, 2, search_params)
+    assert [s.shot for s in results] == str_shots
+
+    results = store.list_many(mock_vectors, namespace, 1, search_params)
+    assert [[s.shot for s in scored_shots] for scored_shots in results] == [
+        [str_shots[0]],
+        [str_shots[1]],
+    ]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("store", lazy_async_stores)
+async def test_async_list_search_params(
+    store: AsyncStore,
+    str_shots: list[Shot],
+    mock_vectors: list[Vector],
+    namespace: str,
+):
+    await store.clear(namespace)
+    await store.add(str_shots, mock_vectors, namespace)
+
+    results = await store.list(mock_vectors[0], namespace, 2, SearchParams(ef=64, exact=True))
+    assert [s.shot for s in results] == str_shots
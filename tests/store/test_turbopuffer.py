@@ -0,0 +1,83 @@
+import asyncio
+
+import httpx
+import pytest
+
+from few_shots.store.turbopuffer import AsyncTurboPufferStore, TurboPufferHelper, TurboPufferStore
+from few_shots.types import Shot, Vector
+
+
+def test_paths_are_quoted():
+    assert TurboPufferHelper.path("a/b c") == "/v1/vectors/a%2Fb%20c"
+    assert TurboPufferHelper.query_path("a") == "/v1/vectors/a/query"
+
+
+def test_client_config(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.delenv("TURBOPUFFER_API_KEY", raising=False)
+    monkeypatch.delenv("TURBOPUFFER_BASE_URL", raising=False)
+    with pytest.raises(ValueError, match="TURBOPUFFER_API_KEY"):
+        TurboPufferHelper.client_config()
+
+    config = TurboPufferHelper.client_config("key", "http://localhost")
+    assert config["base_url"] == "http://localhost"
+    assert config["headers"] == {"Authorization": "Bearer key"}
+
+    monkeypatch.setenv("TURBOPUFFER_API_KEY", "env-key")
+    config = TurboPufferHelper.client_config()
+    assert config["base_url"] == "https://api.turbopuffer.com"
+    assert config["headers"] == {"Authorization": "Bearer env-key"}
+
+
+def responding(status: int) -> httpx.MockTransport:
+    return httpx.MockTransport(lambda _: httpx.Response(status, json={"error": "error"}))
+
+
+def test_missing_namespaces_read_as_empty():
+    with httpx.Client(transport=responding(404), base_url="http://tpuf") as client:
+        store = TurboPufferStore(client=client)
+        assert store.get(["id"], "missing") == []
+        assert store.hashes(["id"], "missing") == {}
+        assert store.list([1.0, 2.0], "missing", 5) == []
+        store.clear("missing")
+
+
+@pytest.mark.parametrize("status", [401, 429, 500])
+def test_errors_are_raised(str_shots: list[Shot], mock_vectors: list[Vector], status: int):
+    with httpx.Client(transport=responding(status), base_url="http://tpuf") as client:
+        store = TurboPufferStore(client=client)
+        for call in (
+            lambda: store.add(str_shots, mock_vectors, "default"),
+            lambda: store.get([str_shots[0].id], "default"),
+            lambda: store.list(mock_vectors[0], "default", 5),
+            lambda: store.remove([str_shots[0].id], "default"),
+            lambda: store.clear("default"),
+        ):
+            with pytest.raises(httpx.HTTPStatusError):
+                call()
+
+
+async def test_async_errors_are_raised(str_shots: list[Shot], mock_vectors: list[Vector]):
+    async with httpx.AsyncClient(transport=responding(500), base_url="http://tpuf") as client:
+        store = AsyncTurboPufferStore(client=client)
+        with pytest.raises(httpx.HTTPStatusError):
+            await store.add(str_shots, mock_vectors, "default")
+        with pytest.raises(httpx.HTTPStatusError):
+            await store.list(mock_vectors[0], "default", 5)
+
+
+async def test_async_get_and_concurrent_queries(
+    async_turbopuffer_store: AsyncTurboPufferStore,
+    struct_shots: list[Shot],
+    mock_vectors: list[Vector],
+    namespace: str,
+):
+    assert await async_turbopuffer_store.get([struct_shots[0].id], namespace) == []
+    await async_turbopuffer_store.add(struct_shots, mock_vectors, namespace)
+
+    ids = [struct_shots[1].id, "missing", struct_shots[0].id]
+    assert await async_turbopuffer_store.get(ids, namespace) == struct_shots[::-1]
+
+    results = await asyncio.gather(
+        *(async_turbopuffer_store.list(mock_vectors[1], namespace, 1) for _ in range(20))
+    )
+    assert all(r[0].shot == struct_shots[1] for r in results)
@@ -0,0 +1,53 @@
+from weaviate import WeaviateAsyncClient, WeaviateClient
+
+from few_shots.store.weaviate import AsyncWeaviateStore, WeaviateHelper, WeaviateStore
+from few_shots.types import Shot, Vector
+
+
+def test_tenant_names():
+    assert WeaviateHelper.tenant("team_a-1") == "team_a-1"
+    assert WeaviateHelper.tenant("team a") == WeaviateHelper.tenant("team a")
+    assert WeaviateHelper.tenant("team a") != WeaviateHelper.tenant("team b")
+    assert len(WeaviateHelper.tenant("x" * 100)) <= 64
+
+
+def test_multi_tenancy(
+    weaviate_client: WeaviateClient,
+    str_shots: list[Shot],
+    mock_vectors: list[Vector],
+):
+    store = WeaviateStore(weaviate_client, "TenantTest", multi_tenancy=True, batch_size=1)
+    store.setup()
+    try:
+        store.add(str_shots, mock_vectors, "a")
+        store.add(str_shots, mock_vectors, "a")
+        store.add(str_shots[:1], mock_vectors[:1], "b c")
+
+        assert [r.shot for r in store.list(mock_vectors[0], "a", limit=5)] == str_shots
+        assert [r.shot for r in store.list(mock_vectors[0], "b c", limit=5)] == str_shots[:1]
+
+        store.deactivate(["a"])
+        store.clear("b c")
+        assert store.list(mock_vectors[0], "b c", limit=5) == []
+        assert len(store.get([s.id for s in str_shots], "a")) == 2
+    finally:
+        store.teardown()
+
+
+async def test_async_multi_tenancy(
+    async_weaviate_client: WeaviateAsyncClient,
+    str_shots: list[Shot],
+    mock_vectors: list[Vector],
+):
+    store = AsyncWeaviateStore(async_weaviate_client, "TenantTest", multi_tenancy=True)
+    await store.setup()
+    try:
+        await store.add(str_shots, mock_vectors, "a")
+        await store.add(str_shots[:1], mock_vectors[:1], "b")
+
+        assert len(await store.list(mock_vectors[0], "a", limit=5)) == 2
+        await store.clear("a")
+        assert await store.list(mock_vectors[0], "a", limit=5) == []
+        assert len(await store.list(mock_vectors[0], "b", limit=5)) == 1
+    finally:
+        await store.teardown()
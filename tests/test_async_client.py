@@ -1,9 +1,16 @@
+import time
+from contextlib import contextmanager
+from threading import Lock
+from typing import Iterator
+
 import pytest
 
 from few_shots.async_client import AsyncFewShots
+from few_shots.store.base import StoreCapabilities
 from few_shots.store.memory import MemoryStore
 from few_shots.types import Shot
 from few_shots.utils.asyncio import asyncify_class
+from few_shots.utils.cache import ResultCache
 
 
 @asyncify_class
@@ -13,6 +20,37 @@ class AsyncMemoryStore(MemoryStore):
     """
 
 
+class ExclusiveMemoryStore(MemoryStore):
+    """Fails when a call enters while another one is running in a worker thread."""
+
+    def __init__(self):
+        super().__init__()
+        self._lock = Lock()
+
+    def add(self, shots, vectors, namespace, hashes=None):
+        with self._exclusive():
+            time.sleep(0.005)
+            super().add(shots, vectors, namespace, hashes)
+
+    def hashes(self, ids, namespace):
+        with self._exclusive():
+            return super().hashes(ids, namespace)
+
+    @contextmanager
+    def _exclusive(self) -> Iterator[None]:
+        assert self._lock.acquire(blocking=False), "Concurrent store calls"
+        try:
+            yield
+        finally:
+            self._lock.release()
+
+
+# Only `add` and `hashes` are made async, as `asyncify_class` would wrap MemoryStore's own
+# methods over the overrides if it were a direct base
+@asyncify_class
+class AsyncExclusiveMemoryStore(ExclusiveMemoryStore): ...
+
+
 @pytest.fixture(scope="function")
 def client():
     async def embed(inputs: list[str]):
@@ -96,3 +134,98 @@ async def test_string_flow(client: AsyncFewShots):
     await client.clear()
     assert [] == await client.list(inputs)
     assert (await client.get(inputs)) is None
+
+
+@pytest.mark.asyncio
+async def test_list_many(client: AsyncFewShots):
+    await client.add([("input1", "output1"), ("input2", "output2")])
+
+    results = await client.list_many(["input1", "input2", "input3"], limit=2)
+    assert len(results) == 3
+    assert all(len(scored_shots) == 2 for scored_shots in results)
+    assert await client.list_many([]) == []
+
+
+@pytest.mark.asyncio
+async def test_add_stream(client: AsyncFewShots):
+    async def data():
+        for i in range(10):
+            yield (f"input{i}", f"output{i}")
+
+    progress = [p async for p in client.add_stream(data(), batch_size=4, max_in_flight=2)]
+    assert [added for _, added in progress] == [4, 8, 10]
+    assert [len(ids) for ids, _ in progress] == [4, 4, 2]
+    assert len(await client.get([f"input{i}" for i in range(10)])) == 10
+
+
+@pytest.mark.asyncio
+async def test_chunks_to_capabilities(client: AsyncFewShots):
+    client.store.capabilities = StoreCapabilities(max_batch_size=3, max_ids=2)
+    inputs = [f"input{i}" for i in range(7)]
+    data = [(i, i.replace("in", "out")) for i in inputs]
+
+    await client.add(data)
+    assert [shot.inputs for shot in await client.get(inputs)] == inputs
+
+    results = await client.list_many(inputs, limit=1)
+    assert len(results) == 7
+
+    await client.remove(data[:5])
+    assert [shot.inputs for shot in await client.get(inputs)] == inputs[5:]
+
+    client.store.capabilities = StoreCapabilities(batch_queries=False)
+    results = await client.list_many(inputs, limit=2)
+    assert [len(scored_shots) for scored_shots in results] == [2] * 7
+
+
+@pytest.mark.asyncio
+async def test_result_cache(client: AsyncFewShots):
+    client.cache = ResultCache()
+    await client.add([("input1", "output1"), ("input2", "output2")])
+
+    first = await client.list_many(["input1", "input2"], limit=2)
+    assert await client.list_many(["input2", "input1"], limit=2) == first[::-1]
+    assert client.cache.stats.hits == 2 and client.cache.stats.misses == 2
+
+    await client.remove("input1", "output1")
+    assert len(await client.list("input2", limit=2)) == 1
+
+
+@pytest.mark.asyncio
+async def test_skip_unchanged():
+    calls = []
+
+    async def embed(inputs: list[str]):
+        calls.append(inputs)
+        return [[1.0, float(len(i))] for i in inputs]
+
+    embed.model_id = "model"
+    client = AsyncFewShots(embed=embed, store=AsyncMemoryStore())
+    data = [("input1", "output1"), ("input2", "output2")]
+    ids = await client.add(data, skip_unchanged=True)
+
+    calls.clear()
+    assert await client.add(data, skip_unchanged=True) == ids
+    await client.add([("input1", "changed"), *data[1:]], skip_unchanged=True)
+    async for _ in client.add_stream(data, skip_unchanged=True):
+        pass
+    assert calls == [["input1"], ["input1"]]
+    assert (await client.get("input1")).outputs == "output1"
+
+
+@pytest.mark.asyncio
+async def test_add_stream_to_store_without_concurrent_writes():
+    async def embed(inputs: list[str]):
+        return [[1.0, float(len(i))] for i in inputs]
+
+    embed.model_id = "model"
+    client = AsyncFewShots(embed=embed, store=AsyncExclusiveMemoryStore())
+    data = [(f"input{i}", f"output{i}") for i in range(40)]
+    for skip_unchanged in (False, True, True):
+        progress = [
+            p
+            async for p in client.add_stream(
+                data, batch_size=4, max_in_flight=4, skip_unchanged=skip_unchanged
+            )
+        ]
+        assert progress[-1].added == 40
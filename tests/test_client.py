@@ -1,8 +1,15 @@
+import time
+from contextlib import contextmanager
+from threading import Lock
+from typing import Iterator
+
 import pytest
 
 from few_shots.client import FewShots
+from few_shots.store.base import StoreCapabilities
 from few_shots.store.memory import MemoryStore
 from few_shots.types import Shot
+from few_shots.utils.cache import ResultCache
 
 
 @pytest.fixture
@@ -86,3 +93,241 @@ def test_string_flow(client: FewShots):
     client.clear()
     assert [] == [r.shot for r in client.list(inputs)]
     assert client.get(inputs) is None
+
+
+def test_list_many(client: FewShots):
+    client.add([("input1", "output1"), ("input2", "output2")])
+
+    results = client.list_many(["input1", "input2", "input3"], limit=2)
+    assert len(results) == 3
+    assert all(len(scored_shots) == 2 for scored_shots in results)
+    assert client.list_many([]) == []
+
+
+def test_add_stream(client: FewShots):
+    consumed = []
+
+    def data():
+        for i in range(10):
+            consumed.append(i)
+            yield (f"input{i}", f"output{i}")
+
+    stream = client.add_stream(data(), batch_size=4)
+    ids, added = next(stream)
+    assert added == len(ids) == 4
+    assert len(consumed) < 10
+
+    progress = list(stream)
+    assert [added for _, added in progress] == [8, 10]
+    assert len(client.get([f"input{i}" for i in range(10)])) == 10
+
+
+class ExclusiveMemoryStore(MemoryStore):
+    """Fails when a call enters while another one is running."""
+
+    def __init__(self):
+        super().__init__()
+        self._lock = Lock()
+
+    def add(self, shots, vectors, namespace, hashes=None):
+        with self._exclusive():
+            time.sleep(0.005)
+            super().add(shots, vectors, namespace, hashes)
+
+    def hashes(self, ids, namespace):
+        with self._exclusive():
+            return super().hashes(ids, namespace)
+
+    @contextmanager
+    def _exclusive(self) -> Iterator[None]:
+        assert self._lock.acquire(blocking=False), "Concurrent store calls"
+        try:
+            yield
+        finally:
+            self._lock.release()
+
+
+def test_add_stream_to_store_without_concurrent_writes():
+    def embed(inputs: list[str]):
+        return [[1.0, float(len(i))] for i in inputs]
+
+    embed.model_id = "model"
+    client = FewShots(embed=embed, store=ExclusiveMemoryStore())
+    data = [(f"input{i}", f"output{i}") for i in range(40)]
+    for skip_unchanged in (False, True, True):
+        progress = list(
+            client.add_stream(data, batch_size=4, max_in_flight=4, skip_unchanged=skip_unchanged)
+        )
+        assert progress[-1].added == 40
+
+
+class LimitedMemoryStore(MemoryStore):
+    capabilities = StoreCapabilities(max_batch_size=3, max_ids=2)
+
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    def add(self, shots, vectors, namespace):
+        assert len(shots) == len(vectors) <= 3
+        self.calls.append(("add", len(shots)))
+        super().add(shots, vectors, namespace)
+
+    def get(self, ids, namespace):
+        assert len(ids) <= 2
+        self.calls.append(("get", len(ids)))
+        return super().get(ids, namespace)
+
+    def remove(self, ids, namespace):
+        assert len(ids) <= 2
+        self.calls.append(("remove", len(ids)))
+        super().remove(ids, namespace)
+
+    def list_many(self, vectors, namespace, limit, search_params=None):
+        assert len(vectors) <= 3
+        self.calls.append(("list_many", len(vectors)))
+        return super().list_many(vectors, namespace, limit, search_params)
+
+
+def test_chunks_to_capabilities(client: FewShots):
+    client.store = store = LimitedMemoryStore()
+    inputs = [f"input{i}" for i in range(7)]
+    data = [(i, i.replace("in", "out")) for i in inputs]
+
+    client.add(data)
+    assert sorted(store.calls) == [("add", 1), ("add", 3), ("add", 3)]
+
+    assert [shot.inputs for shot in client.get(inputs)] == inputs
+    assert len(client.list_many(inputs, limit=1)) == 7
+
+    client.remove(data[:5])
+    assert [shot.inputs for shot in client.get(inputs)] == inputs[5:]
+    assert sorted(call for call in store.calls if call[0] == "remove") == [
+        ("remove", 1),
+        ("remove", 2),
+        ("remove", 2),
+    ]
+
+
+def test_skip_unchanged_reembeds_for_another_model():
+    calls = []
+
+    class ModelEmbed:
+        def __init__(self, model_id: str):
+            self.model_id = model_id
+
+        def __call__(self, inputs: list[str]):
+            calls.append((self.model_id, inputs))
+            return [[1.0, float(len(i))] for i in inputs]
+
+    store = MemoryStore()
+    data = [("input1", "output1"), ("input2", "output2")]
+    FewShots(embed=ModelEmbed("small"), store=store).add(data, skip_unchanged=True)
+    FewShots(embed=ModelEmbed("small"), store=store).add(data, skip_unchanged=True)
+    FewShots(embed=ModelEmbed("large"), store=store).add(data, skip_unchanged=True)
+    FewShots(embed=ModelEmbed("large"), store=store).add(data, skip_unchanged=True)
+    assert calls == [("small", ["input1", "input2"]), ("large", ["input1", "input2"])]
+
+    # A write without hashes, e.g. by an embedder without a model id, drops the stored ones
+    calls.clear()
+    FewShots(embed=lambda inputs: [[1.0, 0.0] for _ in inputs], store=store).add(data[:1])
+    FewShots(embed=ModelEmbed("large"), store=store).add(data, skip_unchanged=True)
+    assert calls == [("large", ["input1"])]
+
+
+def test_writes_chunks_one_at_a_time(client: FewShots):
+    in_flight, most_in_flight = 0, 0
+
+    class SlowMemoryStore(MemoryStore):
+        capabilities = StoreCapabilities(max_batch_size=50)
+
+        def add(self, shots, vectors, namespace, hashes=None):
+            nonlocal in_flight, most_in_flight
+            in_flight += 1
+            most_in_flight = max(most_in_flight, in_flight)
+            time.sleep(0.001)
+            super().add(shots, vectors, namespace, hashes)
+            in_flight -= 1
+
+    client.store = SlowMemoryStore()
+    client.max_concurrency = 8
+    client.add([(f"input{i}", f"output{i}") for i in range(2000)])
+    assert most_in_flight == 1
+    assert len(client.get([f"input{i}" for i in range(2000)])) == 2000
+
+
+def test_list_many_without_batch_queries(client: FewShots):
+    client.store.capabilities = StoreCapabilities(batch_queries=False)
+    client.add([("input1", "output1"), ("input2", "output2")])
+
+    results = client.list_many(["input1", "input2", "input3"], limit=2)
+    assert [len(scored_shots) for scored_shots in results] == [2, 2, 2]
+
+
+def test_result_cache():
+    calls = []
+
+    def embed(inputs: list[str]):
+        calls.append(inputs)
+        return [[1.0, float(len(i))] for i in inputs]
+
+    client = FewShots(embed=embed, store=MemoryStore(), cache=ResultCache(maxsize=10))
+    client.add([("input1", "output1"), ("input2", "output2")])
+    calls.clear()
+
+    first = client.list("input1", limit=1)
+    assert client.list("input1", limit=1) == first
+    assert len(calls) == 1
+    assert client.cache.stats.hits == 1
+
+    client.list_many(["input1", "input2"], limit=1)
+    assert calls[-1] == ["input2"]
+
+    client.add("input3", "output3")
+    calls.clear()
+    client.list("input1", limit=1)
+    assert calls == [["input1"]]
+
+    client.clear()
+    assert client.list("input1", limit=1) == []
+
+
+def test_skip_unchanged():
+    calls = []
+
+    def embed(inputs: list[str]):
+        calls.append(inputs)
+        return [[1.0, float(len(i))] for i in inputs]
+
+    embed.model_id = "model"
+    client = FewShots(embed=embed, store=MemoryStore())
+    data = [("input1", "output1"), ("input2", "output2")]
+    ids = client.add(data, skip_unchanged=True)
+    assert calls == [["input1", "input2"]]
+
+    calls.clear()
+    new = ("input3", "output3")
+    assert client.add(data + [new], skip_unchanged=True) == ids + [Shot(*new).id]
+    assert client.add(data, skip_unchanged=True) == ids
+    assert list(client.add_stream(data, skip_unchanged=True))[-1].added == 2
+    assert calls == [["input3"]]
+
+    calls.clear()
+    client.add([("input1", "changed"), *data[1:]], skip_unchanged=True)
+    assert calls == [["input1"]]
+    assert client.get("input1").outputs == "changed"
+
+    calls.clear()
+    embed.model_id = "another-model"
+    client.add(data, skip_unchanged=True)
+    assert calls == [["input1", "input2"]]
+
+    client.store = LimitedMemoryStore()
+    with pytest.raises(ValueError):
+        client.add(data, skip_unchanged=True)
+
+    # Without a model id, unchanged shots can't be told apart from ones embedded by another model
+    client = FewShots(embed=lambda inputs: [[1.0, 0.0] for _ in inputs], store=MemoryStore())
+    client.add(data)
+    with pytest.raises(ValueError):
+        client.add(data, skip_unchanged=True)
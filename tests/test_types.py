@@ -1,7 +1,21 @@
+import pickle
+from dataclasses import asdict, replace
+
+import pytest
 from hypothesis import given
 from hypothesis.strategies import dictionaries, text
 
-from few_shots.types import Shot, dump_io_value, id_io_value, is_io_value
+from few_shots.types import (
+    _UNSET,
+    LazyShot,
+    Shot,
+    dump_io_value,
+    encode_io_value,
+    id_io_value,
+    is_io_value,
+    parse_io_value,
+)
+from few_shots.utils.codec import Codec, get_codec
 
 
 @given(value=text())
@@ -40,3 +54,69 @@ def test_shot_auto_id(inputs: dict[str, str]):
     shot = Shot(inputs, outputs)
     assert shot.key == dump_io_value(inputs)
     assert shot.id == id_io_value(inputs)
+
+
+def test_lazy_shot():
+    shot = Shot({"b": 2, "a": 1}, "outputs")
+    lazy = LazyShot(shot.key, dump_io_value(shot.outputs), shot.id)
+
+    assert lazy._inputs is _UNSET and lazy._outputs is _UNSET
+    assert lazy.key == shot.key
+    assert lazy == shot and shot == lazy
+    assert lazy.inputs == {"a": 1, "b": 2}
+    assert not hasattr(lazy, "__dict__")
+
+    with pytest.raises(AttributeError):
+        lazy.outputs = "other"
+    assert pickle.loads(pickle.dumps(lazy)) == shot
+
+
+@given(value=text())
+def test_str_payload_round_trips(value: str):
+    assert parse_io_value(encode_io_value(value)) == value
+
+
+@given(value=dictionaries(text(), text()))
+def test_dict_payload_round_trips(value: dict[str, str]):
+    assert encode_io_value(value) == dump_io_value(value)
+    assert parse_io_value(encode_io_value(value)) == value
+
+
+def test_shot_dumps_inputs_once(monkeypatch):
+    dumps = []
+    codec = get_codec()
+    monkeypatch.setattr(
+        "few_shots.types.get_codec",
+        lambda: Codec(lambda value: dumps.append(value) or codec.dumps(value), codec.loads),
+    )
+
+    shot = Shot({"a": 1}, "outputs")
+    assert shot.key == '{"a":1}'
+    assert shot.id == id_io_value({"a": 1})
+    assert len(dumps) == 2  # Once for the shot, once for `id_io_value` above
+
+
+def test_shot_dataclass_helpers():
+    shot = Shot({"a": 1}, "outputs")
+    assert shot.key == '{"a":1}'
+
+    assert asdict(shot) == {"inputs": {"a": 1}, "outputs": "outputs", "id": shot.id}
+    changed = replace(shot, outputs="changed")
+    assert changed == Shot({"a": 1}, "changed", shot.id)
+    assert changed.key == shot.key
+
+
+def test_lazy_shot_replace_and_equality():
+    lazy = LazyShot(encode_io_value({"a": 1}), encode_io_value("outputs"), "id")
+    shot = Shot({"a": 1}, "outputs", "id")
+    assert lazy == shot and shot == lazy
+    assert lazy != Shot({"a": 1}, "other", "id")
+
+    changed = replace(lazy, outputs="other")
+    assert type(changed) is Shot
+    assert changed == Shot({"a": 1}, "other", "id")
+    assert type(replace(lazy)) is Shot and replace(lazy) == shot
+
+    for value in (lazy, shot):
+        with pytest.raises(TypeError):
+            hash(value)
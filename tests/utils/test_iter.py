@@ -0,0 +1,30 @@
+import pytest
+
+from few_shots.utils.iter import abatched, batched
+
+
+def test_batched():
+    assert list(batched(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(batched([], 2)) == []
+
+
+def test_batched_is_lazy():
+    consumed = []
+
+    def numbers():
+        for i in range(10):
+            consumed.append(i)
+            yield i
+
+    assert next(batched(numbers(), 3)) == [0, 1, 2]
+    assert consumed == [0, 1, 2]
+
+
+@pytest.mark.asyncio
+async def test_abatched():
+    async def numbers():
+        for i in range(5):
+            yield i
+
+    assert [b async for b in abatched(numbers(), 2)] == [[0, 1], [2, 3], [4]]
+    assert [b async for b in abatched(range(5), 3)] == [[0, 1, 2], [3, 4]]
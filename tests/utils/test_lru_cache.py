@@ -0,0 +1,37 @@
+import time
+
+from few_shots.utils.cache import LRUCache, ResultCache
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert "b" not in cache and cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats.evictions == 1
+
+
+def test_lru_cache_ttl():
+    cache = LRUCache(ttl=0.01)
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+
+    time.sleep(0.02)
+    assert "a" not in cache
+    assert cache.get("a") is None
+    assert cache.stats.expirations == 1
+
+
+def test_result_cache_invalidates_namespace():
+    cache = ResultCache()
+    key = cache.key("ns", "input", 5, None)
+    cache.set(key, [])
+    other = cache.key("other", "input", 5, None)
+    cache.set(other, [])
+
+    cache.invalidate("ns")
+    assert cache.get(cache.key("ns", "input", 5, None)) is None
+    assert cache.get(cache.key("other", "input", 5, None)) == []